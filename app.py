@@ -1,5 +1,7 @@
 import streamlit as st
-from modules import data_loader, ui_components
+# Only lightweight modules at import time: pandas, the datasets and the models
+# are imported/loaded by the page that needs them, and warmed up in the background
+from modules import warmup, registry, metrics, hot_reload
 
 st.set_page_config(
     page_title="Ensiklopedia Pupuk & Pestisida | AgriSensa",
@@ -17,6 +19,11 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 def main():
+    # Hidden operator page: ?admin=<AGRISENSA_ADMIN_TOKEN> (off unless the env var is set)
+    if metrics.is_admin(st.query_params.get("admin")):
+        show_admin()
+        return
+    
     # Sidebar
     with st.sidebar:
         st.image("https://img.icons8.com/color/96/000000/book-shelf.png", width=80)
@@ -26,46 +33,152 @@ def main():
         
         st.info("Referensi Global Terpercaya untuk Praktik Pertanian Berkelanjutan.")
         st.caption("© 2026 AgriSensa - Encyclopedia")
+        
+        with st.expander("⏱️ Laporan Startup"):
+            show_startup_report()
+
+    # Routing (?profile=<AGRISENSA_ADMIN_TOKEN> records this rerun with cProfile, see the admin page)
+    with metrics.profile(menu, force=metrics.is_admin(st.query_params.get("profile"))):
+        if menu == "Beranda":
+            show_home()
+        elif "Dashboard" in menu:
+            show_smart_dashboard()
+        elif "Pupuk" in menu:
+            show_encyclopedia("fertilizers", "Ensiklopedi Pupuk")
+        elif "Pestisida" in menu:
+            show_encyclopedia("pesticides", "Ensiklopedi Pestisida")
+        elif "Rekomendasi" in menu:
+            show_recommendation()
+    
+    # First page is out: preload what the user is likely to open next
+    warmup.mark_first_paint()
+    warmup.start(menu)
+    # Edited data/ files are rebuilt in the background and swapped in without a restart
+    hot_reload.start()
+
+def show_startup_report():
+    report = warmup.report()
+    if report["first_paint"] is not None:
+        st.caption(f"Halaman pertama: {report['first_paint']:.2f} detik setelah proses dimulai")
+    st.caption(f"Pemanasan latar belakang: {'berjalan' if report['warmup_running'] else 'selesai/siap'}")
+    version = hot_reload.report()
+    if version.get("id"):
+        st.caption(f"Versi data: `{version['id']}` (#{version['number']}, aktif sejak {version['activated']})")
+    for name, (seconds, thread, _) in sorted(report["loads"].items(), key=lambda kv: kv[1][2]):
+        st.caption(f"`{name}`: {seconds:.2f} dtk ({thread})")
 
-    # Routing
-    if menu == "Beranda":
-        show_home()
-    elif "Dashboard" in menu:
-        show_smart_dashboard()
-    elif "Pupuk" in menu:
-        show_encyclopedia("fertilizers", "Ensiklopedi Pupuk")
-    elif "Pestisida" in menu:
-        show_encyclopedia("pesticides", "Ensiklopedi Pestisida")
-    elif "Rekomendasi" in menu:
-        show_recommendation()
+def show_admin():
+    import json
+    import pandas as pd
+    st.title("🛠️ Metrik Kinerja")
+    
+    enabled = st.checkbox("Rekam metrik", value=metrics.is_enabled())
+    if enabled != metrics.is_enabled():
+        metrics.enable(enabled)
+    if st.button("🗑️ Reset Metrik"):
+        metrics.reset()
+    
+    snap = metrics.snapshot()
+    st.subheader("Latensi Fungsi & Halaman")
+    if snap["functions"]:
+        st.dataframe(pd.DataFrame([
+            {
+                "Fungsi": name, "Panggilan": m["count"], "Error": m["errors"], "Rata-rata (ms)": m["mean_ms"],
+                "P50 ≤ (ms)": m["p50_ms_le"], "P99 ≤ (ms)": m["p99_ms_le"], "Baris Dipindai": m["rows_scanned"],
+            }
+            for name, m in snap["functions"].items()
+        ]).round(2), hide_index=True, use_container_width=True)
+    else:
+        st.info("Belum ada metrik yang terekam.")
+    
+    st.subheader("Cache")
+    if snap["caches"]:
+        st.dataframe(pd.DataFrame([
+            {"Cache": name, "Hit": c["hits"], "Miss": c["misses"], "Rasio Hit": c["hit_ratio"]}
+            for name, c in snap["caches"].items()
+        ]).round(3), hide_index=True, use_container_width=True)
+    
+    d1, d2 = st.columns(2)
+    d1.download_button("💾 Prometheus (teks)", metrics.prometheus_text().encode("utf-8"), file_name="metrics.prom", mime="text/plain")
+    d2.download_button("💾 JSON", json.dumps(snap, indent=2).encode("utf-8"), file_name="metrics.json", mime="application/json")
+    
+    st.subheader("Versi Data")
+    if st.button("🔄 Periksa Perubahan Data"):
+        rebuilt = hot_reload.check(settle=False)
+        st.caption(f"Dimuat ulang: {', '.join(rebuilt) if rebuilt else 'tidak ada'}")
+    st.json(hot_reload.report())
+    
+    st.subheader("Profil cProfile")
+    st.caption("Tambahkan ?profile=<token admin> pada URL halaman untuk memprofilkan satu kali muat, atau atur AGRISENSA_PROFILE_RATE untuk sampling.")
+    for prof in metrics.profiles():
+        with st.expander(f"{prof['at']} — {prof['name']} ({prof['seconds'] * 1000:.0f} ms)"):
+            st.code(prof["stats"])
 
+@metrics.timed("page.show_recommendation")
 def show_recommendation():
     st.title("🤖 Sistem Rekomendasi Cerdas")
     st.markdown("Gunakan AI untuk menentukan tanaman terbaik dan kebutuhan pupuk berdasarkan data tanah Anda.")
     
-    from modules.recommender import CropRecommender, FertilizerRecommender
+    import hashlib
+    import os
+    import tempfile
+    import pandas as pd
+    from modules import data_loader, region_index, result_cache
+    from modules.recommender import CROP_FEATURES
     
-    tab1, tab2 = st.tabs(["🌾 Rekomendasi Tanaman", "🧪 Kalkulator Pupuk"])
+    tab1, tab2, tab3 = st.tabs(["🌾 Rekomendasi Tanaman", "🧪 Kalkulator Pupuk", "📥 Analisis Massal"])
     
     # --- CROP RECOMMENDER ---
     with tab1:
         st.subheader("Cari Tanaman yang Cocok")
+        
+        # Inputs in CROP_FEATURES order, replaced by a region's soil/climate when one is picked.
+        # The same defaults are pre-computed by result_cache.warm()
+        defaults = result_cache.CROP_DEFAULTS
+        regions = registry.get_region_index()
+        if len(regions):
+            with st.expander("📍 Isi Otomatis dari Data Wilayah"):
+                r1, r2, r3 = st.columns(3)
+                reg_prov = r1.selectbox("Provinsi", ["-"] + regions.provinces(), key="rec_prov")
+                reg_dist = r2.selectbox("Kabupaten", ["-"] + regions.districts(reg_prov), key="rec_dist")
+                reg_comm = r3.selectbox("Komoditas", ["(rata-rata)"] + regions.commodities(reg_prov, reg_dist), key="rec_comm")
+                reg_comm = None if reg_comm == "(rata-rata)" else reg_comm
+                
+                row = regions.row(reg_prov, reg_dist, reg_comm)
+                if row is not None:
+                    crop = registry.get_crop_recommender()
+                    defaults = region_index.crop_inputs(row, crop.npk_levels)[0].tolist()
+                    st.caption("N/P/K diperkirakan dari indeks tanah wilayah; curah hujan adalah rata-rata bulanan.")
+                
+                if reg_prov != "-" and st.button(f"🌾 Rekomendasi untuk Semua Kabupaten di {reg_prov}"):
+                    # Every district of the province in one vectorized call
+                    crop = registry.get_crop_recommender()
+                    names, rows = regions.district_matrix(reg_prov, reg_comm)
+                    results = crop.get_batch_recommendation(region_index.crop_inputs(rows, crop.npk_levels))
+                    st.dataframe(pd.DataFrame({
+                        "Kabupaten": names,
+                        "Rekomendasi": [", ".join(r).upper() for r in results],
+                    }), hide_index=True, use_container_width=True)
+        
         st.warning("Masukkan data kondisi lingkungan lahan Anda:")
         
+        def clip(value, low, high, cast=float):
+            return cast(min(max(round(value, 2), low), high))
+        
         col1, col2 = st.columns(2)
         with col1:
-            n = st.number_input("Nitrogen (N) - ppm", 0, 140, 90)
-            p = st.number_input("Fosfor (P) - ppm", 0, 145, 42)
-            k = st.number_input("Kalium (K) - ppm", 0, 205, 43)
-            ph = st.number_input("pH Tanah", 0.0, 14.0, 6.5)
+            n = st.number_input("Nitrogen (N) - ppm", 0, 140, clip(defaults[0], 0, 140, int))
+            p = st.number_input("Fosfor (P) - ppm", 0, 145, clip(defaults[1], 0, 145, int))
+            k = st.number_input("Kalium (K) - ppm", 0, 205, clip(defaults[2], 0, 205, int))
+            ph = st.number_input("pH Tanah", 0.0, 14.0, clip(defaults[5], 0.0, 14.0))
         with col2:
-            temp = st.number_input("Suhu (°C)", 10.0, 45.0, 20.8)
-            humidity = st.number_input("Kelembaban Udara (%)", 10.0, 100.0, 82.0)
-            rainfall = st.number_input("Curah Hujan (mm)", 0.0, 300.0, 202.9)
+            temp = st.number_input("Suhu (°C)", 10.0, 45.0, clip(defaults[3], 10.0, 45.0))
+            humidity = st.number_input("Kelembaban Udara (%)", 10.0, 100.0, clip(defaults[4], 10.0, 100.0))
+            rainfall = st.number_input("Curah Hujan (mm)", 0.0, 300.0, clip(defaults[6], 0.0, 300.0))
             
         if st.button("🔍 Analisis Kecocokan Lahan"):
-            rec = CropRecommender()
-            results = rec.get_recommendation(n, p, k, temp, humidity, ph, rainfall)
+            # Repeated inputs come from the result cache; concurrent misses share one batched distance pass
+            results = registry.recommend_crop([n, p, k, temp, humidity, ph, rainfall])
             
             if results:
                 st.success(f"✅ Tanaman yang Paling Cocok: **{results[0].upper()}**")
@@ -77,7 +190,7 @@ def show_recommendation():
     # --- FERTILIZER CALC ---
     with tab2:
         st.subheader("Hitung Kekurangan Nutrisi")
-        rec_fert = FertilizerRecommender()
+        rec_fert = registry.get_fertilizer_recommender()
         crops = rec_fert.get_crop_list()
         
         selected_crop = st.selectbox("Pilih Tanaman yang akan ditanam:", crops)
@@ -89,6 +202,14 @@ def show_recommendation():
         curr_k = c3.number_input("K (Saat Ini)", 0, 200, 0, key="fk")
         curr_ph = c4.number_input("pH (Saat Ini)", 0.0, 14.0, 6.0, key="fph")
         
+        with st.expander("💲 Harga Pupuk (opsional)"):
+            st.caption("Isi harga per Kg untuk mencari kombinasi termurah. Produk dengan harga 0 tidak dipakai; jika semua 0, dicari total berat terkecil.")
+            prices = {}
+            for item in data_loader.load_data("fertilizers"):
+                price = st.number_input(f"{item['name']} (Rp/Kg)", 0, 1_000_000, 0, step=500, key=f"price_{item['id']}")
+                if price > 0:
+                    prices[item['id']] = price
+        
         if st.button("🧪 Hitung Dosis Pupuk"):
             analysis = rec_fert.calculate_needs(selected_crop, curr_n, curr_p, curr_k, curr_ph)
             
@@ -108,9 +229,81 @@ def show_recommendation():
                 st.subheader("💡 Rekomendasi Tindakan:")
                 for adv in analysis['advice']:
                     st.markdown(f"- {adv}")
+                
+                # Cheapest product mix from the catalogue covering the N/P/K deficit
+                from modules.dose_optimizer import ppm_to_kg_ha
+                optimizer = registry.get_dose_optimizer(prices)
+                need = ppm_to_kg_ha([analysis["deficit"][nutrient] for nutrient in ("N", "P", "K")])
+                mix = optimizer.solve_one(*need)
+                if mix:
+                    st.subheader("🧮 Dosis Produk (Kg/Ha):")
+                    st.dataframe(pd.DataFrame({"Produk": list(mix), "Dosis (Kg/Ha)": [round(v, 1) for v in mix.values()]}), hide_index=True)
+                elif mix is None:
+                    st.warning("Produk di katalog tidak dapat memenuhi seluruh kekurangan hara.")
             else:
                 st.error("Gagal menghitung. Cek data tanaman.")
 
+        with st.expander("🗺️ Analisis Grid Lahan (CSV)"):
+            from modules.recommender import GRID_COLUMNS, GRID_CROP_COLUMN
+            st.caption(f"Kolom wajib: {', '.join(GRID_COLUMNS)}. Kolom '{GRID_CROP_COLUMN}' opsional; jika tidak ada, dipakai tanaman terpilih di atas.")
+            grid_file = st.file_uploader("File CSV Titik Sampel", type=["csv"], key="grid_csv")
+
+            if grid_file is not None:
+                # Runs only on request, streamed to a temp file; the result is kept per
+                # session for this upload (by content hash) and crop, so other widgets don't redo it
+                grid_key = (hashlib.sha1(grid_file.getbuffer()).hexdigest(), selected_crop)
+                grid_result = st.session_state.get("grid_result")
+                
+                if st.button("🗺️ Analisis Grid") and (grid_result is None or grid_result["key"] != grid_key):
+                    fd, path = tempfile.mkstemp(prefix="agrisensa_grid_", suffix=".csv")
+                    os.close(fd)
+                    try:
+                        grid_file.seek(0)
+                        n_rows = rec_fert.calculate_needs_csv(grid_file, path, crop=selected_crop, optimizer=registry.get_dose_optimizer())
+                    except ValueError as e:
+                        os.remove(path)
+                        st.error(f"Format file tidak sesuai: {e}")
+                    else:
+                        if grid_result is not None and os.path.exists(grid_result["path"]):
+                            os.remove(grid_result["path"])
+                        grid_result = st.session_state["grid_result"] = {"key": grid_key, "path": path, "rows": n_rows}
+                
+                if grid_result is not None and grid_result["key"] == grid_key and os.path.exists(grid_result["path"]):
+                    st.caption(f"{grid_result['rows']} titik dianalisis.")
+                    with open(grid_result["path"], "rb") as f:
+                        st.download_button("💾 Unduh Hasil (CSV)", f, file_name="analisis_grid_pupuk.csv", mime="text/csv")
+
+    # --- BATCH CROP RECOMMENDER ---
+    with tab3:
+        st.subheader("Rekomendasi Tanaman untuk Banyak Sampel")
+        st.info(f"Unggah file CSV hasil uji tanah dengan kolom: {', '.join(CROP_FEATURES)}")
+        
+        uploaded = st.file_uploader("File CSV Sampel Tanah", type=["csv"])
+        
+        if uploaded is not None:
+            samples = pd.read_csv(uploaded)
+            st.caption(f"{len(samples)} sampel dimuat.")
+            
+            if st.button("🔍 Analisis Semua Sampel"):
+                rec = registry.get_crop_recommender()
+                try:
+                    results = rec.get_batch_recommendation(samples)
+                except ValueError as e:
+                    st.error(f"Format file tidak sesuai: {e}")
+                else:
+                    output = samples.copy()
+                    for rank in range(3):
+                        output[f"Rekomendasi_{rank + 1}"] = [r[rank] if len(r) > rank else "" for r in results]
+                    
+                    st.dataframe(output.head(100), use_container_width=True, hide_index=True)
+                    st.download_button(
+                        "💾 Unduh Hasil (CSV)",
+                        output.to_csv(index=False).encode("utf-8"),
+                        file_name="rekomendasi_tanaman.csv",
+                        mime="text/csv"
+                    )
+
+@metrics.timed("page.show_home")
 def show_home():
     st.title("📚 Pusat Pengetahuan AgriSensa")
     st.markdown("### Referensi Lengkap Pupuk & Pestisida")
@@ -125,7 +318,9 @@ def show_home():
         st.markdown("Database pengendalian hama dan penyakit dengan panduan keamanan.")
         st.markdown("- **Topik**: Insektisida, Fungisida, Herbisida.")
 
+@metrics.timed("page.show_encyclopedia")
 def show_encyclopedia(category, title):
+    from modules import data_loader, ui_components
     st.title(f"📖 {title}")
     
     # Search
@@ -144,13 +339,36 @@ def show_encyclopedia(category, title):
             df_pest = data_loader.load_pesticide_csv(p_type)
             
             if not df_pest.empty:
-                # Search within dataframe
-                if query:
-                    mask = df_pest.apply(lambda x: x.astype(str).str.contains(query, case=False).any(), axis=1)
-                    df_pest = df_pest[mask]
+                s1, s2 = st.columns([3, 1])
+                default_order = "(relevansi)" if query else "(urutan asli)"
+                sort_by = s1.selectbox("Urutkan berdasarkan:", [default_order] + list(df_pest.columns), key=f"pest_sort_{p_type}")
+                descending = s2.checkbox("Menurun", key=f"pest_desc_{p_type}")
                 
-                st.dataframe(df_pest, use_container_width=True, hide_index=True)
-                st.caption(f"Menampilkan {len(df_pest)} data dari database resmi.")
+                # Search (inverted index) and order (precomputed sort index) as row
+                # positions; only the visible page is sliced and sent to the browser
+                rows = data_loader.sorted_pesticide_rows(p_type, query, None if sort_by == default_order else sort_by, descending)
+                start, stop = ui_components.paginate(
+                    len(rows), ui_components.TABLE_ROWS_PER_PAGE, key=f"pest_page_{p_type}_{query}_{sort_by}_{descending}"
+                )
+                st.dataframe(df_pest.iloc[rows[start:stop]], use_container_width=True, hide_index=True)
+                st.caption(f"Menampilkan {len(rows)} data dari database resmi.")
+                
+                if p_type == "umum":
+                    with st.expander("🎯 Cari Berdasarkan Tanaman & Hama/Gulma"):
+                        uc1, uc2 = st.columns(2)
+                        crop_q = uc1.text_input("Tanaman", placeholder="mis. cabai")
+                        target_q = uc2.text_input("Hama / Penyakit / Gulma", placeholder="mis. spodoptera")
+                        
+                        if crop_q or target_q:
+                            usage = data_loader.get_usage_table(p_type).lookup(crop_q, target_q)
+                            u_start, u_stop = ui_components.paginate(
+                                len(usage), ui_components.TABLE_ROWS_PER_PAGE, key=f"usage_page_{crop_q}_{target_q}"
+                            )
+                            st.dataframe(
+                                usage.iloc[u_start:u_stop].drop(columns=["product_id"]),
+                                use_container_width=True, hide_index=True
+                            )
+                            st.caption(f"{usage['product'].nunique()} produk terdaftar ({len(usage)} aturan pakai).")
             else:
                 st.warning("Database sedang memuat atau kosong.")
     else:
@@ -158,28 +376,33 @@ def show_encyclopedia(category, title):
         render_card_list(category, query)
 
 def render_card_list(category, query):
+    from modules import data_loader, ui_components
     if query:
         items = data_loader.search_items(category, query)
     else:
         items = data_loader.load_data(category)
     
     st.markdown(f"**Menampilkan {len(items)} entri:**")
+    # Only the visible page of cards is built
+    start, stop = ui_components.paginate(len(items), ui_components.CARDS_PER_PAGE, key=f"cards_{category}_{query}")
     st.markdown("---")
     
-    for item in items:
+    for item in items[start:stop]:
         if category == "fertilizers":
             ui_components.render_fertilizer_card(item)
         else:
             ui_components.render_pesticide_card(item)
 
+@metrics.timed("page.show_smart_dashboard")
 def show_smart_dashboard():
     st.title("📊 Dashboard Pintar AgriSensa")
     st.markdown("Analisis data historis untuk keputusan pertanian yang lebih baik.")
     
-    from modules.smart_dashboard import SmartDashboard
-    from modules.recommender import FertilizerRecommender
+    import pandas as pd
+    from modules import region_index
     
-    dashboard = SmartDashboard()
+    dashboard = registry.get_smart_dashboard()
+    prov_map, commodities = dashboard.get_location_options()
     
     tab1, tab2, tab3 = st.tabs(["🗺️ Peta Produktivitas", "💰 Kalkulator Profitabilitas", "🧪 Rekomendasi Terlokalisasi"])
     
@@ -187,8 +410,6 @@ def show_smart_dashboard():
     with tab1:
         st.subheader("Analisis Produktivitas Wilayah")
         
-        prov_map, commodities = dashboard.get_location_options()
-        
         if not commodities:
             st.error("Data tidak tersedia.")
         else:
@@ -210,8 +431,6 @@ def show_smart_dashboard():
     with tab2:
         st.subheader("Simulasi Bisnis Tani")
         
-        prov_map, commodities = dashboard.get_location_options()
-        
         col1, col2 = st.columns(2)
         with col1:
             prov = st.selectbox("Provinsi:", list(prov_map.keys()))
@@ -232,23 +451,52 @@ def show_smart_dashboard():
                     profit_color = "normal" if roi_data['profit'] > 0 else "off"
                     st.metric("Keuntungan Bersih", f"Rp {roi_data['profit']:,.0f}", delta=f"{roi_data['roi']:.1f}% ROI", delta_color=profit_color)
                     st.caption(f"*Yield*: {roi_data['yield_ha']:.0f} Kg/Ha | *Harga*: Rp {roi_data['price_per_kg']:,}/Kg")
+                    st.caption(f"*Rentang Yield Historis (P10-P90)*: {roi_data['yield_p10']:.0f} - {roi_data['yield_p90']:.0f} Kg/Ha")
             else:
                 st.warning("Data historis tidak ditemukan untuk kombinasi lokasi dan komoditas ini.")
 
+        with st.expander("🎲 Simulasi Risiko (Monte Carlo)"):
+            st.caption("100.000 skenario acak hasil panen, harga jual, dan harga input berdasarkan variasi historis tiap daerah.")
+            sim_dists = st.multiselect("Bandingkan Kabupaten:", prov_map.get(prov, []), default=[dist] if dist else [])
+            sim_areas = st.multiselect("Luas Lahan (Ha):", sorted({0.5, 1.0, 2.0, 5.0, 10.0, float(area)}), default=[float(area)])
+            volatility = st.slider("Volatilitas Harga Jual (%)", 0, 50, 20)
+
+            if st.button("🎲 Jalankan Simulasi") and sim_dists and sim_areas:
+                sim = dashboard.simulate_roi([(prov, d) for d in sim_dists], comm, sim_areas, price_volatility=volatility / 100)
+
+                if not sim.empty:
+                    first = sim.iloc[0]
+                    m1, m2, m3 = st.columns(3)
+                    m1.metric("Peluang Rugi", f"{first['Prob_Loss']:.1%}")
+                    m2.metric("ROI Median", f"{first['ROI_P50']:.1f}%")
+                    m3.metric("Rentang ROI (P5-P95)", f"{first['ROI_P5']:.0f}% - {first['ROI_P95']:.0f}%")
+                    st.dataframe(sim.drop(columns=['Province', 'Commodity']), hide_index=True, use_container_width=True)
+                else:
+                    st.warning("Data historis tidak ditemukan untuk kombinasi lokasi dan komoditas ini.")
+
     # --- SMART REC ---
     with tab3:
         st.subheader("Rekomendasi Pupuk Berbasis Data")
         st.info("Sistem akan mencari lokasi dengan karakteristik tanah mirip yang memiliki hasil panen tinggi.")
         
+        # Pre-filled with the soil of the location chosen in the profitability tab
+        regions = registry.get_region_index()
+        soil = [100, 100, 100, 6.5]
+        row = regions.row(prov, dist, comm) if prov and dist else None
+        if row is None and prov and dist:
+            row = regions.row(prov, dist)
+        if row is not None:
+            soil = region_index.soil_inputs(row)[0].tolist()
+            st.caption(f"📍 Terisi otomatis dari data tanah {dist}, {prov}.")
+        
         c1, c2, c3, c4 = st.columns(4)
-        n = c1.number_input("N (Index)", 0, 200, 100)
-        p = c2.number_input("P (Index)", 0, 200, 100)
-        k = c3.number_input("K (Index)", 0, 200, 100)
-        ph = c4.number_input("pH Tanah", 0.0, 14.0, 6.5)
+        n = c1.number_input("N (Index)", 0, 200, int(round(soil[0])))
+        p = c2.number_input("P (Index)", 0, 200, int(round(soil[1])))
+        k = c3.number_input("K (Index)", 0, 200, int(round(soil[2])))
+        ph = c4.number_input("pH Tanah", 0.0, 14.0, min(max(round(soil[3], 2), 0.0), 14.0))
         
         if st.button("🔍 Cari Rekomendasi Historis"):
-            rec_fert = FertilizerRecommender()
-            res = rec_fert.get_data_driven_recommendation(n, p, k, ph)
+            res = registry.recommend_doses([n, p, k, ph])
             
             if res:
                 st.success(f"Ditemukan {res['match_count']} data lahan sukses yang mirip!")
@@ -260,6 +508,19 @@ def show_smart_dashboard():
                 col_d3.metric("KCl", f"{res['KCl']:.1f} Kg/Ha")
             else:
                 st.warning("Data referensi tidak cukup.")
+        
+        if prov in regions.provinces():
+            with st.expander(f"🗺️ Dosis untuk Semua Kabupaten di {prov}"):
+                if st.button("🔍 Hitung Semua Kabupaten"):
+                    # Every district of the province in one batch call
+                    names, rows = regions.district_matrix(prov, comm)
+                    doses = registry.get_fertilizer_recommender().get_data_driven_recommendation_batch(region_index.soil_inputs(rows))
+                    if doses and doses[0] is not None:
+                        table = pd.DataFrame(doses).drop(columns=['match_count'])
+                        table.insert(0, "Kabupaten", names)
+                        st.dataframe(table.round(1), hide_index=True, use_container_width=True)
+                    else:
+                        st.warning("Data referensi tidak cukup.")
 
 if __name__ == "__main__":
     main()
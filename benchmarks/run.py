@@ -0,0 +1,285 @@
+# Benchmark harness for the data loaders, recommenders, search and dashboard.
+#
+#   python -m benchmarks.run                                  # shipped data + 10x/100x/1000x
+#   python -m benchmarks.run --scales 1,10 --save baseline.json
+#   python -m benchmarks.run --scales 1,10 --compare baseline.json   # exit 1 on regression
+#
+# Every dataset runs in its own process. Per benchmark it reports the cold call
+# (empty registry and data/.cache, so loads and index builds are included), warm
+# p50/p99 latency and throughput, and tracemalloc peak memory of both.
+# Synthetic datasets are generated once under --data-root; 1000x needs ~7 GB of disk.
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DATA_ROOT = os.path.join(ROOT, "benchmarks", ".data")
+DEFAULT_SCALES = "1,10,100,1000"
+WARM_ITERATIONS = 200
+WARM_SECONDS = 5.0 # Warm loop stops early after this long (at least MIN_WARM_ITERATIONS)
+MIN_WARM_ITERATIONS = 20
+MEMORY_ITERATIONS = 20 # Warm calls traced for peak memory
+
+# Regression thresholds for --compare: relative slack, plus absolute floors so
+# microsecond-level noise on cache hits does not fail a run
+TOLERANCE = 0.25
+MIN_DELTA_MS = 0.2
+MIN_DELTA_MB = 1.0
+COMPARED_METRICS = {
+    "cold_ms": MIN_DELTA_MS,
+    "warm_p50_ms": MIN_DELTA_MS,
+    "warm_p99_ms": MIN_DELTA_MS,
+    "cold_peak_mb": MIN_DELTA_MB,
+    "warm_peak_mb": MIN_DELTA_MB,
+}
+
+SEARCH_QUERIES = ["ulat", "insektisida", "deltamethrin", "wereng kutu", "npk"]
+KEMENTAN_QUERIES = ["padi", "gulma berdaun", "wereng", "kelapa sawit", "ulat grayak"]
+
+
+def use_data_dir(data_dir, cache_dir):
+    """Point every module at `data_dir`, with derived artifacts in `cache_dir`."""
+    from modules import data_cache, data_loader, recommender, result_cache, smart_dashboard
+    # Warm figures measure the computation, not result cache hits on the repeated queries
+    result_cache.enable(False)
+    data_cache.CACHE_DIR = cache_dir
+    data_loader.DATA_DIR = data_dir
+    recommender.DATA_DIR = data_dir
+    recommender.CROP_DATA_PATH = os.path.join(data_dir, "crop_recommendation.csv")
+    recommender.FERT_DATA_PATH = os.path.join(data_dir, "fertilizer_recommendation.csv")
+    recommender.REAL_FERT_DATA_PATH = os.path.join(data_dir, "dataset_untuk_rekomendasi_pupuk.csv")
+    smart_dashboard.DATA_DIR = data_dir
+    smart_dashboard.PRED_DATA_PATH = os.path.join(data_dir, "dataset_untuk_prediksi.csv")
+    smart_dashboard.REC_DATA_PATH = os.path.join(data_dir, "dataset_untuk_rekomendasi_pupuk.csv")
+
+
+def _queries(rng, n=256):
+    """Deterministic arguments for the benchmarks, drawn from the shipped data."""
+    crop = pd.read_csv(os.path.join(synthetic.SOURCE_DIR, synthetic.CROP_FILE))
+    features = crop.iloc[:, :7].to_numpy(dtype=np.float64)
+    crop_args = features.min(0) + rng.random((n, 7)) * np.ptp(features, 0)
+
+    history = pd.read_csv(os.path.join(synthetic.SOURCE_DIR, synthetic.HISTORY_FILE), nrows=10_000)
+    rows = history[['Soil_N_index', 'Soil_P_index', 'Soil_K_index', 'Soil_pH']].dropna().to_numpy(dtype=np.float64)
+    soil_args = rows[rng.integers(0, len(rows), n)]
+    soil_args[::2, :3] += rng.uniform(-0.5, 0.5, (len(soil_args[::2]), 3)) # Half off the integer grid
+
+    lookup = pd.read_csv(os.path.join(synthetic.SOURCE_DIR, synthetic.LOOKUP_FILE))
+    picks = lookup.iloc[rng.integers(0, len(lookup), n)]
+    roi_args = [
+        (p, d, c, float(a))
+        for p, d, c, a in zip(picks['Province'], picks['District'], picks['Commodity'], rng.uniform(0.5, 10, n))
+    ]
+    return {
+        "crop": [tuple(r) for r in crop_args.tolist()],
+        "soil": [tuple(r) for r in soil_args.tolist()],
+        "roi": roi_args,
+    }
+
+
+def benchmarks(queries):
+    """name -> (call(args), argument list, required data file)."""
+    from modules import data_loader, registry
+    return {
+        "load_pesticide_csv": (lambda a: data_loader.load_pesticide_csv(a), ["umum", "teknis", "ekspor"], "pestisida_umum.csv"),
+        "search_items": (lambda q: data_loader.search_items("pesticides", q), SEARCH_QUERIES, "pesticides.json"),
+        "kementan_search": (lambda q: data_loader.search_pesticide_csv("umum", q), KEMENTAN_QUERIES, "pestisida_umum.csv"),
+        "crop_recommendation": (
+            lambda a: registry.get_crop_recommender().get_recommendation(*a), queries["crop"], "crop_recommendation.csv"),
+        "data_driven_recommendation": (
+            lambda a: registry.get_fertilizer_recommender().get_data_driven_recommendation(*a),
+            queries["soil"], "dataset_untuk_rekomendasi_pupuk.csv"),
+        "location_options": (
+            lambda a: registry.get_smart_dashboard().get_location_options(), [None], "dataset_untuk_prediksi.csv"),
+        "calculate_roi": (
+            lambda a: registry.get_smart_dashboard().calculate_roi(*a), queries["roi"], "dataset_untuk_prediksi.csv"),
+    }
+
+
+def _reset(cache_dir):
+    """Cold state: nothing in the registry, no derived artifacts on disk."""
+    from modules import registry
+    registry.invalidate()
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def _traced_peak_mb(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def measure(call, args, cache_dir, memory=True):
+    """Cold and warm figures for one benchmark."""
+    _reset(cache_dir)
+    started = time.perf_counter()
+    call(args[0])
+    cold = time.perf_counter() - started
+    result = {"cold_ms": cold * 1000}
+
+    if memory:
+        _reset(cache_dir)
+        result["cold_peak_mb"] = _traced_peak_mb(lambda: call(args[0]))
+
+    times = []
+    warm_started = time.perf_counter()
+    while len(times) < WARM_ITERATIONS:
+        a = args[len(times) % len(args)]
+        started = time.perf_counter()
+        call(a)
+        times.append(time.perf_counter() - started)
+        if len(times) >= MIN_WARM_ITERATIONS and time.perf_counter() - warm_started > WARM_SECONDS:
+            break
+    times = np.array(times)
+    result.update({
+        "warm_p50_ms": float(np.percentile(times, 50)) * 1000,
+        "warm_p99_ms": float(np.percentile(times, 99)) * 1000,
+        "throughput_per_s": len(times) / float(times.sum()),
+        "iterations": len(times),
+    })
+
+    if memory:
+        result["warm_peak_mb"] = _traced_peak_mb(
+            lambda: [call(args[i % len(args)]) for i in range(MEMORY_ITERATIONS)])
+    return result
+
+
+def run_dataset(data_dir, cache_dir, only=None, memory=True):
+    """Every benchmark against one data directory, in this process."""
+    use_data_dir(data_dir, cache_dir)
+    results = {}
+    for name, (call, args, required) in benchmarks(_queries(np.random.default_rng(synthetic.SEED))).items():
+        if only and name not in only:
+            continue
+        if not os.path.exists(os.path.join(data_dir, required)):
+            results[name] = {"skipped": f"{required} not found"}
+            continue
+        try:
+            results[name] = measure(call, args, cache_dir, memory)
+        except Exception as e:
+            print(f"Error benchmarking {name}: {e}")
+            results[name] = {"error": str(e)}
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    return results
+
+
+def _metadata():
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(current, baseline, tolerance=TOLERANCE):
+    """Regressions of `current` against `baseline` as readable lines (empty = none)."""
+    regressions = []
+    for label, benches in current.items():
+        for name, figures in benches.items():
+            before = baseline.get(label, {}).get(name)
+            if not before:
+                continue
+            for metric, floor in COMPARED_METRICS.items():
+                if metric not in figures or metric not in before:
+                    continue
+                old, new = before[metric], figures[metric]
+                if new > old * (1 + tolerance) and new - old > floor:
+                    regressions.append(f"{label} {name} {metric}: {old:.3f} -> {new:.3f} (+{(new / old - 1) * 100 if old else float('inf'):.0f}%)")
+    return regressions
+
+
+def print_table(results):
+    header = f"{'dataset':<8} {'benchmark':<28} {'cold ms':>10} {'p50 ms':>9} {'p99 ms':>9} {'ops/s':>10} {'cold MB':>9} {'warm MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for label, benches in results.items():
+        for name, f in benches.items():
+            if "cold_ms" not in f:
+                print(f"{label:<8} {name:<28} {f.get('skipped') or f.get('error')}")
+                continue
+            memory = " ".join(f"{f[m]:>9.1f}" if m in f else f"{'-':>9}" for m in ("cold_peak_mb", "warm_peak_mb"))
+            print(
+                f"{label:<8} {name:<28} {f['cold_ms']:>10.1f} {f['warm_p50_ms']:>9.3f} {f['warm_p99_ms']:>9.3f} "
+                f"{f['throughput_per_s']:>10.0f} {memory}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AgriSensa performance benchmarks")
+    parser.add_argument("--scales", default=DEFAULT_SCALES, help="Comma-separated dataset scales (1 = shipped data/)")
+    parser.add_argument("--only", default="", help="Comma-separated benchmark names")
+    parser.add_argument("--data-root", default=DEFAULT_DATA_ROOT, help="Where synthetic datasets are generated")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc passes")
+    parser.add_argument("--save", help="Write results (a baseline) to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON to compare against; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    # Internal: run one dataset in this process and write its results to a file
+    parser.add_argument("--worker", nargs=3, metavar=("DATA_DIR", "CACHE_DIR", "OUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    only = [n for n in args.only.split(",") if n]
+
+    if args.worker:
+        data_dir, cache_dir, out = args.worker
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(run_dataset(data_dir, cache_dir, only, not args.no_memory), f)
+        return 0
+
+    results = {}
+    for scale in [int(s) for s in args.scales.split(",") if s]:
+        label = f"x{scale}"
+        data_dir = synthetic.SOURCE_DIR if scale == 1 else synthetic.ensure(args.data_root, scale)
+        cache_dir = os.path.join(args.data_root, f"cache-{label}")
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, "results.json")
+            command = [sys.executable, "-m", "benchmarks.run", "--worker", data_dir, cache_dir, out]
+            if only:
+                command += ["--only", ",".join(only)]
+            if args.no_memory:
+                command.append("--no-memory")
+            print(f"Running {label} ({data_dir}) ...")
+            if subprocess.run(command, cwd=ROOT).returncode != 0:
+                results[label] = {"run": {"error": "benchmark process failed"}}
+                continue
+            with open(out, "r", encoding="utf-8") as f:
+                results[label] = json.load(f)
+
+    print()
+    print_table(results)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"meta": _metadata(), "results": results}, f, indent=2)
+        print(f"\nSaved {args.save}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.compare}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
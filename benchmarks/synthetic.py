@@ -0,0 +1,158 @@
+# Synthetic copies of the data/ directory, scaled up by replicating the shipped
+# rows with small deterministic jitter. Each scale is written once to
+# <root>/x<scale>/ and reused while its .complete marker matches.
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+SEED = 20240101
+# Bump when the generated content changes, so stale datasets are rebuilt
+GENERATOR_VERSION = 1
+
+CROP_FILE = "crop_recommendation.csv"
+HISTORY_FILE = "dataset_untuk_rekomendasi_pupuk.csv"
+PREDICTION_FILE = "dataset_untuk_prediksi.csv"
+LOOKUP_FILE = "lookup_tabel.csv"
+PESTICIDE_CSVS = ["pestisida_umum.csv", "pestisida_teknis.csv", "pestisida_ekspor.csv"]
+CATALOGUES = ["fertilizers.json", "pesticides.json"]
+# Copied as they are: per-crop targets and per-location inputs do not grow with history
+UNSCALED_FILES = ["fertilizer_recommendation.csv", LOOKUP_FILE]
+
+# Years of history synthesized per lookup location when data/ has no prediction set
+PREDICTION_YEARS = list(range(2015, 2025))
+
+
+def dataset_dir(root, scale):
+    return os.path.join(root, f"x{scale}")
+
+
+def ensure(root, scale, log=print):
+    """
+    Directory holding the data/ files at `scale` times their shipped size,
+    generated on first use.
+    """
+    path = dataset_dir(root, scale)
+    marker = os.path.join(path, ".complete")
+    expected = {"scale": scale, "seed": SEED, "version": GENERATOR_VERSION}
+    try:
+        with open(marker, "r", encoding="utf-8") as f:
+            if json.load(f) == expected:
+                return path
+    except (OSError, ValueError):
+        pass
+
+    log(f"Generating {scale}x dataset in {path} ...")
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    rng = np.random.default_rng(SEED + scale)
+
+    for name in UNSCALED_FILES:
+        if os.path.exists(os.path.join(SOURCE_DIR, name)):
+            shutil.copy(os.path.join(SOURCE_DIR, name), os.path.join(path, name))
+    _replicate_csv(CROP_FILE, path, scale, _jitter_crop, rng)
+    _replicate_csv(HISTORY_FILE, path, scale, _jitter_history, rng)
+    _replicate_csv(PREDICTION_FILE, path, scale, _jitter_prediction, rng, base=_prediction_base(rng))
+    for name in PESTICIDE_CSVS:
+        _replicate_csv(name, path, scale, _rename_pesticides, rng)
+    for name in CATALOGUES:
+        _replicate_catalogue(name, path, scale)
+
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump(expected, f)
+    return path
+
+
+def _replicate_csv(name, path, scale, jitter, rng, base=None):
+    """Write `scale` jittered copies of a shipped CSV (or of `base`); copy 0 is unchanged."""
+    if base is None:
+        source = os.path.join(SOURCE_DIR, name)
+        if not os.path.exists(source):
+            return
+        base = pd.read_csv(source)
+    with open(os.path.join(path, name), "w", encoding="utf-8", newline="") as f:
+        for copy in range(scale):
+            rows = base if copy == 0 else jitter(base.copy(), copy, rng)
+            rows.to_csv(f, header=copy == 0, index=False)
+
+
+def _noise(rng, n, spread):
+    return rng.lognormal(0.0, spread, n)
+
+
+def _jitter_crop(df, copy, rng):
+    for col in ['Suhu', 'Kelembaban', 'pH', 'Curah Hujan']:
+        df[col] = (df[col] * _noise(rng, len(df), 0.03)).round(6)
+    for col in ['Nitrogen (N)', 'Fosforus (P)', 'Kalium (K)']:
+        df[col] = (df[col] * _noise(rng, len(df), 0.05)).round().astype(int)
+    return df
+
+
+def _jitter_history(df, copy, rng):
+    # Soil indices stay the small integers they are; pH and amounts vary
+    df['Soil_pH'] = (df['Soil_pH'] + rng.normal(0.0, 0.1, len(df))).clip(3.5, 9.0).round(2)
+    for col in ['Area_Ha', 'Target_Yield_KgHa', 'Pupuk_Urea_kgHa', 'Pupuk_SP36_kgHa', 'Pupuk_KCl_kgHa']:
+        if col in df.columns:
+            df[col] = (df[col] * _noise(rng, len(df), 0.05)).round(2)
+    return df
+
+
+def _prediction_base(rng):
+    """
+    The shipped prediction history, or (data/ does not always include it) one
+    synthesized from the lookup table: every location over PREDICTION_YEARS.
+    """
+    shipped = os.path.join(SOURCE_DIR, PREDICTION_FILE)
+    if os.path.exists(shipped):
+        return pd.read_csv(shipped)
+    lookup = os.path.join(SOURCE_DIR, LOOKUP_FILE)
+    if not os.path.exists(lookup):
+        return None
+
+    locations = pd.read_csv(lookup)
+    df = locations.loc[locations.index.repeat(len(PREDICTION_YEARS))].reset_index(drop=True)
+    n = len(df)
+    df['Year'] = np.tile(PREDICTION_YEARS, len(locations))
+    df['Production_KgHa'] = df['Prev_Yield_KgHa'] * _noise(rng, n, 0.08)
+    df['InputPrice_Urea_RpKg'] = rng.uniform(2200, 2800, n)
+    df['InputPrice_SP36_RpKg'] = rng.uniform(2300, 2900, n)
+    df['InputPrice_KCl_RpKg'] = rng.uniform(3000, 3800, n)
+    df['Init_Capital_RpHa'] = rng.uniform(5e6, 1.2e7, n)
+    df['Maintenance_Cost_RpHa'] = rng.uniform(2e6, 6e6, n)
+    df['Pupuk_Urea_kgHa'] = rng.uniform(150, 300, n)
+    df['Pupuk_SP36_kgHa'] = rng.uniform(75, 150, n)
+    df['Pupuk_KCl_kgHa'] = rng.uniform(50, 120, n)
+    return df
+
+
+def _jitter_prediction(df, copy, rng):
+    for col in ['Production_KgHa', 'Prev_Yield_KgHa', 'Init_Capital_RpHa', 'Maintenance_Cost_RpHa',
+                'Pupuk_Urea_kgHa', 'Pupuk_SP36_kgHa', 'Pupuk_KCl_kgHa']:
+        if col in df.columns:
+            df[col] = df[col] * _noise(rng, len(df), 0.05)
+    return df
+
+
+def _rename_pesticides(df, copy, rng):
+    # Distinct brand names per copy, so search results grow with the table
+    df.iloc[:, 0] = np.arange(1, len(df) + 1) + copy * len(df)
+    df.iloc[:, 1] = df.iloc[:, 1].astype(str).str.strip() + f" R{copy}"
+    return df
+
+
+def _replicate_catalogue(name, path, scale):
+    source = os.path.join(SOURCE_DIR, name)
+    if not os.path.exists(source):
+        return
+    with open(source, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    out = []
+    for copy in range(scale):
+        for item in items:
+            if copy:
+                item = dict(item, id=f"{item.get('id')}-r{copy}", name=f"{item.get('name')} R{copy}")
+            out.append(item)
+    with open(os.path.join(path, name), "w", encoding="utf-8") as f:
+        json.dump(out, f, ensure_ascii=False)
@@ -0,0 +1,337 @@
+import json
+import math
+import os
+import numpy as np
+import pandas as pd
+from modules import data_cache
+
+CUBE_DIMENSIONS = ['Province', 'District', 'Commodity', 'Year']
+LOCATION_DIMENSIONS = ['Province', 'District', 'Commodity']
+SKETCH_MEASURES = ['Production_KgHa']
+# Percentile sketches answer within this relative error
+SKETCH_ACCURACY = 0.01
+# Sketch bucket holding zero and negative values
+ZERO_BUCKET = np.iinfo(np.int32).min
+
+
+class AggregateCube:
+    """
+    Materialized aggregates of a yield history per (Province, District,
+    Commodity, Year): sum, sum of squares, count, min and max for every numeric
+    measure, plus mergeable log-bucket sketches for percentiles.
+
+    Every statistic is additive, so new rows are folded in with update()
+    without rescanning the history; load_or_build does so for rows appended
+    to the source file. Location-level rollups (all years) are kept as
+    dictionaries for O(1) ROI and ranking lookups.
+    """
+
+    def __init__(self, cells, sketches, measures, finalize=True):
+        self.cells = cells
+        self.sketches = sketches
+        self.measures = list(measures)
+        self._gamma = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+        if finalize:
+            self._finalize()
+
+    @classmethod
+    def build(cls, df, measures=None):
+        """Aggregate a raw history frame."""
+        if measures is None:
+            measures = measures_of(df)
+        return cls(_aggregate_cells(df, measures), _aggregate_sketches(df), measures)
+
+    @classmethod
+    def from_chunks(cls, chunks, measures):
+        """Aggregate a history streamed as DataFrame chunks, one chunk in memory at a time."""
+        cube = None
+        for chunk in chunks:
+            if cube is None:
+                cube = cls.build(chunk, measures)
+            else:
+                cube.update(chunk, finalize=False)
+        if cube is not None:
+            cube._finalize()
+        return cube
+
+    def update(self, rows, finalize=True):
+        """
+        Fold new raw rows into the cube and return it.
+        Pass finalize=False when more updates follow, to skip rebuilding the lookups.
+        """
+        new_cells = _aggregate_cells(rows, self.measures)
+        how = {}
+        for m in self.measures:
+            how.update({f"{m}__sum": 'sum', f"{m}__sumsq": 'sum', f"{m}__count": 'sum',
+                        f"{m}__min": 'min', f"{m}__max": 'max'})
+        self.cells = (
+            pd.concat([self.cells, new_cells], ignore_index=True)
+            .groupby(CUBE_DIMENSIONS, dropna=False, sort=False, observed=True).agg(how).reset_index()
+        )
+        self.sketches = (
+            pd.concat([self.sketches, _aggregate_sketches(rows)], ignore_index=True)
+            .groupby(['measure'] + CUBE_DIMENSIONS + ['bucket'], dropna=False, sort=False, observed=True)['count']
+            .sum().reset_index()
+        )
+        if finalize:
+            self._finalize()
+        return self
+
+    def _finalize(self):
+        """Location-level rollups over all years, as plain dict lookups."""
+        cols = [f"{m}__{s}" for m in self.measures for s in ('sum', 'sumsq', 'count')]
+        located = self.cells.dropna(subset=LOCATION_DIMENSIONS)
+        rollup = located.groupby(LOCATION_DIMENSIONS, sort=True, observed=True)[cols].sum()
+
+        self._locations = {}
+        for key, values in zip(rollup.index, rollup.to_numpy()):
+            stats = {}
+            for i, m in enumerate(self.measures):
+                total, total_sq, count = values[3 * i:3 * i + 3]
+                if count > 0:
+                    mean = total / count
+                    var = max(total_sq / count - mean * mean, 0.0)
+                else:
+                    mean = var = math.nan
+                stats[m] = (mean, math.sqrt(var), int(count))
+            self._locations[key] = stats
+
+        # Per location: sketch buckets merged over all years, with cumulative counts
+        self._location_sketches = {}
+        sketches = self.sketches.dropna(subset=LOCATION_DIMENSIONS)
+        if len(sketches):
+            merged = sketches.groupby(['measure'] + LOCATION_DIMENSIONS + ['bucket'], sort=True, observed=True)['count'].sum()
+            for key, group in merged.groupby(level=[0, 1, 2, 3], sort=False, observed=True):
+                buckets = group.index.get_level_values('bucket').to_numpy()
+                self._location_sketches[key] = (buckets, np.cumsum(group.to_numpy()))
+
+        # Per commodity: districts ranked by mean production, ties in (Province, District) order
+        self._rankings = {}
+        if 'Production_KgHa' in self.measures and len(rollup):
+            prod = rollup['Production_KgHa__sum'] / rollup['Production_KgHa__count'].where(rollup['Production_KgHa__count'] > 0)
+            prod = prod.rename('Production_KgHa').reset_index()
+            for commodity, group in prod.groupby('Commodity', sort=False, observed=True):
+                ranked = group.sort_values('Production_KgHa', ascending=False, kind='stable')
+                self._rankings[commodity] = ranked[['Province', 'District', 'Production_KgHa']].reset_index(drop=True)
+
+    def location_stats(self, province, district, commodity):
+        """{measure: (mean, std, count)} over all years for a location, or None."""
+        return self._locations.get((province, district, commodity))
+
+    def ranking(self, commodity, top=20):
+        """Top districts for a commodity by mean Production_KgHa."""
+        ranked = self._rankings.get(commodity)
+        return pd.DataFrame() if ranked is None else ranked.head(top)
+
+    def location_quantile(self, q, province, district, commodity, measure='Production_KgHa'):
+        """Approximate quantile(s) of a sketched measure for one location, all years."""
+        sketch = self._location_sketches.get((measure, province, district, commodity))
+        if sketch is None:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else math.nan
+        return self._sketch_quantile(q, *sketch)
+
+    def quantile(self, q, measure='Production_KgHa', **filters):
+        """
+        Approximate quantile(s) of a sketched measure over the cells matching
+        `filters` (e.g. Province=..., Commodity=...), within SKETCH_ACCURACY.
+        """
+        sketch = self.sketches[self.sketches['measure'] == measure]
+        for dim, value in filters.items():
+            sketch = sketch[sketch[dim] == value]
+        if sketch.empty:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else math.nan
+
+        counts = sketch.groupby('bucket')['count'].sum().sort_index()
+        return self._sketch_quantile(q, counts.index.to_numpy(), counts.cumsum().to_numpy())
+
+    def _sketch_quantile(self, q, buckets, cumulative):
+        ranks = np.asarray(q, dtype=np.float64) * (cumulative[-1] - 1)
+        hit = buckets[np.searchsorted(cumulative, ranks, side='right')]
+        values = np.where(hit == ZERO_BUCKET, 0.0, 2 * self._gamma ** hit.astype(np.float64) / (self._gamma + 1))
+        return values if np.ndim(q) else float(values)
+
+
+def measures_of(df):
+    """Numeric columns of a history frame that are aggregated (everything but the dimensions)."""
+    return [c for c in df.select_dtypes('number').columns if c not in CUBE_DIMENSIONS]
+
+
+def _aggregate_cells(df, measures):
+    grouped = df.groupby(CUBE_DIMENSIONS, dropna=False, sort=False, observed=True)
+    keys = [df[d] for d in CUBE_DIMENSIONS]
+    parts = {}
+    for m in measures:
+        # Sums accumulate in float64 even for float32 columns, so folded and rebuilt cubes agree
+        values = df[m].astype(np.float64)
+        parts[f"{m}__sum"] = values.groupby(keys, dropna=False, sort=False, observed=True).sum()
+        parts[f"{m}__sumsq"] = (values * values).groupby(keys, dropna=False, sort=False, observed=True).sum()
+        parts[f"{m}__count"] = grouped[m].count()
+        parts[f"{m}__min"] = grouped[m].min()
+        parts[f"{m}__max"] = grouped[m].max()
+    if not parts:
+        return df[CUBE_DIMENSIONS].drop_duplicates().reset_index(drop=True)
+    return pd.DataFrame(parts).reset_index()
+
+
+def _bucket_of(values):
+    """Log bucket index of each value; values <= 0 go to ZERO_BUCKET."""
+    gamma = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        buckets = np.ceil(np.log(values) / math.log(gamma))
+    return np.where(values > 0, buckets, ZERO_BUCKET).astype(np.int32)
+
+
+def _aggregate_sketches(df):
+    frames = []
+    for m in SKETCH_MEASURES:
+        if m not in df.columns:
+            continue
+        values = df[m].astype(np.float64)
+        present = values.notna()
+        part = df.loc[present, CUBE_DIMENSIONS].copy()
+        part['bucket'] = _bucket_of(values[present].to_numpy())
+        counts = part.groupby(CUBE_DIMENSIONS + ['bucket'], dropna=False, sort=False, observed=True).size()
+        counts = counts.rename('count').reset_index()
+        counts.insert(0, 'measure', m)
+        frames.append(counts)
+    if not frames:
+        return pd.DataFrame(columns=['measure'] + CUBE_DIMENSIONS + ['bucket', 'count'])
+    return pd.concat(frames, ignore_index=True)
+
+
+def load_or_build(source_path, df, measures=None, appended_chunks=None):
+    """
+    AggregateCube for the history in `source_path`, with cells and sketches
+    persisted in data/.cache and rebuilt only when the source file changes.
+    `df` may be a function returning the frame (with `measures` given), so the
+    history is only loaded when the cached cube is stale.
+    `appended_chunks(offset)` yields the rows starting at a byte offset of the
+    file; when given, rows appended since the last build are folded into the
+    cached cube instead of rebuilding it.
+    """
+    if callable(df):
+        if measures is None:
+            raise ValueError("measures are required when the history is loaded lazily")
+        load, loaded = df, []
+
+        def frame():
+            if not loaded:
+                loaded.append(load())
+            history = loaded[0]
+            if history.empty or any(c not in history.columns for c in CUBE_DIMENSIONS):
+                raise ValueError(f"No history in {source_path}")
+            return history
+    else:
+        if df.empty or any(c not in df.columns for c in CUBE_DIMENSIONS):
+            return None
+        if measures is None:
+            measures = measures_of(df)
+        frame = lambda: df
+
+    try:
+        return _cached_cube(
+            source_path, measures,
+            lambda: _aggregate_cells(frame(), measures), lambda: _aggregate_sketches(frame()), appended_chunks
+        )
+    except ValueError as e:
+        print(f"Error building aggregates: {e}")
+        return None
+
+
+def load_or_build_streaming(source_path, chunks, measures, appended_chunks=None):
+    """
+    load_or_build for histories too large to load: `chunks()` yields DataFrame
+    chunks and the cube is folded together one chunk at a time.
+    """
+    built = {}
+
+    def build(part):
+        if not built:
+            cube = AggregateCube.from_chunks(chunks(), measures)
+            if cube is None:
+                raise ValueError(f"No rows in {source_path}")
+            built.update(cells=cube.cells, sketches=cube.sketches)
+        return built[part]
+
+    try:
+        return _cached_cube(source_path, measures, lambda: build('cells'), lambda: build('sketches'), appended_chunks)
+    except ValueError as e:
+        print(f"Error building aggregates: {e}")
+        return None
+
+
+def _cached_cube(source_path, measures, build_cells, build_sketches, appended_chunks=None):
+    """
+    Cube from the cells and sketches in data/.cache. A stale cube is brought up
+    to date from the appended rows when possible (see _fold_appended), and
+    rebuilt with build_cells()/build_sketches() otherwise.
+    """
+    key = repr(list(measures))
+    state_path = data_cache.artifact_path(source_path, "cube.state.json", key=key)
+    fresh = (data_cache.is_fresh(source_path, data_cache.frame_path(source_path, "cube", key))
+             and data_cache.is_fresh(source_path, data_cache.frame_path(source_path, "cube_sketch")))
+
+    state = None
+    if appended_chunks is not None and not fresh and os.path.exists(source_path):
+        cube = _fold_appended(source_path, measures, key, state_path, appended_chunks)
+        if cube is not None:
+            return cube
+        # Taken before the rebuild reads the file, and only kept if nothing was
+        # appended meanwhile, so no row can be folded in twice later
+        state = data_cache.content_state(source_path)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+
+    cells = data_cache.cached_frame(source_path, build_cells, name="cube", key=key)
+    sketches = data_cache.cached_frame(source_path, build_sketches, name="cube_sketch")
+    if state is not None:
+        _save_state(source_path, state_path, state)
+    return AggregateCube(cells, sketches, measures)
+
+
+def _fold_appended(source_path, measures, key, state_path, appended_chunks):
+    """
+    The cached cube with the rows appended since its build folded in through
+    AggregateCube.update(), or None when the source changed in any other way
+    (or there is no cached cube or state to start from).
+    """
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            appended = data_cache.appended_offset(source_path, json.load(f))
+    except (OSError, ValueError, KeyError):
+        return None
+    if appended is None:
+        return None
+    cells = data_cache.read_frame(source_path, name="cube", key=key)
+    sketches = data_cache.read_frame(source_path, name="cube_sketch")
+    if cells is None or sketches is None:
+        return None
+
+    offset, state = appended
+    cube = AggregateCube(cells, sketches, measures, finalize=False)
+    for chunk in appended_chunks(offset):
+        cube.update(chunk, finalize=False)
+    cube._finalize()
+
+    # Rows appended while folding may already be in the cube: keep it for this
+    # process only, the next load folds again from the stored state
+    if _save_state(source_path, state_path, state):
+        data_cache.cached_frame(source_path, lambda: cube.cells, name="cube", key=key, rebuild=True)
+        data_cache.cached_frame(source_path, lambda: cube.sketches, name="cube_sketch", rebuild=True)
+    return cube
+
+
+def _save_state(source_path, state_path, state):
+    """
+    Persist the content state the cube was built from, unless the file was
+    written to since (same size and mtime), in which case the next load rebuilds.
+    """
+    try:
+        if not data_cache.matches_state(source_path, state):
+            return False
+        payload = json.dumps(state).encode("utf-8")
+        data_cache.atomic_write(state_path, lambda f: f.write(payload))
+        return True
+    except OSError as e:
+        print(f"Could not persist aggregate state {state_path}: {e}")
+        return False
@@ -0,0 +1,389 @@
+# Headless JSON/HTTP service for the recommenders, dashboard and pesticide search.
+# Standard library only: asyncio for connections, a process pool for scoring.
+#
+#   python -m modules.api_server --port 8000 --workers 2
+#
+# Endpoints (JSON in, JSON out):
+#   GET  /health
+#   GET  /metrics, /metrics.json   (this process: endpoint latencies; model internals with --workers 0)
+#   POST /v1/crop                {"n", "p", "k", "temperature", "humidity", "ph", "rainfall"}
+#                                or {"samples": [{...}, ...]}
+#   POST /v1/fertilizer/needs    {"crop", "n", "p", "k", "ph"} (numbers, or lists for a grid)
+#   POST /v1/fertilizer/doses    {"n", "p", "k", "ph"}
+#   POST /v1/roi                 {"province", "district", "commodity", "area"}
+#   POST /v1/roi/simulate        {"regions": [[province, district], ...], "commodity", "areas", "draws"}
+#   GET  /v1/pesticides?type=umum&q=...&sort=Name&desc=1&limit=50&offset=0
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+from modules import batching, hot_reload, metrics, registry
+
+# JSON field names of a crop query, in CROP_FEATURES order
+CROP_FIELDS = ['n', 'p', 'k', 'temperature', 'humidity', 'ph', 'rainfall']
+SOIL_FIELDS = ['n', 'p', 'k', 'ph']
+
+MAX_BODY_BYTES = 10 * 1024 * 1024
+MAX_HEADER_BYTES = 64 * 1024
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+
+class ApiError(Exception):
+    """Client error reported as a JSON {"error": ...} body with `status`."""
+
+    def __init__(self, message, status=HTTPStatus.BAD_REQUEST):
+        super().__init__(message)
+        self.status = status
+
+
+# --- Worker-side functions (run in the process pool; models load once per worker) ---
+
+def init_worker():
+    registry.get_crop_recommender()
+    registry.get_fertilizer_recommender()
+    # Data file updates are rebuilt in the background of each worker, no restart needed
+    hot_reload.start()
+
+
+def data_version():
+    return hot_reload.report()
+
+
+def crop_batch(samples):
+    """Top labels for a (m, 7) list of crop queries."""
+    return registry.get_crop_recommender().get_batch_recommendation(np.asarray(samples, dtype=np.float64))
+
+
+def fertilizer_needs(crop, n, p, k, ph):
+    rec = registry.get_fertilizer_recommender()
+    if np.ndim(n) == 0:
+        return rec.calculate_needs(crop, n, p, k, ph)
+
+    from modules.recommender import ADVICE_LABELS
+    result = rec.calculate_needs_batch(crop, n, p, k, ph)
+    return {
+        "target": result["target"].tolist(),
+        "deficit": result["deficit"].tolist(),
+        "advice_code": result["advice"].tolist(),
+        "advice": ADVICE_LABELS[result["advice"]].tolist(),
+    }
+
+
+def fertilizer_doses(queries):
+    """Data-driven doses for a list of (n, p, k, ph) queries."""
+    return registry.get_fertilizer_recommender().get_data_driven_recommendation_batch(queries)
+
+
+def roi(province, district, commodity, area):
+    return registry.get_smart_dashboard().calculate_roi(province, district, commodity, area)
+
+
+def roi_simulation(regions, commodity, areas, draws):
+    frame = registry.get_smart_dashboard().simulate_roi(regions, commodity, areas, n_draws=draws)
+    return frame.to_dict("records")
+
+
+def pesticide_search(pest_type, query, offset, limit, sort_by=None, descending=False):
+    from modules import data_loader
+    page, total = data_loader.pesticide_page(pest_type, query, sort_by, descending, offset, limit)
+    return {"total": total, "offset": offset, "items": page.to_dict("records")}
+
+
+# --- Request handling ---
+
+def _jsonable(value):
+    """numpy scalars/arrays -> Python, NaN/inf -> None, recursively."""
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return _jsonable(value.tolist())
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def _is_number(value):
+    # bool is an int subclass, but true/false is never a valid reading
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _number(body, key):
+    value = body.get(key)
+    if not _is_number(value):
+        raise ApiError(f"'{key}' must be a number")
+    return float(value)
+
+
+def _numbers(body, key):
+    """A number or a list of numbers."""
+    value = body.get(key)
+    if isinstance(value, list):
+        if not all(_is_number(v) for v in value):
+            raise ApiError(f"'{key}' must be a list of numbers")
+        return value
+    return _number(body, key)
+
+
+def _text(body, key):
+    value = body.get(key)
+    if not isinstance(value, str) or not value:
+        raise ApiError(f"'{key}' must be a non-empty string")
+    return value
+
+
+class ApiServer:
+    """
+    Routes requests to worker functions on `executor`. Single crop and dose
+    queries are coalesced by micro-batchers, so concurrent clients share one
+    batch call in the pool.
+    """
+
+    def __init__(self, executor, max_batch=batching.MAX_BATCH, max_wait_ms=batching.MAX_WAIT_MS):
+        self.executor = executor
+        self.crop_batcher = batching.AsyncMicroBatcher(
+            lambda queries: self._call(crop_batch, queries), max_batch, max_wait_ms)
+        self.dose_batcher = batching.AsyncMicroBatcher(
+            lambda queries: self._call(fertilizer_doses, queries), max_batch, max_wait_ms)
+        self.routes = {
+            ("GET", "/health"): self.health,
+            ("GET", "/metrics"): self.metrics_text,
+            ("GET", "/metrics.json"): self.metrics_json,
+            ("POST", "/v1/crop"): self.crop,
+            ("POST", "/v1/fertilizer/needs"): self.needs,
+            ("POST", "/v1/fertilizer/doses"): self.doses,
+            ("POST", "/v1/roi"): self.roi,
+            ("POST", "/v1/roi/simulate"): self.roi_simulate,
+            ("GET", "/v1/pesticides"): self.pesticides,
+        }
+
+    async def _call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def health(self, body, params):
+        return {
+            "status": "ok",
+            # As seen by the worker that answered; each polls the files itself
+            "data_version": await self._call(data_version),
+            "batching": {
+                name: {"batches": b.batches, "queries": b.queries}
+                for name, b in (("crop", self.crop_batcher), ("doses", self.dose_batcher))
+            },
+        }
+
+    async def metrics_text(self, body, params):
+        return metrics.prometheus_text()
+
+    async def metrics_json(self, body, params):
+        return metrics.snapshot()
+
+    async def crop(self, body, params):
+        if "samples" in body:
+            samples = body["samples"]
+            if not isinstance(samples, list) or not all(isinstance(s, dict) for s in samples):
+                raise ApiError("'samples' must be a list of objects")
+            rows = [[_number(s, f) for f in CROP_FIELDS] for s in samples]
+            return {"recommendations": await self._call(crop_batch, rows)}
+        row = [_number(body, f) for f in CROP_FIELDS]
+        return {"recommendations": await self.crop_batcher.submit(row)}
+
+    async def needs(self, body, params):
+        crop = _text(body, "crop")
+        values = [_numbers(body, f) for f in SOIL_FIELDS]
+        if len({len(v) if isinstance(v, list) else -1 for v in values}) != 1:
+            raise ApiError("'n', 'p', 'k' and 'ph' must all be numbers or lists of the same length")
+        result = await self._call(fertilizer_needs, crop, *values)
+        if result is None:
+            raise ApiError(f"Unknown crop: {crop}", HTTPStatus.NOT_FOUND)
+        return result
+
+    async def doses(self, body, params):
+        query = tuple(_number(body, f) for f in SOIL_FIELDS)
+        result = await self.dose_batcher.submit(query)
+        if result is None:
+            raise ApiError("No reference data available", HTTPStatus.SERVICE_UNAVAILABLE)
+        return result
+
+    async def roi(self, body, params):
+        result = await self._call(
+            roi, _text(body, "province"), _text(body, "district"), _text(body, "commodity"), _number(body, "area"))
+        if result is None:
+            raise ApiError("No history for this location and commodity", HTTPStatus.NOT_FOUND)
+        return result
+
+    async def roi_simulate(self, body, params):
+        regions = body.get("regions")
+        if not isinstance(regions, list) or not all(
+                isinstance(r, list) and len(r) == 2 and all(isinstance(name, str) for name in r) for r in regions):
+            raise ApiError("'regions' must be a list of [province, district] pairs")
+        areas = body.get("areas", [1.0])
+        if not isinstance(areas, list) or not all(_is_number(a) for a in areas):
+            raise ApiError("'areas' must be a list of numbers")
+        draws = body.get("draws", 100_000)
+        if isinstance(draws, bool) or not isinstance(draws, int) or not 1 <= draws <= 1_000_000:
+            raise ApiError("'draws' must be between 1 and 1000000")
+        rows = await self._call(roi_simulation, [tuple(r) for r in regions], _text(body, "commodity"), areas, draws)
+        return {"scenarios": rows}
+
+    async def pesticides(self, body, params):
+        from modules.data_loader import PESTICIDE_FILES
+        pest_type = params.get("type", "umum")
+        if pest_type not in PESTICIDE_FILES:
+            raise ApiError(f"'type' must be one of: {', '.join(PESTICIDE_FILES)}")
+        try:
+            offset = max(0, int(params.get("offset", 0)))
+            limit = min(MAX_PAGE_SIZE, max(1, int(params.get("limit", DEFAULT_PAGE_SIZE))))
+        except ValueError:
+            raise ApiError("'offset' and 'limit' must be integers")
+        descending = params.get("desc", "").lower() in ("1", "true", "yes")
+        return await self._call(
+            pesticide_search, pest_type, params.get("q", ""), offset, limit, params.get("sort") or None, descending)
+
+    async def dispatch(self, method, target, body_bytes):
+        """(status, payload) for one request."""
+        url = urlsplit(target)
+        handler = self.routes.get((method, url.path))
+        if handler is None:
+            if any(path == url.path for _, path in self.routes):
+                return HTTPStatus.METHOD_NOT_ALLOWED, {"error": f"{method} not allowed on {url.path}"}
+            return HTTPStatus.NOT_FOUND, {"error": f"Unknown endpoint: {url.path}"}
+
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            body = json.loads(body_bytes) if body_bytes else {}
+            if not isinstance(body, dict):
+                raise ApiError("Request body must be a JSON object")
+            with metrics.timer(f"api {method} {url.path}"):
+                return HTTPStatus.OK, await handler(body, params)
+        except json.JSONDecodeError as e:
+            return HTTPStatus.BAD_REQUEST, {"error": f"Invalid JSON: {e}"}
+        except ApiError as e:
+            return e.status, {"error": str(e)}
+        except ValueError as e:
+            return HTTPStatus.BAD_REQUEST, {"error": str(e)}
+        except Exception as e:
+            print(f"Error handling {method} {url.path}: {e!r}")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Internal server error"}
+
+    async def handle_connection(self, reader, writer):
+        """HTTP/1.1 with keep-alive; bodies need Content-Length (no chunked uploads)."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._respond(writer, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, {"error": "Headers too large"}, False)
+                    break
+
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, {"error": "Malformed request line"}, False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                if "chunked" in headers.get("transfer-encoding", "").lower():
+                    await self._respond(writer, HTTPStatus.LENGTH_REQUIRED, {"error": "Send a Content-Length body"}, False)
+                    break
+                try:
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= MAX_BODY_BYTES:
+                    await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Invalid or too large body"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = await self.dispatch(method.upper(), target, body)
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        # Text payloads (Prometheus exposition) go out as they are, everything else as JSON
+        if isinstance(payload, str):
+            data, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            data, content_type = json.dumps(_jsonable(payload), ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + data)
+        await writer.drain()
+
+
+def make_executor(workers):
+    """
+    Process pool whose workers load the models once at start-up; workers=0
+    scores in a thread of this process instead (handy for local testing).
+    """
+    if workers == 0:
+        return ThreadPoolExecutor(max_workers=1, initializer=init_worker)
+    # spawn: workers never inherit the event loop or half-initialized state
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=init_worker)
+
+
+async def serve(host="127.0.0.1", port=8000, workers=None, max_batch=batching.MAX_BATCH, max_wait_ms=batching.MAX_WAIT_MS):
+    if workers is None:
+        workers = min(4, os.cpu_count() or 1)
+    executor = make_executor(workers)
+    api = ApiServer(executor, max_batch, max_wait_ms)
+    server = await asyncio.start_server(api.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+    print(f"Serving on http://{host}:{port} ({workers or 'in-process'} workers)")
+
+    # Stop on SIGINT/SIGTERM through the loop, so the worker processes are shut down too
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass  # Windows: Ctrl+C still raises KeyboardInterrupt
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AgriSensa recommender API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None, help="Scoring processes (0 = score in-process)")
+    parser.add_argument("--max-batch", type=int, default=batching.MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=batching.MAX_WAIT_MS)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.max_batch, args.max_wait_ms))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import asyncio
+import threading
+
+# Defaults for coalescing concurrent queries into one batch call
+MAX_BATCH = 256 # Queries per batch call
+MAX_WAIT_MS = 2.0 # How long the first query of a batch waits for company
+
+
+class AsyncMicroBatcher:
+    """
+    Coalesces concurrent single-query awaits into batch calls.
+
+    `await batcher.submit(query)` queues the query; a batch is flushed when
+    MAX_BATCH queries are waiting or MAX_WAIT_MS after the first one arrived.
+    `run_batch(queries)` is awaited with the list of queries and must return
+    one result per query, in order. An exception fails every query of the batch.
+    """
+
+    def __init__(self, run_batch, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.run_batch = run_batch
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._pending = []
+        self._timer = None
+        # Batch sizes actually dispatched, for monitoring
+        self.batches = 0
+        self.queries = 0
+
+    async def submit(self, query):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((query, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        self.batches += 1
+        self.queries += len(batch)
+        asyncio.ensure_future(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        try:
+            results = await self.run_batch([query for query, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"Batch returned {len(results)} results for {len(batch)} queries")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class _Slot:
+    __slots__ = ("query", "taken", "done", "result", "error")
+
+    def __init__(self, query):
+        self.query = query
+        self.taken = False
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Thread counterpart of AsyncMicroBatcher, for in-process callers such as
+    Streamlit sessions: `batcher.submit(query)` blocks until its batch ran.
+
+    The first caller of a batch waits up to MAX_WAIT_MS for company and then
+    runs the batch on its own thread; the caller that fills a batch to
+    MAX_BATCH runs it at once. No background thread is involved.
+    """
+
+    def __init__(self, run_batch, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.run_batch = run_batch
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._pending = []
+        self._cond = threading.Condition()
+        self.batches = 0
+        self.queries = 0
+
+    def submit(self, query):
+        slot = _Slot(query)
+        batch = None
+        with self._cond:
+            self._pending.append(slot)
+            if len(self._pending) >= self.max_batch:
+                batch = self._take()
+            elif len(self._pending) == 1:
+                # Leader: wait for company unless a full batch takes this query first
+                self._cond.wait_for(lambda: slot.taken, timeout=self.max_wait)
+                if not slot.taken:
+                    batch = self._take()
+        if batch is not None:
+            self._run(batch)
+        slot.done.wait()
+        if slot.error is not None:
+            raise slot.error
+        return slot.result
+
+    def _take(self):
+        batch, self._pending = self._pending, []
+        for slot in batch:
+            slot.taken = True
+        self.batches += 1
+        self.queries += len(batch)
+        self._cond.notify_all()
+        return batch
+
+    def _run(self, batch):
+        try:
+            results = self.run_batch([slot.query for slot in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"Batch returned {len(results)} results for {len(batch)} queries")
+            for slot, result in zip(batch, results):
+                slot.result = result
+        except Exception as e:
+            for slot in batch:
+                slot.error = e
+        finally:
+            for slot in batch:
+                slot.done.set()
@@ -0,0 +1,188 @@
+import hashlib
+import importlib.util
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# Feather needs pyarrow (shipped with streamlit); without it the cache falls back
+# to pickle. Probed without importing, so pyarrow only loads on the first cache read
+HAS_FEATHER = importlib.util.find_spec("pyarrow") is not None
+
+# Resolve cache directory relative to the data directory
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+CACHE_DIR = os.path.join(DATA_DIR, ".cache")
+HASH_BLOCK_BYTES = 1024 * 1024
+
+
+def source_fingerprint(path):
+    """mtime/size of a source file; derived artifacts are rebuilt when it changes."""
+    st = os.stat(path)
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+
+def artifact_path(source_path, suffix, key=""):
+    """
+    Location of a derived artifact for `source_path` in the cache directory.
+    `key` distinguishes artifacts built from the same file with different options.
+    """
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    if key:
+        stem = f"{stem}.{hashlib.sha1(key.encode('utf-8')).hexdigest()[:10]}"
+    return os.path.join(CACHE_DIR, f"{stem}.{suffix}")
+
+
+def is_fresh(source_path, artifact):
+    """True when `artifact` exists and was built from the current `source_path`."""
+    try:
+        with open(f"{artifact}.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return os.path.exists(artifact) and meta == source_fingerprint(source_path)
+    except (OSError, ValueError):
+        return False
+
+
+def mark_fresh(source_path, artifact):
+    """Record which version of `source_path` the artifact was built from."""
+    atomic_write(f"{artifact}.json", lambda f: f.write(json.dumps(source_fingerprint(source_path)).encode("utf-8")))
+
+
+def atomic_write(path, writer):
+    """Write via a temp file and rename, so readers never see a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        writer(f)
+    os.replace(tmp_path, path)
+
+
+def frame_path(source_path, name="", key=""):
+    """Location of a cached_frame() artifact."""
+    ext = "feather" if HAS_FEATHER else "pkl"
+    return artifact_path(source_path, f"{name}.{ext}" if name else ext, key=key)
+
+
+def read_frame(source_path, name="", key=""):
+    """A cached_frame() artifact as stored, even when stale; None when missing or unreadable."""
+    cached = frame_path(source_path, name, key)
+    if not os.path.exists(cached):
+        return None
+    try:
+        return pd.read_feather(cached) if HAS_FEATHER else pd.read_pickle(cached)
+    except Exception as e:
+        print(f"Error reading cache {cached}: {e}")
+        return None
+
+
+def cached_frame(source_path, build, name="", key="", rebuild=False):
+    """
+    DataFrame derived from `source_path`, stored as Feather (pickle when pyarrow
+    is unavailable) in data/.cache. `build()` only runs when there is no copy
+    built from the current version of the source file, or when `rebuild` is set.
+    """
+    cached = frame_path(source_path, name, key)
+
+    if not rebuild and is_fresh(source_path, cached):
+        df = read_frame(source_path, name, key)
+        if df is not None:
+            return df
+
+    df = build()
+    try:
+        if HAS_FEATHER:
+            atomic_write(cached, lambda f: df.to_feather(f))
+        else:
+            atomic_write(cached, lambda f: df.to_pickle(f))
+        mark_fresh(source_path, cached)
+    except Exception as e:
+        # Read-only or unsupported frames still work, they just skip the cache
+        print(f"Could not cache {source_path}: {e}")
+    return df
+
+
+def content_state(path):
+    """
+    {"size", "mtime_ns", "sha1"} of a file, for appended_offset() and
+    matches_state(). The mtime is taken before hashing, so a write during the
+    read leaves the state stale rather than looking current.
+    """
+    mtime_ns = os.stat(path).st_mtime_ns
+    digest = hashlib.sha1()
+    size = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b""):
+            digest.update(block)
+            size += len(block)
+    return {"size": size, "mtime_ns": mtime_ns, "sha1": digest.hexdigest()}
+
+
+def matches_state(path, state):
+    """True when `path` was not written to since content_state() returned `state`."""
+    try:
+        return source_fingerprint(path) == {"mtime_ns": state["mtime_ns"], "size": state["size"]}
+    except (OSError, KeyError):
+        return False
+
+
+def appended_offset(path, state):
+    """
+    (offset, new state) when `path` only had whole lines appended since
+    content_state() returned `state`, so rows from byte `offset` on are new.
+    None when the earlier contents were changed in any other way.
+    """
+    st = os.stat(path)
+    if st.st_size < state["size"]:
+        return None
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        remaining, last = state["size"], b"\n"
+        while remaining:
+            block = f.read(min(HASH_BLOCK_BYTES, remaining))
+            if not block:
+                return None
+            digest.update(block)
+            remaining -= len(block)
+            last = block[-1:]
+        # A missing final newline means the last old row may have been extended
+        if last != b"\n" or digest.hexdigest() != state["sha1"]:
+            return None
+        size = state["size"]
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b""):
+            digest.update(block)
+            size += len(block)
+    return state["size"], {"size": size, "mtime_ns": st.st_mtime_ns, "sha1": digest.hexdigest()}
+
+
+def read_csv(path, **kwargs):
+    """
+    pd.read_csv with a typed binary copy kept in data/.cache.
+    The first read parses the CSV and stores the binary copy; later reads
+    load it until the CSV changes.
+    """
+    return cached_frame(path, lambda: pd.read_csv(path, **kwargs), key=repr(sorted(kwargs.items())))
+
+
+def load_matrix(path, columns, dtype=np.float32, df=None):
+    """
+    Numeric columns of a CSV as a read-only memory-mapped .npy matrix.
+    Pass `df` when the frame is already loaded to avoid parsing it again on a rebuild.
+    """
+    cached = artifact_path(path, "npy", key=repr((list(columns), np.dtype(dtype).str)))
+
+    if is_fresh(path, cached):
+        try:
+            return np.load(cached, mmap_mode="r")
+        except Exception as e:
+            print(f"Error reading cache {cached}: {e}")
+
+    if df is None:
+        df = read_csv(path)
+    matrix = np.ascontiguousarray(df[list(columns)].to_numpy(dtype=dtype))
+    try:
+        atomic_write(cached, lambda f: np.save(f, matrix))
+        mark_fresh(path, cached)
+        return np.load(cached, mmap_mode="r")
+    except Exception as e:
+        print(f"Could not cache {path}: {e}")
+        return matrix
@@ -1,74 +1,95 @@
 import json
 import os
+import numpy as np
 import pandas as pd
+from modules import data_cache, metrics, registry, search_index
 
 # Resolve data directory relative to this file
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 
+@metrics.timed()
 def load_data(category):
     """
     Load data from JSON files.
+    The parsed list is cached per process and shared, so callers must not mutate it.
     :param category: 'fertilizers' or 'pesticides'
     :return: List of dictionaries
     """
     file_path = os.path.join(DATA_DIR, f"{category}.json")
-    
+    return registry.get_or_load(f"json:{category}", lambda: _read_json(file_path), [file_path])
+
+def _read_json(file_path):
     if not os.path.exists(file_path):
         return []
     
     with open(file_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+        data = json.load(f)
+    metrics.rows("modules.data_loader.load_data", len(data))
+    return data
 
 def get_as_dataframe(category):
     """Load data and convert to Pandas DataFrame for searching."""
     data = load_data(category)
     return pd.DataFrame(data)
 
+CATALOGUE_SEARCH_FIELDS = {"name": 3.0, "description": 1.0}
+
+def get_catalogue_index(category):
+    """Inverted index over a JSON catalogue, built once per version of the file."""
+    file_path = os.path.join(DATA_DIR, f"{category}.json")
+    return registry.get_or_load(
+        f"search:{category}",
+        lambda: search_index.InvertedIndex(load_data(category), CATALOGUE_SEARCH_FIELDS),
+        [file_path]
+    )
+
+@metrics.timed()
 def search_items(category, query):
-    """Search for items by name or description."""
+    """Search for items by name or description (all words, prefix match, best first)."""
     data = load_data(category)
-    query = query.lower()
-    
-    results = []
-    for item in data:
-        if query in item["name"].lower() or query in item.get("description", "").lower():
-            results.append(item)
-    return results
+    return [data[i] for i in get_catalogue_index(category).search(query)]
 
+PESTICIDE_FILES = {
+    "umum": "pestisida_umum.csv",
+    "teknis": "pestisida_teknis.csv",
+    "ekspor": "pestisida_ekspor.csv"
+}
+
+@metrics.timed()
 def load_pesticide_csv(pest_type="umum"):
     """
     Load pesticide data from CSV.
+    The frame is cached per process and shared, so callers must not mutate it.
     :param pest_type: 'umum', 'teknis', or 'ekspor'
     :return: Pandas DataFrame
     """
-    file_map = {
-        "umum": "pestisida_umum.csv",
-        "teknis": "pestisida_teknis.csv",
-        "ekspor": "pestisida_ekspor.csv"
-    }
-    
-    filename = file_map.get(pest_type, "pestisida_umum.csv")
+    filename = PESTICIDE_FILES.get(pest_type, "pestisida_umum.csv")
     file_path = os.path.join(DATA_DIR, filename)
-    
+    return registry.get_or_load(f"csv:{filename}", lambda: _read_pesticide_csv(file_path), [file_path])
+
+def _read_pesticide_csv(file_path):
     if not os.path.exists(file_path):
         return pd.DataFrame()
         
     try:
-        df = pd.read_csv(file_path)
+        df = data_cache.read_csv(file_path)
+        metrics.rows("modules.data_loader.load_pesticide_csv", len(df))
         
         # Clean column names (strip spaces, lowercase)
         df.columns = df.columns.str.strip().str.lower()
         
         # Normalize columns
         # Original: ['no', 'merek dagang', 'bahan aktif', 'deskrispi', 'pembuat']
-        # Target: ['Name', 'Active_Ingredient', 'Description', 'Manufacturer']
+        # 'umum' has ['no', 'merek dagang', 'cara pemakaian', 'pembuat'] instead
+        # Target: ['Name', 'Active_Ingredient', 'Description', 'Usage', 'Manufacturer']
         
         column_map = {
             'merek dagang': 'Name',
             'bahan aktif': 'Active_Ingredient',
             'deskrispi': 'Description', # Handle typo in CSV
             'deskripsi': 'Description', # Or correct spelling
+            'cara pemakaian': 'Usage',
             'pembuat': 'Manufacturer',
             'no': 'No'
         }
@@ -76,10 +97,119 @@ def load_pesticide_csv(pest_type="umum"):
         df = df.rename(columns=column_map)
         
         # Select relevant columns
-        cols = ['Name', 'Active_Ingredient', 'Description', 'Manufacturer']
+        cols = ['Name', 'Active_Ingredient', 'Description', 'Usage', 'Manufacturer']
         available_cols = [c for c in cols if c in df.columns]
         
         return df[available_cols]
     except Exception as e:
         print(f"Error loading pesticide CSV: {e}")
         return pd.DataFrame()
+
+PESTICIDE_SEARCH_FIELDS = {
+    "Name": 3.0,
+    "Active_Ingredient": 2.0,
+    "Description": 1.0,
+    "Usage": 1.0,
+    "Manufacturer": 1.0
+}
+
+def get_pesticide_index(pest_type="umum"):
+    """Inverted index over a Kementan pesticide table, built once per version of the CSV."""
+    filename = PESTICIDE_FILES.get(pest_type, "pestisida_umum.csv")
+    file_path = os.path.join(DATA_DIR, filename)
+    
+    def build():
+        df = load_pesticide_csv(pest_type)
+        fields = {c: w for c, w in PESTICIDE_SEARCH_FIELDS.items() if c in df.columns}
+        return search_index.InvertedIndex(df.to_dict("records"), fields)
+    
+    return registry.get_or_load(f"search:{filename}", build, [file_path])
+
+@metrics.timed()
+def search_pesticide_csv(pest_type, query):
+    """Rows of the pesticide table matching every word of `query`, best first."""
+    df = load_pesticide_csv(pest_type)
+    if not query or df.empty:
+        return df
+    return df.iloc[get_pesticide_index(pest_type).search(query)]
+
+def get_pesticide_sort_index(pest_type="umum"):
+    """
+    Per column of a pesticide table: (ascending row order, descending row
+    order, rank of every row), case-insensitive, equal values in file order
+    and empty values last either way. Built once per version of the CSV.
+    """
+    filename = PESTICIDE_FILES.get(pest_type, "pestisida_umum.csv")
+    file_path = os.path.join(DATA_DIR, filename)
+    
+    def build():
+        df = load_pesticide_csv(pest_type)
+        index = {}
+        for col in df.columns:
+            keys = df[col].reset_index(drop=True)
+            keys = keys.astype(str).str.casefold().where(keys.notna())
+            order = keys.sort_values(kind="stable", na_position="last").index.to_numpy(dtype=np.int32)
+            # Equal values share a rank; empty values share the last one
+            sorted_keys = keys.iloc[order].to_numpy(dtype=object)
+            starts = np.ones(len(order), dtype=bool)
+            starts[1:] = sorted_keys[1:] != sorted_keys[:-1]
+            rank = np.empty(len(order), dtype=np.int32)
+            rank[order] = np.cumsum(starts) - 1
+            rank[keys.isna().to_numpy()] = len(order)
+            order_desc = _order_by_rank(np.arange(len(order)), rank, descending=True)
+            index[col] = (order, order_desc, rank)
+        return index
+    
+    return registry.get_or_load(f"sort:{filename}", build, [file_path])
+
+@metrics.timed()
+def sorted_pesticide_rows(pest_type="umum", query="", sort_by=None, descending=False):
+    """
+    Row positions of the pesticide table matching `query`, ordered by `sort_by`
+    (search relevance / file order when None), so callers can page through them
+    without sorting or copying the table.
+    """
+    df = load_pesticide_csv(pest_type)
+    if df.empty:
+        return np.empty(0, dtype=np.int32)
+    if sort_by not in df.columns:
+        return get_pesticide_index(pest_type).search(query) if query else np.arange(len(df), dtype=np.int32)
+    
+    order, order_desc, rank = get_pesticide_sort_index(pest_type)[sort_by]
+    if not query:
+        return order_desc if descending else order
+    return _order_by_rank(get_pesticide_index(pest_type).search(query), rank, descending)
+
+def _order_by_rank(rows, rank, descending=False):
+    """`rows` ordered by their precomputed rank (ties keep their order, empty values last)."""
+    key = rank[rows].astype(np.int64)
+    if descending:
+        key = np.where(key < len(rank), -key, len(rank))
+    return rows[np.argsort(key, kind="stable")].astype(np.int32)
+
+def pesticide_page(pest_type="umum", query="", sort_by=None, descending=False, offset=0, limit=50):
+    """One page of the (filtered, sorted) pesticide table and the total number of matches."""
+    rows = sorted_pesticide_rows(pest_type, query, sort_by, descending)
+    return load_pesticide_csv(pest_type).iloc[rows[offset:offset + limit]], len(rows)
+
+def get_usage_table(pest_type="umum"):
+    """Parsed 'cara pemakaian' records with crop/target indexes (see usage_parser)."""
+    from modules import usage_parser
+    filename = PESTICIDE_FILES.get(pest_type, "pestisida_umum.csv")
+    file_path = os.path.join(DATA_DIR, filename)
+    return registry.get_or_load(
+        f"usage:{filename}",
+        lambda: usage_parser.build_usage_table(file_path, load_pesticide_csv(pest_type)),
+        [file_path]
+    )
+
+def warm_catalogues():
+    """Preload the JSON catalogues and their search indexes (background warm-up)."""
+    for category in ("fertilizers", "pesticides"):
+        get_catalogue_index(category)
+
+def warm_pesticide_tables():
+    """Preload the Kementan tables, their search indexes and the usage table (background warm-up)."""
+    for pest_type in PESTICIDE_FILES:
+        get_pesticide_index(pest_type)
+    get_usage_table("umum")
@@ -0,0 +1,202 @@
+import re
+import numpy as np
+
+NUTRIENTS = ['N', 'P', 'K']
+# Label keys in nutrient_content -> (nutrient, factor to elemental mass)
+# Fertilizer labels state phosphate and potash as oxides (P2O5, K2O)
+NUTRIENT_KEYS = {
+    'N': ('N', 1.0),
+    'P': ('P', 1.0),
+    'P2O5': ('P', 0.4364),
+    'K': ('K', 1.0),
+    'K2O': ('K', 0.8301),
+}
+# Soil test ppm -> kg/ha in the top 15-20 cm (bulk density ~1.3 g/cm3)
+PPM_TO_KG_HA = 2.0
+# Simplex limits: pivots per solve, and values treated as zero
+MAX_PIVOTS = 1000
+PIVOT_TOLERANCE = 1e-12
+
+_PERCENT = re.compile(r"(\d+(?:[.,]\d+)?)")
+
+
+def parse_percent(text):
+    """
+    Fraction from a label value: '46%' -> 0.46. Ranges ('1-3%') and bounds
+    ('>15%') take the lowest number, so a planned dose never over-promises.
+    """
+    if isinstance(text, (int, float)):
+        return float(text) / 100
+    numbers = _PERCENT.findall(str(text))
+    if not numbers:
+        return None
+    return min(float(n.replace(",", ".")) for n in numbers) / 100
+
+
+def nutrient_matrix(products):
+    """(products, 3) elemental N/P/K mass fraction per product from `nutrient_content`."""
+    content = np.zeros((len(products), len(NUTRIENTS)))
+    for i, product in enumerate(products):
+        for key, value in (product.get('nutrient_content') or {}).items():
+            if key not in NUTRIENT_KEYS:
+                continue
+            nutrient, factor = NUTRIENT_KEYS[key]
+            fraction = parse_percent(value)
+            if fraction is not None:
+                content[i, NUTRIENTS.index(nutrient)] = fraction * factor
+    return content
+
+
+def ppm_to_kg_ha(deficit_ppm):
+    """Soil-test deficit in ppm -> nutrient requirement in kg/ha."""
+    return np.asarray(deficit_ppm, dtype=np.float64) * PPM_TO_KG_HA
+
+
+class DoseOptimizer:
+    """
+    Least-cost product mix covering an N/P/K requirement:
+
+        minimize  price . x   subject to  content.T @ x >= requirement,  x >= 0
+
+    Solved by a dual simplex on the three nutrient rows, starting from the
+    all-surplus basis (no product, which is dual feasible as prices are
+    positive). Whether a basis is optimal does not depend on the requirement,
+    only whether its doses come out non-negative does, so every optimal basis
+    found is kept and tried first on later requirements: a batch costs a few
+    array ops per distinct basis, plus one simplex per requirement no known
+    basis covers.
+    """
+
+    def __init__(self, products, prices=None):
+        """
+        :param products: Catalogue entries with 'name' and 'nutrient_content' (fertilizers.json)
+        :param prices: Optional dict of product id or name -> price per kg. Without
+                       prices the total mass is minimized; with prices, products
+                       that have no price are left out.
+        """
+        content = nutrient_matrix(products)
+        useful = content.sum(axis=1) > 0
+        if prices:
+            priced = [prices.get(p.get('id'), prices.get(p.get('name'))) for p in products]
+            price = np.array([np.nan if v is None or v <= 0 else v for v in priced], dtype=np.float64)
+            useful &= ~np.isnan(price)
+        else:
+            price = np.ones(len(products))
+
+        self.products = [p for p, keep in zip(products, useful) if keep]
+        self.names = [p.get('name') for p in self.products]
+        self.content = content[useful]
+        self.price = price[useful]
+        # Standard form: one column per product, then one surplus column per nutrient
+        n_products, n_nutrients = self.content.shape
+        self._columns = np.hstack([self.content.T, -np.eye(n_nutrients)])
+        self._costs = np.concatenate([self.price, np.zeros(n_nutrients)])
+        # Nutrients some product supplies; a requirement for any other one is infeasible
+        self._supplied = self.content.max(axis=0, initial=0) > 0
+        # Optimal bases found so far: (basic columns, inverse of their matrix).
+        # Only ever appended to, so concurrent solves can share the object.
+        self._bases = []
+        self._known = set()
+
+    def _simplex(self, need):
+        """Optimal basic columns for one requirement vector (Bland's rule, so it cannot cycle)."""
+        n_products, n_nutrients = self.content.shape
+        basis = list(range(n_products, n_products + n_nutrients))
+        for _ in range(MAX_PIVOTS):
+            inverse = np.linalg.inv(self._columns[:, basis])
+            x = inverse @ need
+            short = [i for i in range(n_nutrients) if x[i] < -PIVOT_TOLERANCE]
+            if not short:
+                return tuple(basis)
+            leave = min(short, key=lambda i: basis[i])
+            row = inverse[leave] @ self._columns
+            reduced = self._costs - (self._costs[basis] @ inverse) @ self._columns
+            entering = np.flatnonzero(row < -PIVOT_TOLERANCE)
+            if not len(entering):
+                return None
+            ratios = reduced[entering] / -row[entering]
+            # Lowest index among the minimum ratios
+            basis[leave] = int(entering[np.flatnonzero(ratios <= ratios.min() + PIVOT_TOLERANCE)[0]])
+        raise RuntimeError("Dose optimizer did not converge")
+
+    def _add_basis(self, basis):
+        """(columns, inverse) of an optimal basis, remembered for later solves."""
+        entry = (np.array(basis), np.linalg.inv(self._columns[:, list(basis)]))
+        if basis not in self._known:
+            self._known.add(basis)
+            self._bases.append(entry)
+        return entry
+
+    def solve(self, requirements):
+        """
+        Batched solve.
+        :param requirements: (m, 3) N/P/K requirement in kg/ha (or one row)
+        :return: dict with 'doses' (m, products) kg/ha, 'cost' (m,) and
+                 'feasible' (m,) False where no product mix can cover the need
+        """
+        need = np.atleast_2d(np.asarray(requirements, dtype=np.float64))
+        # Unknown requirements (NaN, e.g. an unknown crop) get no plan
+        unknown = np.isnan(need).any(axis=1)
+        need = np.maximum(np.nan_to_num(need), 0)
+        m = len(need)
+        n_products = len(self.names)
+
+        best_cost = np.full(m, np.inf)
+        best_doses = np.zeros((m, n_products))
+        open_rows = ~unknown & ~(need[:, ~self._supplied] > 0).any(axis=1)
+        tolerance = 1e-9 * (1 + np.abs(need).max(axis=1))
+
+        def apply(cols, inverse):
+            x = need[open_rows] @ inverse.T
+            ok = (x >= -tolerance[open_rows, None]).all(axis=1)
+            if not ok.any():
+                return
+            rows = np.flatnonzero(open_rows)[ok]
+            x = np.maximum(x[ok], 0)
+            products = cols < n_products
+            best_cost[rows] = x[:, products] @ self.price[cols[products]]
+            best_doses[rows] = 0
+            best_doses[np.ix_(rows, cols[products])] = x[:, products]
+            open_rows[rows] = False
+
+        for cols, inverse in list(self._bases):
+            if not open_rows.any():
+                break
+            apply(cols, inverse)
+        while open_rows.any():
+            row = int(np.flatnonzero(open_rows)[0])
+            basis = self._simplex(need[row])
+            if basis is None:
+                open_rows[row] = False
+                continue
+            apply(*self._add_basis(basis))
+
+        feasible = np.isfinite(best_cost)
+        best_doses[~feasible] = np.nan
+        return {"doses": best_doses, "cost": np.where(feasible, best_cost, np.nan), "feasible": feasible}
+
+    def plan(self, requirements, areas=None):
+        """
+        Bulk purchase plan for many fields (e.g. all members of a cooperative).
+        :param requirements: (m, 3) N/P/K requirement in kg/ha
+        :param areas: Optional (m,) field areas in ha (default 1 ha each)
+        :return: dict with per-field 'doses' (m, products) kg/ha, 'totals'
+                 {product name: kg} over feasible fields and 'infeasible' count
+        """
+        result = self.solve(requirements)
+        doses = result['doses']
+        areas = np.ones(len(doses)) if areas is None else np.asarray(areas, dtype=np.float64)
+        feasible = result['feasible']
+        totals = areas[feasible] @ doses[feasible] if feasible.any() else np.zeros(len(self.names))
+        return {
+            "doses": doses,
+            "totals": dict(zip(self.names, totals.tolist())),
+            "infeasible": int((~feasible).sum())
+        }
+
+    def solve_one(self, n, p, k):
+        """{product name: kg/ha} for one N/P/K requirement in kg/ha, or None if infeasible."""
+        result = self.solve([[n, p, k]])
+        if not result['feasible'][0]:
+            return None
+        return {name: float(dose) for name, dose in zip(self.names, result['doses'][0]) if dose > 0}
@@ -0,0 +1,101 @@
+import threading
+import numpy as np
+import pandas as pd
+from modules import data_cache, registry, streaming
+
+# Text columns interned as categorical codes, and the vocabulary each one shares:
+# 'Label' (crop recommender) and 'Tanaman' (fertilizer targets) both name crops
+VOCABULARY_OF = {
+    'Province': 'province',
+    'District': 'district',
+    'Commodity': 'commodity',
+    'Tanaman': 'crop',
+    'Label': 'crop',
+}
+
+
+class Vocabulary:
+    """
+    Append-only string <-> code table shared by every frame in the process.
+    Codes never change once assigned, so frames interned earlier stay valid
+    when later frames add new values.
+    """
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value):
+        """Code of `value`, or -1 if it was never interned."""
+        return self.codes.get(value, -1)
+
+    def encode(self, values):
+        """int32 codes for an array of strings (NaN -> -1), adding unseen values."""
+        local_codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+        with self._lock:
+            for value in uniques:
+                if value not in self.codes:
+                    self.codes[value] = len(self.values)
+                    self.values.append(value)
+            mapping = np.array([self.codes[v] for v in uniques] + [-1], dtype=np.int32)
+        # The trailing -1 is picked up by the NaN sentinel (-1)
+        return mapping[local_codes]
+
+    def categorical(self, values):
+        """pd.Categorical over this vocabulary (categories = every value interned so far)."""
+        codes = self.encode(values)
+        return pd.Categorical.from_codes(codes, dtype=pd.CategoricalDtype(list(self.values)))
+
+
+_vocabularies = {}
+_vocabularies_guard = threading.Lock()
+
+
+def vocabulary(name):
+    with _vocabularies_guard:
+        return _vocabularies.setdefault(name, Vocabulary())
+
+
+def compact(df, keep=()):
+    """
+    Memory-compact copy of a frame: VOCABULARY_OF text columns become
+    categoricals over the shared vocabularies, float64 becomes float32 and
+    integers take the smallest type holding their range.
+    :param keep: Columns left as they are (e.g. features that need float64 precision)
+    """
+    out = {}
+    for col in df.columns:
+        series = df[col]
+        if col in keep:
+            out[col] = series
+        elif col in VOCABULARY_OF:
+            values = series.astype(object) if isinstance(series.dtype, pd.CategoricalDtype) else series
+            out[col] = pd.Series(vocabulary(VOCABULARY_OF[col]).categorical(values.to_numpy(dtype=object)), index=df.index)
+        elif series.dtype == np.float64:
+            out[col] = series.astype(np.float32)
+        elif pd.api.types.is_integer_dtype(series.dtype) and not pd.api.types.is_extension_array_dtype(series.dtype):
+            out[col] = pd.to_numeric(series, downcast='integer')
+        else:
+            out[col] = series
+    return pd.DataFrame(out, index=df.index)
+
+
+def load_table(path, keep=()):
+    """
+    Compact frame of a CSV, shared process-wide: every class that reads the
+    same file gets the same object, so it must be treated as read-only.
+    """
+    return registry.get_or_load(
+        f"frame:{path}:{','.join(keep)}",
+        lambda: compact(data_cache.read_csv(path, dtype=streaming.dtypes_for(path)), keep=keep),
+        [path]
+    )
+
+
+def memory_mb(df):
+    """Resident size of a frame in MB, strings included."""
+    return df.memory_usage(deep=True).sum() / 1e6
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import threading
+import time
+from modules import registry
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+# AGRISENSA_HOT_RELOAD=0 keeps the old behaviour: the first request after a change reloads
+ENABLED = os.environ.get("AGRISENSA_HOT_RELOAD", "1") != "0"
+POLL_INTERVAL = 2.0 # Seconds between scans of the data files (stdlib only, so polling rather than inotify)
+
+# Entries whose new object loads more on first use; primed before the swap so the
+# first request after a reload is not a cold one
+_PRIMERS = {
+    "smart_dashboard": lambda dashboard: dashboard.get_location_options(),
+}
+
+_thread = None
+_stop = threading.Event()
+_guard = threading.Lock()
+# Serializes check(): one rebuild pass at a time
+_check_lock = threading.Lock()
+# Snapshot of the files behind the active version, and the last one seen by a poll
+_active = None
+_seen = None
+_failed = None
+_version = {}
+
+
+def snapshot():
+    """Fingerprint of the existing files in data/ and behind the registry entries."""
+    paths = set()
+    try:
+        with os.scandir(DATA_DIR) as entries:
+            paths.update(e.path for e in entries if e.is_file() and not e.name.startswith("."))
+    except OSError:
+        pass
+    paths.update(registry.source_paths())
+    return tuple(f for f in registry.fingerprint(sorted(paths)) if f[1] is not None)
+
+
+def _activate(current, rebuilt=(), seconds=0.0):
+    global _active, _version
+    _active = current
+    _version = {
+        "id": hashlib.sha1(repr(current).encode("utf-8")).hexdigest()[:12],
+        "number": _version.get("number", 0) + 1,
+        "activated": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "rebuilt": list(rebuilt),
+        "rebuild_seconds": seconds,
+        "files": len(current),
+    }
+
+
+def start(interval=POLL_INTERVAL):
+    """
+    Start watching the data files once per process (later calls are ignored).
+    Changed files are rebuilt in the background and swapped in by check().
+    """
+    global _thread
+    with _guard:
+        if _thread is not None or not ENABLED:
+            return
+        _activate(snapshot())
+        registry.serve_stale(True)
+        _stop.clear()
+        _thread = threading.Thread(target=_run, args=(interval,), name="hot-reload", daemon=True)
+        _thread.start()
+
+
+def stop():
+    global _thread
+    with _guard:
+        if _thread is None:
+            return
+        _stop.set()
+        _thread.join()
+        _thread = None
+        registry.serve_stale(False)
+
+
+def _run(interval):
+    while not _stop.wait(interval):
+        try:
+            check()
+        except Exception as e:
+            print(f"Error reloading data: {e}")
+
+
+def check(settle=True):
+    """
+    One poll: when the data files changed, rebuild the stale registry entries
+    and swap them in. With `settle`, a change is acted on only once the files
+    look the same on two consecutive polls, so a file still being copied is
+    never parsed half-written.
+    :return: Names of the entries swapped in
+    """
+    global _seen, _failed
+    with _check_lock:
+        current = snapshot()
+        if current == _active or current == _failed:
+            _seen = current
+            return []
+        if settle and current != _seen:
+            _seen = current
+            return []
+        _seen = current
+
+        started = time.perf_counter()
+        try:
+            rebuilt = registry.rebuild(registry.stale(), prime=_prime)
+        except Exception as e:
+            # Keep serving the previous version until the files change again
+            print(f"Error rebuilding data version: {e}")
+            _failed = current
+            return []
+        _activate(current, rebuilt, time.perf_counter() - started)
+
+    if {"crop_recommender", "fertilizer_recommender", "smart_dashboard", "region_index"} & set(rebuilt):
+        # Fresh objects start with empty result caches
+        from modules import result_cache
+        try:
+            result_cache.warm()
+        except Exception as e:
+            print(f"Error warming result cache: {e}")
+    return rebuilt
+
+
+def _prime(name, value):
+    primer = _PRIMERS.get(name)
+    if primer is not None:
+        primer(value)
+
+
+def report():
+    """Active data version: id (hash of the file fingerprints), number, when and what was rebuilt."""
+    return {
+        "watching": _thread is not None and _thread.is_alive(),
+        "pending": _seen is not None and _seen != _active and _seen != _failed,
+        **_version,
+    }
@@ -0,0 +1,243 @@
+import bisect
+import cProfile
+import collections
+import functools
+import hmac
+import io
+import os
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# AGRISENSA_METRICS=0 turns instrumentation off at import: decorators then return
+# the undecorated function, so disabled metrics cost nothing on the hot paths
+ENABLED = os.environ.get("AGRISENSA_METRICS", "1") != "0"
+# Fraction of page requests profiled with cProfile (0 = only when asked per request)
+PROFILE_SAMPLE_RATE = float(os.environ.get("AGRISENSA_PROFILE_RATE", "0"))
+PROFILE_KEEP = 20 # Most recent profiles kept for the admin page
+PROFILE_TOP = 25 # Functions listed per profile
+
+# Upper bounds (seconds) of the latency histogram buckets, Prometheus style
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = "agrisensa"
+# ?admin=<token> opens the metrics page in the Streamlit app and ?profile=<token>
+# profiles one rerun; unset (the default) keeps both off
+ADMIN_TOKEN = os.environ.get("AGRISENSA_ADMIN_TOKEN") or None
+
+_enabled = ENABLED
+
+
+class Histogram:
+    """Call latencies of one function: bucket counts, sum, count and errors."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1) # last = +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, error=False):
+        i = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            self.buckets[i] += 1
+            self.sum += seconds
+            self.count += 1
+            if error:
+                self.errors += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding quantile `q` (None without calls)."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(LATENCY_BUCKETS + (float("inf"),), self.buckets):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+_histograms = {}
+# cache name -> [hits, misses]
+_cache = {}
+_guard = threading.Lock()
+_profiles = collections.deque(maxlen=PROFILE_KEEP)
+_profile_lock = threading.Lock() # cProfile cannot run twice at once in one process
+
+
+def _histogram(name):
+    h = _histograms.get(name)
+    if h is None:
+        with _guard:
+            h = _histograms.setdefault(name, Histogram())
+    return h
+
+
+def enable(flag=True):
+    """Switch recording on/off at runtime (functions decorated while disabled stay bare)."""
+    global _enabled
+    _enabled = flag
+
+
+def is_enabled():
+    return _enabled
+
+
+def timed(name=None):
+    """Decorator recording the call latency (and exceptions) of a function under `name`."""
+    def decorate(func):
+        if not ENABLED:
+            return func
+        key = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                _histogram(key).observe(time.perf_counter() - started, error=True)
+                raise
+            _histogram(key).observe(time.perf_counter() - started)
+            return result
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def timer(name):
+    """Context manager counterpart of timed()."""
+    if not _enabled:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        _histogram(name).observe(time.perf_counter() - started, error=True)
+        raise
+    _histogram(name).observe(time.perf_counter() - started)
+
+
+def rows(name, n):
+    """Add `n` rows scanned to the metric `name` (usually the timed function's)."""
+    if _enabled:
+        h = _histogram(name)
+        with h._lock:
+            h.rows += int(n)
+
+
+def cache(name, hit):
+    """Count a cache lookup for `name` (e.g. a registry entry kind)."""
+    if _enabled:
+        with _guard:
+            _cache.setdefault(name, [0, 0])[0 if hit else 1] += 1
+
+
+@contextmanager
+def profile(name, force=False):
+    """
+    Run the block under cProfile when `force` is set (per-request opt-in) or
+    for a PROFILE_SAMPLE_RATE share of calls; otherwise just run it. Profiles
+    are kept in a small ring buffer, see profiles().
+    """
+    sampled = force or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+    if not sampled or not _profile_lock.acquire(blocking=False):
+        yield
+        return
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _profile_lock.release()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        _profiles.appendleft({
+            "name": name,
+            "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "seconds": time.perf_counter() - started,
+            "stats": out.getvalue(),
+        })
+
+
+def is_admin(token):
+    """True when `token` matches AGRISENSA_ADMIN_TOKEN (always False if unset)."""
+    if ADMIN_TOKEN is None or not token:
+        return False
+    return hmac.compare_digest(str(token).encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+
+def profiles():
+    return list(_profiles)
+
+
+def reset():
+    _histograms.clear()
+    _cache.clear()
+    _profiles.clear()
+
+
+def snapshot():
+    """All metrics as a JSON-ready dict."""
+    functions = {}
+    for name, h in sorted(list(_histograms.items())):
+        functions[name] = {
+            "count": h.count,
+            "errors": h.errors,
+            "sum_seconds": h.sum,
+            "mean_ms": h.sum / h.count * 1000 if h.count else None,
+            "p50_ms_le": _ms(h.quantile(0.5)),
+            "p99_ms_le": _ms(h.quantile(0.99)),
+            "rows_scanned": h.rows,
+            "buckets": dict(zip([str(b) for b in LATENCY_BUCKETS] + ["+Inf"], h.buckets)),
+        }
+    caches = {
+        name: {"hits": hits, "misses": misses, "hit_ratio": hits / (hits + misses) if hits + misses else None}
+        for name, (hits, misses) in sorted(list(_cache.items()))
+    }
+    return {"enabled": _enabled, "functions": functions, "caches": caches}
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+
+def prometheus_text():
+    """All metrics in the Prometheus text exposition format."""
+    lines = [
+        f"# HELP {PREFIX}_call_seconds Latency of instrumented functions and pages.",
+        f"# TYPE {PREFIX}_call_seconds histogram",
+    ]
+    items = sorted(list(_histograms.items()))
+    for name, h in items:
+        label = _label(name)
+        cumulative = 0
+        for bound, n in zip(LATENCY_BUCKETS, h.buckets):
+            cumulative += n
+            lines.append(f'{PREFIX}_call_seconds_bucket{{fn="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'{PREFIX}_call_seconds_bucket{{fn="{label}",le="+Inf"}} {h.count}')
+        lines.append(f'{PREFIX}_call_seconds_sum{{fn="{label}"}} {h.sum}')
+        lines.append(f'{PREFIX}_call_seconds_count{{fn="{label}"}} {h.count}')
+    lines += [f"# HELP {PREFIX}_call_errors_total Calls that raised.", f"# TYPE {PREFIX}_call_errors_total counter"]
+    lines += [f'{PREFIX}_call_errors_total{{fn="{_label(name)}"}} {h.errors}' for name, h in items]
+    lines += [f"# HELP {PREFIX}_rows_scanned_total Rows scanned.", f"# TYPE {PREFIX}_rows_scanned_total counter"]
+    lines += [f'{PREFIX}_rows_scanned_total{{fn="{_label(name)}"}} {h.rows}' for name, h in items if h.rows]
+    lines += [f"# HELP {PREFIX}_cache_requests_total Cache lookups.", f"# TYPE {PREFIX}_cache_requests_total counter"]
+    for name, (hits, misses) in sorted(list(_cache.items())):
+        lines.append(f'{PREFIX}_cache_requests_total{{cache="{_label(name)}",result="hit"}} {hits}')
+        lines.append(f'{PREFIX}_cache_requests_total{{cache="{_label(name)}",result="miss"}} {misses}')
+    return "\n".join(lines) + "\n"
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -1,6 +1,8 @@
 import pandas as pd
 import os
 import numpy as np
+import threading
+from modules import data_cache, dose_optimizer, frames, metrics, region_index, result_cache, scaling, spatial_index, streaming
 
 # Resolve paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -9,61 +11,414 @@ CROP_DATA_PATH = os.path.join(DATA_DIR, "crop_recommendation.csv")
 FERT_DATA_PATH = os.path.join(DATA_DIR, "fertilizer_recommendation.csv")
 REAL_FERT_DATA_PATH = os.path.join(DATA_DIR, "dataset_untuk_rekomendasi_pupuk.csv")
 
+CROP_FEATURES = ['Nitrogen (N)', 'Fosforus (P)', 'Kalium (K)', 'Suhu', 'Kelembaban', 'pH', 'Curah Hujan']
+CROP_NEIGHBORS = 20 # Closest rows that vote on the label
+CROP_WEIGHTS = None # Per-feature weights after scaling, in CROP_FEATURES order (None = equal)
+# Rounding of get_recommendation inputs for its result cache, in CROP_FEATURES order
+CROP_CACHE_DECIMALS = (0, 0, 0, 1, 1, 2, 1)
+
+# Upper bound on query x row distance elements materialized per batch chunk
+BATCH_CHUNK_ELEMENTS = 4_000_000
+# Slack, in units of the exact-distance dtype's epsilon, within which matrix-product
+# distances are re-checked exactly before ranking
+GEMM_TIE_ULPS = 64
+
+SOIL_FEATURES = ['Soil_pH', 'Soil_N_index', 'Soil_P_index', 'Soil_K_index']
+DOSE_COLUMNS = ['Pupuk_Urea_kgHa', 'Pupuk_SP36_kgHa', 'Pupuk_KCl_kgHa']
+# Kept float64 in the shared history frame so nearest-neighbour distances (and ties) stay exact
+HISTORY_FLOAT64_COLUMNS = ['Soil_pH']
+SOIL_NEIGHBORS = 5 # Closest historical fields averaged for a dose recommendation
+SOIL_WEIGHTS = None # Per-feature weights after scaling, in SOIL_FEATURES order (None = equal)
+# Rounding of (n, p, k, ph) for the get_data_driven_recommendation result cache
+SOIL_CACHE_DECIMALS = (0, 0, 0, 2)
+
+# 'standard' (mean/std) or 'minmax'; stats are fitted once and persisted in the data cache
+SCALING_METHOD = "standard"
+
+# Per-crop targets used by calculate_needs, in the order of the target matrix
+TARGET_COLUMNS = ['Nitrogen (N)', 'Fosforus (P)', 'Kalium (K)', 'pH']
+PH_TOLERANCE = 0.5 # pH within target +/- this is considered fine
+# Rounding of (crop, n, p, k, ph) for the calculate_needs result cache (None = exact)
+NEEDS_CACHE_DECIMALS = (None, 1, 1, 1, 2)
+
+# Coded advice: bit flags combined per sample
+ADVICE_N = 1
+ADVICE_P = 2
+ADVICE_K = 4
+ADVICE_PH_LOW = 8
+ADVICE_PH_HIGH = 16
+ADVICE_UNKNOWN_CROP = 32
+ADVICE_FLAG_LABELS = {
+    ADVICE_N: "N", ADVICE_P: "P", ADVICE_K: "K",
+    ADVICE_PH_LOW: "pH rendah", ADVICE_PH_HIGH: "pH tinggi", ADVICE_UNKNOWN_CROP: "tanaman tidak dikenal",
+}
+# Short label for every advice code, so a whole column is labelled by one take()
+ADVICE_LABELS = np.array([
+    ", ".join(label for flag, label in ADVICE_FLAG_LABELS.items() if code & flag) or "optimal"
+    for code in range(64)
+], dtype=object)
+
+# Soil grid CSVs for calculate_needs_csv: N/P/K/pH readings, optional per-row crop column
+GRID_COLUMNS = ['N', 'P', 'K', 'pH']
+GRID_CROP_COLUMN = 'Tanaman'
+GRID_CHUNK_ROWS = 200_000
+
+def _top_labels(neighbor_codes, n_labels, top_n=3):
+    """
+    Majority vote over neighbour label codes, one row per query.
+    Ties are broken by which label appears first (i.e. closest), so a single
+    query gives the same answer through the scalar and the batch path.
+    """
+    m, k = neighbor_codes.shape
+    rows = np.repeat(np.arange(m), k)
+    flat = rows * n_labels + neighbor_codes.ravel()
+    counts = np.bincount(flat, minlength=m * n_labels).reshape(m, n_labels)
+    
+    first_seen = np.full(m * n_labels, k)
+    np.minimum.at(first_seen, flat, np.tile(np.arange(k), m))
+    first_seen = first_seen.reshape(m, n_labels)
+    
+    score = counts * (k + 1) - first_seen
+    ranked = np.argsort(-score, axis=1, kind='stable')[:, :top_n]
+    present = np.take_along_axis(counts, ranked, axis=1) > 0
+    return ranked, present
+
+def _gemm_knn(queries, matrix, sq_norms, k, out=None):
+    """
+    k nearest rows of `matrix` for every query, from one matrix product.
+    Squared distances are ||a||^2 + ||b||^2 - 2ab; every row within rounding
+    slack of the k-th of them is then re-measured exactly in `matrix`'s dtype
+    and ranked by (distance, row), so results match a direct scan, ties included.
+    :param queries: (m, d) float64, already scaled
+    :param sq_norms: float64 squared norms of the matrix rows
+    :param out: Optional (>= m, n) float64 buffer for the distances
+    :return: (m, k) row indices, closest first
+    """
+    m, n = len(queries), len(matrix)
+    k = min(k, n)
+    q_sq = np.einsum('ij,ij->i', queries, queries)
+    distances = np.matmul(queries, matrix.T.astype(np.float64, copy=False), out=None if out is None else out[:m])
+    distances *= -2.0
+    distances += sq_norms[None, :]
+    distances += q_sq[:, None]
+    
+    kth = np.partition(distances, k - 1, axis=1)[:, k - 1]
+    slack = GEMM_TIE_ULPS * np.finfo(matrix.dtype).eps * (q_sq + sq_norms.max() + 1.0)
+    query_idx, rows = np.nonzero(distances <= (kth + slack)[:, None])
+    
+    # Exact distances for the candidates only, in the same precision as a direct scan
+    diff = matrix[rows] - queries[query_idx].astype(matrix.dtype)
+    exact = np.einsum('ij,ij->i', diff, diff)
+    order = np.lexsort((rows, exact, query_idx))
+    query_idx, rows = query_idx[order], rows[order]
+    
+    # First k candidates of every query (each has at least k)
+    starts = np.searchsorted(query_idx, np.arange(m))
+    return rows[starts[:, None] + np.arange(k)[None, :]]
+
 class CropRecommender:
-    def __init__(self):
+    """
+    Nearest-neighbour crop recommender.
+
+    All scoring state is built once in the constructor and never mutated
+    afterwards, so a single instance can be shared by every Streamlit
+    session and called concurrently from a thread pool.
+    """
+
+    def __init__(self, weights=CROP_WEIGHTS, scaling_method=SCALING_METHOD):
+        self.index = None
+        self.scaler = None
+        self.features = np.empty((0, len(CROP_FEATURES)), dtype=np.float32)
+        self.scaled = self.features
+        self.scaled_sq = np.empty(0)
+        self.label_codes = np.empty(0, dtype=np.int32)
+        self.labels = np.empty(0, dtype=object)
+        # Per-thread distance buffers for the batch path
+        self._local = threading.local()
+        
         if os.path.exists(CROP_DATA_PATH):
-            self.df = pd.read_csv(CROP_DATA_PATH)
+            # Shared compact frame: 'Label' as crop codes, float32 measurements
+            self.df = frames.load_table(CROP_DATA_PATH)
             # Rename columns to standard internal names if necessary
             # Expected: Nitrogen (N), Fosforus (P), Kalium (K), Suhu, Kelembaban, pH, Curah Hujan, Label
+            
+            # Contiguous float32 feature matrix and integer label codes used for all scoring
+            self.features = data_cache.load_matrix(CROP_DATA_PATH, CROP_FEATURES, df=self.df)
+            codes, labels = pd.factorize(self.df['Label'])
+            self.label_codes = codes.astype(np.int32)
+            self.labels = labels.to_numpy(dtype=object)
+            
+            # Standardize so rainfall (0-300) does not drown out pH (0-14); the scaled
+            # matrix is precomputed so queries only pay for scaling their own vector
+            self.scaler = scaling.load_or_fit(CROP_DATA_PATH, self.features, CROP_FEATURES, scaling_method, weights)
+            self.scaled = self.scaler.transform(self.features)
+            # Row norms for the matrix-product distances of the batch path
+            self.scaled_sq = np.einsum('ij,ij->i', self.scaled.astype(np.float64), self.scaled.astype(np.float64))
+            for arr in (self.features, self.scaled, self.scaled_sq, self.label_codes, self.labels):
+                arr.flags.writeable = False
+            
+            # KD-tree over the scaled features, persisted in the data cache so restarts skip the build
+            self.index = spatial_index.load_or_build(CROP_DATA_PATH, self.scaled, key=self.scaler.cache_key())
         else:
             self.df = pd.DataFrame()
+        
+        # Typical N/P/K per soil-index level, for inputs taken from region_index
+        self.npk_levels = region_index.npk_levels(self.features)
 
+    def _scratch(self, rows):
+        """Thread-local distance buffer sized for `rows` queries, reused across calls."""
+        buffer = getattr(self._local, 'distances', None)
+        if buffer is None or buffer.shape[0] < rows:
+            buffer = np.empty((rows, len(self.scaled)), dtype=np.float64)
+            self._local.distances = buffer
+        return buffer
+
+    @result_cache.memoize("crop_recommendation", lambda: [CROP_DATA_PATH], CROP_CACHE_DECIMALS)
+    @metrics.timed()
     def get_recommendation(self, n, p, k, temp, humidity, ph, rainfall):
         """
         Find top 3 recommendations based on nearest neighbor (Euclidean distance) of normalized features.
         """
-        if self.df.empty:
+        if len(self.features) == 0:
             return []
 
-        # Feature columns
-        features = ['Nitrogen (N)', 'Fosforus (P)', 'Kalium (K)', 'Suhu', 'Kelembaban', 'pH', 'Curah Hujan']
-        
-        # Prepare input vector
-        input_vector = np.array([n, p, k, temp, humidity, ph, rainfall])
+        # Prepare input vector in the same scaled space as the dataset
+        input_vector = self.scaler.transform([n, p, k, temp, humidity, ph, rainfall])
         
-        # Calculate distance for every row (Simplified KNN-1 approach per label, 
-        # but here we just find closest rows and aggregate unique labels)
+        # The KD-tree answers the k-NN query without scanning every row
+        _, nearest = self.index.query(input_vector, k=CROP_NEIGHBORS)
         
-        # 1. Normalize dataset to avoid bias (simple min-max scaling relative to input range could work, 
-        # but typically we should standardize. For simplicity in this demo, we compute raw distance
-        # or we can assume the data ranges are somewhat comparable or weight them).
-        # Let's use raw distance for now as standardizing requires persisting scaler stats.
+        # Count frequency of labels in top matches
+        ranked, present = _top_labels(self.label_codes[nearest][None, :], len(self.labels))
+        recommendations = self.labels[ranked[0][present[0]]].tolist()
         
-        # Vectorized Euclidean Distance
-        data_vectors = self.df[features].values
-        distances = np.linalg.norm(data_vectors - input_vector, axis=1)
+        return recommendations
+
+    @metrics.timed()
+    def get_batch_recommendation(self, samples):
+        """
+        Top 3 recommendations for many soil samples in one vectorized pass.
+        :param samples: DataFrame with the CROP_FEATURES columns, or an (m, 7) array in that order
+        :return: List of label lists, one per input row
+        """
+        if isinstance(samples, pd.DataFrame):
+            missing = [c for c in CROP_FEATURES if c not in samples.columns]
+            if missing:
+                raise ValueError(f"Missing columns: {', '.join(missing)}")
+            samples = samples[CROP_FEATURES].to_numpy(dtype=np.float64)
+        else:
+            samples = np.asarray(samples, dtype=np.float64)
+            if samples.ndim != 2 or samples.shape[1] != len(CROP_FEATURES):
+                raise ValueError(f"Expected an (m, {len(CROP_FEATURES)}) array")
         
-        self.df['distance'] = distances
+        if len(self.features) == 0 or len(samples) == 0:
+            return [[] for _ in range(len(samples))]
         
-        # Get top matches
-        top_matches = self.df.sort_values('distance').head(20) # Look at top 20 closest points
+        # Scaled exactly as the stored rows were, then widened for the matrix product
+        samples = self.scaler.transform(samples).astype(np.float64)
+        chunk = max(1, min(len(samples), BATCH_CHUNK_ELEMENTS // len(self.scaled)))
+        distances = self._scratch(chunk)
         
-        # Count frequency of labels in top matches
-        recommendations = top_matches['Label'].value_counts().head(3).index.tolist()
+        results = []
+        for start in range(0, len(samples), chunk):
+            # All distances of the chunk in one BLAS pass over the dataset
+            nearest = _gemm_knn(samples[start:start + chunk], self.scaled, self.scaled_sq, CROP_NEIGHBORS, out=distances)
+            metrics.rows("modules.recommender.CropRecommender.get_batch_recommendation", len(nearest) * len(self.scaled))
+            
+            ranked, present = _top_labels(self.label_codes[nearest], len(self.labels))
+            names = self.labels[ranked]
+            results.extend(row[mask].tolist() for row, mask in zip(names, present))
         
-        return recommendations
+        return results
 
 class FertilizerRecommender:
-    def __init__(self):
+    def __init__(self, weights=SOIL_WEIGHTS, scaling_method=SCALING_METHOD):
         if os.path.exists(FERT_DATA_PATH):
-            self.df = pd.read_csv(FERT_DATA_PATH)
+            # Targets keep full precision, they are printed back in the advice
+            self.df = frames.load_table(FERT_DATA_PATH, keep=TARGET_COLUMNS)
         else:
             self.df = pd.DataFrame()
             
-        if os.path.exists(REAL_FERT_DATA_PATH):
-            self.real_df = pd.read_csv(REAL_FERT_DATA_PATH)
+        # Large histories are never loaded whole; _build_soil_index streams them instead
+        if os.path.exists(REAL_FERT_DATA_PATH) and not streaming.should_stream(REAL_FERT_DATA_PATH):
+            self.real_df = frames.load_table(REAL_FERT_DATA_PATH, keep=HISTORY_FLOAT64_COLUMNS)
         else:
             self.real_df = pd.DataFrame()
+        
+        self._build_crop_targets()
+        self._build_soil_index(weights, scaling_method)
+
+    def _build_crop_targets(self):
+        """
+        Crop -> row of a (crops, 4) N/P/K/pH target matrix, first row per crop
+        as calculate_needs always used.
+        """
+        self.crop_codes = {}
+        self.crop_targets = np.empty((0, len(TARGET_COLUMNS)))
+        if self.df.empty or 'Tanaman' not in self.df.columns:
+            return
+        
+        first = self.df.drop_duplicates('Tanaman', keep='first')
+        self.crop_codes = {crop: i for i, crop in enumerate(first['Tanaman'])}
+        self.crop_targets = first[TARGET_COLUMNS].to_numpy(dtype=np.float64)
+        self.crop_targets.flags.writeable = False
+
+    def _build_soil_index(self, weights, scaling_method):
+        """
+        Precompute everything get_data_driven_recommendation needs: the cleaned
+        soil matrix, the dose columns, a KD-tree, and an exact (N, P, K) lookup.
+        For streamed histories the scaled matrix, its row norms and the KD-tree
+        points are written chunk by chunk to memory-mapped files as well. What
+        still grows with the row count in memory is the (N, P, K) lookup (row
+        order and scaled pH, 16 bytes per row) plus a few int64/float64 sort
+        keys per row while building; no full copy of the matrix is made.
+        """
+        self.soil_matrix = np.empty((0, len(SOIL_FEATURES)))
+        self.soil_scaled = self.soil_matrix
+        self.soil_sq = np.empty(0)
+        self.doses = np.empty((0, len(DOSE_COLUMNS)))
+        self.soil_scaler = None
+        self.soil_index = None
+        self._npk_groups = {}
+        
+        loaded = self._load_soil_history()
+        if loaded is None:
+            return
+        self.soil_matrix, self.doses = loaded
+        on_disk = isinstance(self.soil_matrix, np.memmap)
+        # Long (streamed) matrices are fitted from running chunk statistics
+        self.soil_scaler = scaling.load_or_fit(REAL_FERT_DATA_PATH, self.soil_matrix, SOIL_FEATURES, scaling_method, weights)
+        scaler_key = self.soil_scaler.cache_key()
+        if on_disk:
+            self.soil_scaled = streaming.transform_matrix(
+                REAL_FERT_DATA_PATH, "soil_scaled", self.soil_matrix,
+                lambda rows: self.soil_scaler.transform(rows, dtype=np.float64), len(SOIL_FEATURES), key=scaler_key
+            )
+            self.soil_sq = streaming.transform_matrix(
+                REAL_FERT_DATA_PATH, "soil_sq", self.soil_scaled,
+                lambda rows: np.einsum('ij,ij->i', rows, rows), 1, key=scaler_key
+            )[:, 0]
+        else:
+            self.soil_scaled = self.soil_scaler.transform(self.soil_matrix, dtype=np.float64)
+            self.soil_sq = np.einsum('ij,ij->i', self.soil_scaled, self.soil_scaled)
+        for arr in (self.soil_matrix, self.soil_scaled, self.soil_sq, self.doses):
+            if arr.flags.writeable:
+                arr.flags.writeable = False
+        self.soil_index = spatial_index.load_or_build(
+            REAL_FERT_DATA_PATH, self.soil_scaled, name="soil_kdtree", key=scaler_key, mmap=on_disk
+        )
+        
+        # The N/P/K indices are small integers, so rows sharing an exact (N, P, K)
+        # differ only in pH. Grouping them with pH sorted lets most queries be
+        # answered by a binary search inside one group.
+        packed = self._pack_npk()
+        if packed is None:
+            return
+        keys, lo, widths = packed
+        order = np.lexsort((self.soil_matrix[:, 0], keys))
+        group_keys, starts = np.unique(keys[order], return_index=True)
+        del keys
+        ends = np.append(starts[1:], len(order))
+        self._npk_order = order
+        self._npk_ph = self.soil_scaled[order, 0]
+        # Any row outside a group differs by >= 1 in some index, i.e. is at least
+        # this far away in scaled space
+        self._npk_min_step = float(np.abs(self.soil_scaler.factor[1:]).min())
+        self._npk_groups = {
+            self._unpack_npk(key, lo, widths): (s, e) for key, s, e in zip(group_keys.tolist(), starts, ends)
+        }
+
+    def _pack_npk(self):
+        """
+        (keys, lo, widths): every row's (N, P, K) packed into one int64 that sorts
+        like the triple, built chunk by chunk. None when an index is not an integer
+        (or the packed range would overflow).
+        """
+        lo = np.full(3, np.inf)
+        hi = np.full(3, -np.inf)
+        for start in range(0, len(self.soil_matrix), streaming.STREAM_CHUNK_ROWS):
+            npk = np.asarray(self.soil_matrix[start:start + streaming.STREAM_CHUNK_ROWS, 1:])
+            if not np.array_equal(npk, np.round(npk)):
+                return None
+            lo = np.minimum(lo, npk.min(axis=0))
+            hi = np.maximum(hi, npk.max(axis=0))
+        lo = lo.astype(np.int64)
+        widths = hi.astype(np.int64) - lo + 1
+        if int(widths[0]) * int(widths[1]) * int(widths[2]) >= 2 ** 62:
+            return None
+        keys = np.empty(len(self.soil_matrix), dtype=np.int64)
+        for start in range(0, len(self.soil_matrix), streaming.STREAM_CHUNK_ROWS):
+            npk = np.asarray(self.soil_matrix[start:start + streaming.STREAM_CHUNK_ROWS, 1:]).astype(np.int64) - lo
+            keys[start:start + len(npk)] = (npk[:, 0] * widths[1] + npk[:, 1]) * widths[2] + npk[:, 2]
+        return keys, lo, widths
+
+    @staticmethod
+    def _unpack_npk(key, lo, widths):
+        """(N, P, K) tuple of a packed key."""
+        rest, k = divmod(key, int(widths[2]))
+        n, p = divmod(rest, int(widths[1]))
+        return (n + int(lo[0]), p + int(lo[1]), k + int(lo[2]))
+
+    def _load_soil_history(self):
+        """
+        (soil matrix float64, doses float32) of the rows with complete soil data.
+        Small histories come from real_df; large ones are streamed in chunks into
+        memory-mapped matrices in data/.cache, so the full table never sits in memory
+        (see _build_soil_index for the per-row state that does).
+        """
+        if self.real_df.empty:
+            if not (os.path.exists(REAL_FERT_DATA_PATH) and streaming.should_stream(REAL_FERT_DATA_PATH)):
+                return None
+            header = pd.read_csv(REAL_FERT_DATA_PATH, nrows=0).columns
+            if any(c not in header for c in SOIL_FEATURES + DOSE_COLUMNS):
+                return None
+            matrices = streaming.stream_matrices(
+                REAL_FERT_DATA_PATH,
+                {"soil": (SOIL_FEATURES, np.float64), "doses": (DOSE_COLUMNS, np.float32)},
+                dropna=SOIL_FEATURES
+            )
+            soil, doses = matrices["soil"], matrices["doses"]
+        else:
+            if any(c not in self.real_df.columns for c in SOIL_FEATURES + DOSE_COLUMNS):
+                return None
+            # Drop rows with missing values in features
+            df_clean = self.real_df.dropna(subset=SOIL_FEATURES)
+            soil = np.ascontiguousarray(df_clean[SOIL_FEATURES].to_numpy(dtype=np.float64, na_value=np.nan))
+            doses = np.ascontiguousarray(df_clean[DOSE_COLUMNS].to_numpy(dtype=np.float32, na_value=np.nan))
+        
+        if len(soil) == 0:
+            return None
+        return soil, doses
+
+    def _nearest_in_group(self, n, p, k, ph):
+        """
+        Exact k-NN answered from the (N, P, K) group, or None when it cannot be.
+        Rows outside the group are at least _npk_min_step away, so the group
+        answer is exact when its k-th match is closer than that.
+        """
+        if not (float(n).is_integer() and float(p).is_integer() and float(k).is_integer()):
+            return None
+        span = self._npk_groups.get((int(n), int(p), int(k)))
+        if span is None or span[1] - span[0] < SOIL_NEIGHBORS:
+            return None
+        
+        start, end = span
+        ph = self.soil_scaler.transform([ph, 0, 0, 0], dtype=np.float64)[0]
+        group_ph = self._npk_ph[start:end]
+        pos = np.searchsorted(group_ph, ph)
+        lo, hi = max(0, pos - SOIL_NEIGHBORS), min(len(group_ph), pos + SOIL_NEIGHBORS)
+        radius = np.sort(np.abs(group_ph[lo:hi] - ph))[SOIL_NEIGHBORS - 1]
+        if radius >= self._npk_min_step:
+            return None
+        
+        # Widen to every row within the k-th distance so ties resolve by row order
+        slack = 1e-9 * (1.0 + abs(ph))
+        lo = np.searchsorted(group_ph, ph - radius - slack, side='left')
+        hi = np.searchsorted(group_ph, ph + radius + slack, side='right')
+        dist = np.abs(group_ph[lo:hi] - ph)
+        rows = self._npk_order[start + lo:start + hi]
+        best = np.lexsort((rows, dist))[:SOIL_NEIGHBORS]
+        return rows[best]
 
     def get_crop_list(self):
         """Return list of supported crops."""
@@ -71,46 +426,32 @@ class FertilizerRecommender:
             return []
         return sorted(self.df['Tanaman'].unique().tolist())
 
+    @result_cache.memoize("fertilizer_needs", lambda: [FERT_DATA_PATH], NEEDS_CACHE_DECIMALS)
+    @metrics.timed()
     def calculate_needs(self, crop, n, p, k, ph):
         """
         Calculate nutrient deficit.
         """
-        if self.df.empty:
+        if crop not in self.crop_codes:
             return None
-            
-        # Filter by crop
-        crop_data = self.df[self.df['Tanaman'] == crop]
-        if crop_data.empty:
-            return None
-            
-        # Get target values (Average if multiple rows, though dataset seems unique per crop)
-        target = crop_data.iloc[0]
         
-        target_n = target['Nitrogen (N)']
-        target_p = target['Fosforus (P)']
-        target_k = target['Kalium (K)']
-        target_ph = target['pH']
-        
-        # Calculate Deficits (Target - Current)
-        # If Current > Target, Deficit is 0
-        def_n = max(0, target_n - n)
-        def_p = max(0, target_p - p)
-        def_k = max(0, target_k - k)
+        result = self.calculate_needs_batch(crop, [n], [p], [k], [ph])
+        target_n, target_p, target_k, target_ph = result['target'][0]
+        def_n, def_p, def_k = result['deficit'][0]
+        code = int(result['advice'][0])
         
         advice = []
         
-        if def_n > 0:
+        if code & ADVICE_N:
             advice.append(f"**Kekurangan Nitrogen ({def_n:.1f} ppm):** Gunakan Urea atau ZA.")
-        if def_p > 0:
+        if code & ADVICE_P:
             advice.append(f"**Kekurangan Fosfor ({def_p:.1f} ppm):** Gunakan SP-36 atau TSP.")
-        if def_k > 0:
+        if code & ADVICE_K:
             advice.append(f"**Kekurangan Kalium ({def_k:.1f} ppm):** Gunakan KCl atau ZK.")
-            
-        if abs(ph - target_ph) > 0.5:
-            if ph < target_ph:
-                advice.append(f"**pH Terlalu Rendah ({ph} vs {target_ph}):** Tambahkan Kapur Dolomit.")
-            else:
-                advice.append(f"**pH Terlalu Tinggi ({ph} vs {target_ph}):** Tambahkan Belerang/Sulfur.")
+        if code & ADVICE_PH_LOW:
+            advice.append(f"**pH Terlalu Rendah ({ph} vs {target_ph}):** Tambahkan Kapur Dolomit.")
+        if code & ADVICE_PH_HIGH:
+            advice.append(f"**pH Terlalu Tinggi ({ph} vs {target_ph}):** Tambahkan Belerang/Sulfur.")
                 
         if not advice:
             advice.append("✅ Kondisi tanah sudah optimal untuk tanaman ini.")
@@ -121,47 +462,163 @@ class FertilizerRecommender:
             "advice": advice
         }
 
+    @metrics.timed()
+    def calculate_needs_batch(self, crop, n, p, k, ph):
+        """
+        Vectorized calculate_needs for many soil samples at once.
+        :param crop: One crop name for every sample, or an array with one per sample
+        :param n, p, k, ph: Arrays of readings (same length)
+        :return: dict with 'target' (m, 4) N/P/K/pH, 'deficit' (m, 3) N/P/K in ppm
+                 (NaN for unknown crops) and 'advice' (m,) uint8 ADVICE_* bit flags
+        """
+        readings = np.column_stack([np.asarray(v, dtype=np.float64).ravel() for v in (n, p, k, ph)])
+        m = len(readings)
+        
+        # Crop name(s) -> row of the target matrix; -1 for unknown crops
+        if np.ndim(crop) == 0:
+            codes = np.full(m, self.crop_codes.get(crop, -1), dtype=np.intp)
+        else:
+            # One dict lookup per distinct name; the trailing -1 catches missing names (code -1)
+            names = pd.Categorical(np.asarray(crop, dtype=object).ravel())
+            lookup = np.array([self.crop_codes.get(c, -1) for c in names.categories] + [-1], dtype=np.intp)
+            codes = lookup[names.codes]
+        if len(codes) != m:
+            raise ValueError(f"Expected {m} crop names, got {len(codes)}")
+        
+        metrics.rows("modules.recommender.FertilizerRecommender.calculate_needs_batch", m)
+        known = codes >= 0
+        targets = np.full((m, len(TARGET_COLUMNS)), np.nan)
+        if len(self.crop_targets):
+            targets[known] = self.crop_targets[codes[known]]
+        
+        # Deficit = target - current, never negative
+        deficit = np.maximum(targets[:, :3] - readings[:, :3], 0)
+        
+        advice = np.zeros(m, dtype=np.uint8)
+        with np.errstate(invalid='ignore'):
+            for j, flag in enumerate((ADVICE_N, ADVICE_P, ADVICE_K)):
+                advice |= np.where(deficit[:, j] > 0, flag, 0).astype(np.uint8)
+            ph_gap = readings[:, 3] - targets[:, 3]
+            off = np.abs(ph_gap) > PH_TOLERANCE
+            advice |= np.where(off & (ph_gap < 0), ADVICE_PH_LOW, 0).astype(np.uint8)
+            advice |= np.where(off & (ph_gap > 0), ADVICE_PH_HIGH, 0).astype(np.uint8)
+        advice |= np.where(known, 0, ADVICE_UNKNOWN_CROP).astype(np.uint8)
+        
+        return {"target": targets, "deficit": deficit, "advice": advice}
+
+    @metrics.timed()
+    def calculate_needs_csv(self, source, destination, crop=None, chunksize=GRID_CHUNK_ROWS, optimizer=None):
+        """
+        Stream a soil grid CSV through calculate_needs_batch in bounded memory.
+        Input needs GRID_COLUMNS and either a GRID_CROP_COLUMN column or `crop`;
+        output is the input plus Def_N/Def_P/Def_K, Advice_Code and Advice columns.
+        :param source: Path or file-like object to read
+        :param destination: Path or text file-like object to write
+        :param optimizer: Optional DoseOptimizer; adds a 'Dosis_kgHa: <product>' column per product
+        :return: Number of rows written
+        """
+        total = 0
+        for chunk in pd.read_csv(source, chunksize=chunksize):
+            missing = [c for c in GRID_COLUMNS if c not in chunk.columns]
+            if missing:
+                raise ValueError(f"Missing columns: {', '.join(missing)}")
+            if GRID_CROP_COLUMN in chunk.columns:
+                crops = chunk[GRID_CROP_COLUMN].to_numpy(dtype=object)
+            elif crop is not None:
+                crops = crop
+            else:
+                raise ValueError(f"Missing column: {GRID_CROP_COLUMN}")
+            
+            result = self.calculate_needs_batch(crops, *(chunk[c].to_numpy() for c in GRID_COLUMNS))
+            chunk['Def_N'], chunk['Def_P'], chunk['Def_K'] = result['deficit'].T
+            chunk['Advice_Code'] = result['advice']
+            chunk['Advice'] = ADVICE_LABELS[result['advice']]
+            if optimizer is not None:
+                doses = optimizer.solve(dose_optimizer.ppm_to_kg_ha(result['deficit']))['doses']
+                for j, name in enumerate(optimizer.names):
+                    chunk[f"Dosis_kgHa: {name}"] = doses[:, j]
+            
+            chunk.to_csv(destination, mode='w' if total == 0 else 'a', header=total == 0, index=False)
+            total += len(chunk)
+        return total
+
+    @result_cache.memoize("data_driven_doses", lambda: [REAL_FERT_DATA_PATH], SOIL_CACHE_DECIMALS)
+    @metrics.timed()
     def get_data_driven_recommendation(self, n, p, k, ph):
         """
         Get recommendations based on historical successful yield data.
         Finds the closest soil matches in the dataset.
         """
-        if self.real_df.empty:
+        if len(self.soil_matrix) == 0:
             return None
             
         # Features to match: Soil_pH, Soil_N_index, Soil_P_index, Soil_K_index
         # Note: 'index' in dataset might be scaled differently than raw ppm.
         # Assuming input is raw numeric comparable to dataset or we need normalization.
-        # Let's inspect dataset values in logic (or assume raw values for now as per plan).
-        
-        # Simple Euclidean distance on soil properties
-        # Target Features
-        features = ['Soil_pH', 'Soil_N_index', 'Soil_P_index', 'Soil_K_index']
-        
-        # Drop rows with missing values in features
-        df_clean = self.real_df.dropna(subset=features)
         
-        if df_clean.empty:
-            return None
-            
-        data_matrix = df_clean[features].values
-        input_vector = np.array([ph, n, p, k])
-        
-        # Calculate distances
-        distances = np.linalg.norm(data_matrix - input_vector, axis=1)
-        
-        # Get top 5 closest matches
-        top_indices = np.argsort(distances)[:5]
-        top_matches = df_clean.iloc[top_indices]
+        # Euclidean distance on scaled soil properties, answered from the exact
+        # (N, P, K) group when possible and from the KD-tree otherwise
+        nearest = self._nearest_in_group(n, p, k, ph)
+        if nearest is None:
+            input_vector = self.soil_scaler.transform([ph, n, p, k], dtype=np.float64)
+            _, nearest = self.soil_index.query(input_vector, k=SOIL_NEIGHBORS)
         
         # Calculate average recommendation from these top matches
-        avg_urea = top_matches['Pupuk_Urea_kgHa'].mean()
-        avg_sp36 = top_matches['Pupuk_SP36_kgHa'].mean()
-        avg_kcl = top_matches['Pupuk_KCl_kgHa'].mean()
+        avg = self._average_doses(nearest)
         
         return {
-            "Urea": avg_urea,
-            "SP-36": avg_sp36,
-            "KCl": avg_kcl,
-            "match_count": len(top_matches)
+            "Urea": float(avg[0]),
+            "SP-36": float(avg[1]),
+            "KCl": float(avg[2]),
+            "match_count": len(nearest)
         }
+
+    @metrics.timed()
+    def get_data_driven_recommendation_batch(self, samples):
+        """
+        get_data_driven_recommendation for many readings at once. Readings the
+        exact (N, P, K) group answers take that shortcut; distances for all the
+        others come from one matrix product per chunk instead of one tree
+        search per reading.
+        :param samples: (m, 4) array of N, P, K, pH readings
+        :return: List of result dicts, or of None when there is no history
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        if samples.ndim != 2 or samples.shape[1] != 4:
+            raise ValueError("Expected an (m, 4) array of N, P, K, pH")
+        if len(self.soil_matrix) == 0:
+            return [None] * len(samples)
+        
+        n_neighbors = min(SOIL_NEIGHBORS, len(self.soil_matrix))
+        nearest = np.empty((len(samples), n_neighbors), dtype=np.int64)
+        rest = []
+        for i, (n, p, k, ph) in enumerate(samples.tolist()):
+            rows = self._nearest_in_group(n, p, k, ph)
+            if rows is None:
+                rest.append(i)
+            else:
+                nearest[i] = rows
+        
+        if rest:
+            # SOIL_FEATURES order: pH first
+            scaled = self.soil_scaler.transform(samples[rest][:, [3, 0, 1, 2]], dtype=np.float64)
+            chunk = max(1, BATCH_CHUNK_ELEMENTS // len(self.soil_scaled))
+            for start in range(0, len(rest), chunk):
+                block = rest[start:start + chunk]
+                nearest[block] = _gemm_knn(scaled[start:start + chunk], self.soil_scaled, self.soil_sq, SOIL_NEIGHBORS)
+                metrics.rows(
+                    "modules.recommender.FertilizerRecommender.get_data_driven_recommendation_batch",
+                    len(block) * len(self.soil_scaled)
+                )
+        
+        return [
+            {"Urea": avg[0], "SP-36": avg[1], "KCl": avg[2], "match_count": n_neighbors}
+            for avg in self._average_doses(nearest).tolist()
+        ]
+
+    def _average_doses(self, nearest):
+        """Mean dose of the matched rows (last axis of `nearest`), NaN doses skipped."""
+        top_doses = self.doses[nearest].astype(np.float64)
+        valid = ~np.isnan(top_doses)
+        with np.errstate(invalid='ignore'):
+            return np.where(valid, top_doses, 0).sum(axis=-2) / valid.sum(axis=-2)
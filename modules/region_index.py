@@ -0,0 +1,145 @@
+import os
+import numpy as np
+import pandas as pd
+from modules import data_cache
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOOKUP_PATH = os.path.join(BASE_DIR, "data", "lookup_tabel.csv")
+
+REGION_KEYS = ['Province', 'District', 'Commodity']
+# Packed per-region row, in this order
+REGION_VALUES = ['Rain_mm', 'Temp_C', 'Humidity_pct', 'Soil_pH', 'Soil_N_index', 'Soil_P_index', 'Soil_K_index',
+                 'Area_Ha', 'Prev_Yield_KgHa']
+RAIN = REGION_VALUES.index('Rain_mm')
+TEMP = REGION_VALUES.index('Temp_C')
+HUMIDITY = REGION_VALUES.index('Humidity_pct')
+PH = REGION_VALUES.index('Soil_pH')
+NPK = [REGION_VALUES.index(c) for c in ('Soil_N_index', 'Soil_P_index', 'Soil_K_index')]
+
+RAIN_MONTHS = 12 # Rain_mm is annual; the crop dataset's 'Curah Hujan' is per month
+NPK_INDEX_LEVELS = 5 # Soil indices run 1..5
+
+
+class RegionIndex:
+    """
+    (Province, District, Commodity) -> packed float32 row of REGION_VALUES.
+    All rows live in one contiguous read-only matrix and a dict maps each key
+    to its row, so a lookup is one hash probe. Built once per version of the
+    CSV and shared by every session (see registry.get_region_index).
+    """
+
+    def __init__(self, df):
+        df = df.dropna(subset=REGION_KEYS)
+        # First row wins for duplicated keys
+        df = df.drop_duplicates(REGION_KEYS, keep='first')
+        self.values = np.ascontiguousarray(df.reindex(columns=REGION_VALUES).to_numpy(dtype=np.float32, na_value=np.nan))
+        self.values.flags.writeable = False
+        keys = list(zip(*(df[c].astype(str) for c in REGION_KEYS)))
+        self._rows = {key: i for i, key in enumerate(keys)}
+
+        # Hierarchy for the pickers, in file order
+        self._districts = {}
+        self._commodities = {}
+        for province, district, commodity in keys:
+            self._districts.setdefault(province, {}).setdefault(district, None)
+            self._commodities.setdefault((province, district), []).append(commodity)
+
+        # (Province, District) -> mean row over its commodities
+        pairs = [(p, d) for p, d, _ in keys]
+        codes, uniques = pd.factorize(pd.Series(pairs, dtype=object))
+        sums = np.zeros((len(uniques), len(REGION_VALUES)))
+        np.add.at(sums, codes, np.nan_to_num(self.values))
+        counts = np.zeros((len(uniques), len(REGION_VALUES)))
+        np.add.at(counts, codes, ~np.isnan(self.values))
+        with np.errstate(invalid='ignore'):
+            self.district_values = (sums / counts).astype(np.float32)
+        self.district_values.flags.writeable = False
+        self._district_rows = {pair: i for i, pair in enumerate(uniques)}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def keys(self):
+        """(Province, District, Commodity) of every row, in the order of `values`."""
+        return list(self._rows)
+
+    def provinces(self):
+        return list(self._districts)
+
+    def districts(self, province):
+        return list(self._districts.get(province, {}))
+
+    def commodities(self, province, district):
+        return list(self._commodities.get((province, district), []))
+
+    def row(self, province, district, commodity=None):
+        """
+        Packed row of a region, or None when unknown. Without `commodity`, the
+        district's mean over its commodities.
+        """
+        if commodity is None:
+            i = self._district_rows.get((province, district))
+            return None if i is None else self.district_values[i]
+        i = self._rows.get((province, district, commodity))
+        return None if i is None else self.values[i]
+
+    def get(self, province, district, commodity=None):
+        """Row of a region as a {column: value} dict, or None."""
+        row = self.row(province, district, commodity)
+        return None if row is None else dict(zip(REGION_VALUES, row.tolist()))
+
+    def district_matrix(self, province, commodity=None):
+        """
+        Rows of every district of `province`: the `commodity` row where the
+        district has one, its commodity mean otherwise.
+        :return: (district names, (m, len(REGION_VALUES)) float32 matrix)
+        """
+        names = self.districts(province)
+        rows = np.empty((len(names), len(REGION_VALUES)), dtype=np.float32)
+        for i, district in enumerate(names):
+            row = None if commodity is None else self.row(province, district, commodity)
+            rows[i] = self.row(province, district) if row is None else row
+        return names, rows
+
+
+def load(path=LOOKUP_PATH):
+    """RegionIndex over the lookup table; empty when the file is missing or unreadable."""
+    try:
+        df = data_cache.read_csv(path) if os.path.exists(path) else pd.DataFrame(columns=REGION_KEYS)
+    except Exception as e:
+        print(f"Error loading region table: {e}")
+        df = pd.DataFrame(columns=REGION_KEYS)
+    return RegionIndex(df)
+
+
+def npk_levels(features):
+    """
+    Typical N, P, K (ppm) per soil-index level from the crop dataset's own
+    distribution: level i is the median of the i-th of NPK_INDEX_LEVELS
+    quantile bands.
+    :param features: Crop feature matrix, N/P/K in its first three columns
+    :return: (3, NPK_INDEX_LEVELS) array
+    """
+    if len(features) == 0:
+        return np.zeros((3, NPK_INDEX_LEVELS))
+    quantiles = (np.arange(NPK_INDEX_LEVELS) + 0.5) / NPK_INDEX_LEVELS
+    return np.quantile(np.asarray(features[:, :3], dtype=np.float64), quantiles, axis=0).T
+
+
+def crop_inputs(rows, levels):
+    """
+    CropRecommender inputs (CROP_FEATURES order) for packed region rows, in
+    one vectorized pass: soil indices become typical ppm, rain becomes monthly.
+    :param levels: npk_levels() of the crop dataset
+    :return: (m, 7) float64 array
+    """
+    rows = np.asarray(rows, dtype=np.float64).reshape(-1, len(REGION_VALUES))
+    idx = np.clip(np.rint(np.nan_to_num(rows[:, NPK], nan=1)) - 1, 0, NPK_INDEX_LEVELS - 1).astype(np.intp)
+    npk = np.stack([levels[j][idx[:, j]] for j in range(3)], axis=1)
+    return np.column_stack([npk, rows[:, TEMP], rows[:, HUMIDITY], rows[:, PH], rows[:, RAIN] / RAIN_MONTHS])
+
+
+def soil_inputs(rows):
+    """get_data_driven_recommendation inputs (N, P, K index, pH) for packed region rows."""
+    rows = np.asarray(rows, dtype=np.float64).reshape(-1, len(REGION_VALUES))
+    return np.column_stack([rows[:, NPK], rows[:, PH]])
@@ -0,0 +1,253 @@
+import collections
+import os
+import threading
+import time
+from modules import metrics
+
+# Process-wide cache of loaded models and datasets.
+# name -> (fingerprint of source files, loaded object)
+_entries = {}
+# One lock per name, so a slow load never blocks unrelated entries and a
+# loader may itself fetch other registry entries
+_locks = {}
+_locks_guard = threading.Lock()
+# name -> (load seconds, loading thread, perf_counter when the load finished), latest load
+_load_times = {}
+# name -> (loader, source paths), so an entry can be rebuilt without its caller
+_sources = {}
+# While set (hot reload running), an entry whose files changed keeps being served
+# until rebuild() swaps in its successor, instead of reloading on the caller's thread
+_serve_stale = False
+# Per thread: {name: (fingerprint, value)} built by the running rebuild() pass
+_local = threading.local()
+# Price lists with a cached DoseOptimizer, least recently used first
+PRICED_OPTIMIZERS = 16
+_priced = collections.OrderedDict()
+_priced_guard = threading.Lock()
+# path -> (path, mtime_ns, size) from the latest fingerprint() of that path;
+# hot_reload refreshes every data file on each poll
+_file_states = {}
+
+
+def fingerprint(paths):
+    """(path, mtime_ns, size) per source file; missing files fingerprint as None."""
+    result = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            result.append((path, st.st_mtime_ns, st.st_size))
+        except OSError:
+            result.append((path, None, None))
+    _file_states.update((f[0], f) for f in result)
+    return tuple(result)
+
+
+def last_fingerprint(paths):
+    """
+    fingerprint() as last observed. While hot reload is polling (see
+    serve_stale) this is at most one poll old and needs no stat() per call;
+    otherwise, or for a path never fingerprinted, the files are checked now.
+    """
+    if not _serve_stale:
+        return fingerprint(paths)
+    try:
+        return tuple(_file_states[path] for path in paths)
+    except KeyError:
+        return fingerprint(paths)
+
+
+def get_or_load(name, loader, paths=()):
+    """
+    Return the cached object for `name`, calling `loader()` the first time or
+    whenever one of `paths` changed on disk since it was last loaded.
+    Cached objects are shared by every caller and must be treated as read-only.
+    """
+    current = fingerprint(paths)
+    staged = getattr(_local, "staged", None)
+    if staged is not None:
+        return _load_staged(name, loader, paths, current, staged)
+    entry = _entries.get(name)
+    # Hit ratios per kind of entry ('frame', 'csv', 'search', ...)
+    kind = name.split(":", 1)[0]
+    if entry is not None and (entry[0] == current or _serve_stale):
+        metrics.cache(kind, True)
+        return entry[1]
+
+    with _lock_for(name):
+        # Another thread may have finished the load while we waited
+        entry = _entries.get(name)
+        if entry is not None and entry[0] == current:
+            metrics.cache(kind, True)
+            return entry[1]
+        metrics.cache(kind, False)
+        value = _timed_load(name, loader)
+        _entries[name] = (current, value)
+        _sources[name] = (loader, tuple(paths))
+        return value
+
+
+def _timed_load(name, loader):
+    started = time.perf_counter()
+    value = loader()
+    finished = time.perf_counter()
+    _load_times[name] = (finished - started, threading.current_thread().name, finished)
+    return value
+
+
+def _load_staged(name, loader, paths, current, staged):
+    # Inside rebuild(): unchanged entries are shared, changed ones are built once
+    # into `staged` and stay invisible to other threads until the swap
+    if name in staged:
+        return staged[name][1]
+    entry = _entries.get(name)
+    if entry is not None and entry[0] == current:
+        return entry[1]
+    value = _timed_load(name, loader)
+    staged[name] = (current, value)
+    _sources[name] = (loader, tuple(paths))
+    return value
+
+
+def serve_stale(flag=True):
+    """See _serve_stale; switched on by hot_reload.start()."""
+    global _serve_stale
+    _serve_stale = flag
+
+
+def source_paths():
+    """Every file a loaded entry depends on."""
+    return {path for _, paths in list(_sources.values()) for path in paths}
+
+
+def stale():
+    """Loaded entries whose source files changed since they were loaded."""
+    return [
+        name for name, (current, _) in list(_entries.items())
+        if name in _sources and fingerprint(_sources[name][1]) != current
+    ]
+
+
+def rebuild(names, prime=None):
+    """
+    Rebuild `names` on this thread, along with any changed entry their loaders
+    fetch, then swap every new object in with one dict update. Until then
+    callers keep getting the previous objects, which are never modified, so
+    in-flight requests see either the old or the new version of an entry.
+    :param prime: Optional prime(name, value), called on each new object before the swap
+    :return: Names of the entries swapped in
+    """
+    _local.staged = staged = {}
+    try:
+        for name in names:
+            if name in _sources:
+                loader, paths = _sources[name]
+                get_or_load(name, loader, paths)
+        if prime is not None:
+            for name, (_, value) in list(staged.items()):
+                prime(name, value)
+    finally:
+        _local.staged = None
+    _entries.update(staged)
+    return list(staged)
+
+
+def _lock_for(name):
+    with _locks_guard:
+        return _locks.setdefault(name, threading.Lock())
+
+
+def invalidate(name=None):
+    """Drop one cached entry, or everything when name is None."""
+    if name is None:
+        _entries.clear()
+        _sources.clear()
+    else:
+        _entries.pop(name, None)
+        _sources.pop(name, None)
+
+
+def is_loaded(name):
+    return name in _entries
+
+
+def load_times():
+    """
+    {name: (seconds, thread name, finished perf_counter)} of the latest load per
+    entry. Nested loads are included in their parent's time as well.
+    """
+    return dict(_load_times)
+
+
+def get_crop_recommender():
+    from modules.recommender import CropRecommender, CROP_DATA_PATH
+    return get_or_load("crop_recommender", CropRecommender, [CROP_DATA_PATH])
+
+
+def get_fertilizer_recommender():
+    from modules.recommender import FertilizerRecommender, FERT_DATA_PATH, REAL_FERT_DATA_PATH
+    return get_or_load("fertilizer_recommender", FertilizerRecommender, [FERT_DATA_PATH, REAL_FERT_DATA_PATH])
+
+
+def get_smart_dashboard():
+    from modules.smart_dashboard import SmartDashboard, PRED_DATA_PATH, REC_DATA_PATH
+    return get_or_load("smart_dashboard", SmartDashboard, [PRED_DATA_PATH, REC_DATA_PATH])
+
+
+def get_dose_optimizer(prices=None):
+    """
+    Catalogue DoseOptimizer minimizing mass, or cost for a {product: price} dict.
+    Priced optimizers are kept per price list (the latest PRICED_OPTIMIZERS of them),
+    so re-running a page with the same prices reuses the solved bases.
+    """
+    from modules import data_loader
+    from modules.dose_optimizer import DoseOptimizer
+    path = os.path.join(data_loader.DATA_DIR, "fertilizers.json")
+    if not prices:
+        return get_or_load("dose_optimizer", lambda: DoseOptimizer(data_loader.load_data("fertilizers")), [path])
+
+    prices = dict(prices)
+    name = f"dose_optimizer:{sorted((str(k), float(v)) for k, v in prices.items())!r}"
+    with _priced_guard:
+        _priced.pop(name, None)
+        _priced[name] = True
+        while len(_priced) > PRICED_OPTIMIZERS:
+            invalidate(_priced.popitem(last=False)[0])
+    return get_or_load(name, lambda: DoseOptimizer(data_loader.load_data("fertilizers"), prices), [path])
+
+
+def get_crop_batcher():
+    """Coalesces concurrent single crop queries into one CropRecommender batch call."""
+    from modules.batching import MicroBatcher
+    return get_or_load(
+        "crop_batcher",
+        lambda: MicroBatcher(lambda samples: get_crop_recommender().get_batch_recommendation(samples))
+    )
+
+
+def get_dose_batcher():
+    """Coalesces concurrent data-driven dose queries into one FertilizerRecommender batch call."""
+    from modules.batching import MicroBatcher
+    return get_or_load(
+        "dose_batcher",
+        lambda: MicroBatcher(lambda samples: get_fertilizer_recommender().get_data_driven_recommendation_batch(samples))
+    )
+
+
+def recommend_crop(query):
+    """
+    Single crop query from a page: answered from the get_recommendation
+    result cache, or through the crop batcher on a miss.
+    """
+    crop = get_crop_recommender()
+    return crop.get_recommendation.cache.get_or_compute(crop, query, get_crop_batcher().submit)
+
+
+def recommend_doses(query):
+    """Single (n, p, k, ph) dose query: result cache first, dose batcher on a miss."""
+    fert = get_fertilizer_recommender()
+    return fert.get_data_driven_recommendation.cache.get_or_compute(fert, query, get_dose_batcher().submit)
+
+
+def get_region_index():
+    from modules import region_index
+    return get_or_load("region_index", region_index.load, [region_index.LOOKUP_PATH])
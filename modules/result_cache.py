@@ -0,0 +1,214 @@
+import collections
+import functools
+import inspect
+import itertools
+import threading
+import time
+from modules import metrics, registry
+
+CACHE_SIZE = 2048 # Entries kept per cached function (least recently used go first)
+CACHE_TTL = 3600.0 # Seconds an entry stays valid
+WARM_LIMIT = 512 # Inputs pre-computed per cache by warm()
+
+# Form defaults of the Streamlit pages, the most frequent inputs of all
+CROP_DEFAULTS = [90, 42, 43, 20.8, 82.0, 6.5, 202.9]
+SOIL_DEFAULTS = [100, 100, 100, 6.5]
+NEEDS_DEFAULTS = [0, 0, 0, 6.0]
+ROI_DEFAULT_AREA = 1.0
+
+_enabled = True
+_MISS = object()
+# name -> ResultCache
+_caches = {}
+# Per-instance tokens, so an owner's entries never leak to a later object at the same id()
+_tokens = itertools.count()
+
+
+class ResultCache:
+    """
+    Bounded, thread-safe LRU/TTL cache of one function's results, keyed on
+    the owner object and the inputs rounded to `decimals`. The whole cache
+    is dropped when one of the function's source files changes on disk.
+    """
+
+    def __init__(self, name, paths, decimals, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        """
+        :param paths: Callable returning the data files the results depend on
+        :param decimals: Rounding per positional argument; None leaves it as is (e.g. names)
+        """
+        self.name = name
+        self.paths = paths
+        self.decimals = tuple(decimals)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._fingerprint = None
+        self._lock = threading.Lock()
+
+    def quantize(self, args):
+        """Inputs as the cache keys them."""
+        return tuple(
+            value if d is None or value is None else round(float(value), d)
+            for value, d in itertools.zip_longest(args, self.decimals[:len(args)])
+        )
+
+    def get(self, owner, args):
+        """Cached result for `args`, or _MISS."""
+        key = (_token(owner),) + self.quantize(args)
+        fingerprint = registry.last_fingerprint(self.paths())
+        now = time.monotonic()
+        with self._lock:
+            self._check_sources(fingerprint)
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                value = entry[1]
+            else:
+                self.misses += 1
+                value = _MISS
+        metrics.cache(f"result:{self.name}", value is not _MISS)
+        return value
+
+    def put(self, owner, args, value):
+        key = (_token(owner),) + self.quantize(args)
+        fingerprint = registry.last_fingerprint(self.paths())
+        with self._lock:
+            self._check_sources(fingerprint)
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _check_sources(self, fingerprint):
+        # Caller holds the lock; results of older data versions are dropped
+        if fingerprint != self._fingerprint:
+            self._entries.clear()
+            self._fingerprint = fingerprint
+
+    def get_or_compute(self, owner, args, compute):
+        """
+        Cached result for `args`, or `compute(args)` stored on a miss.
+        The miss runs on the exact inputs and is stored under the rounded key,
+        so later inputs within the rounding share the first caller's answer.
+        Results are shared by every caller and must be treated as read-only.
+        """
+        if not _enabled:
+            return compute(list(args))
+        value = self.get(owner, args)
+        if value is _MISS:
+            value = compute(list(args))
+            self.put(owner, args, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else None,
+        }
+
+
+def _token(owner):
+    token = owner.__dict__.get("_result_cache_token")
+    if token is None:
+        token = owner.__dict__.setdefault("_result_cache_token", next(_tokens))
+    return token
+
+
+def memoize(name, paths, decimals, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+    """
+    Method decorator caching results in a ResultCache registered as `name`
+    (also reachable as `method.cache`). Inputs rounding to the same key get
+    the answer computed for the first of them (see get_or_compute).
+    """
+    cache = _caches.setdefault(name, ResultCache(name, paths, decimals, maxsize, ttl))
+
+    def decorate(func):
+        signature = inspect.signature(func)
+        if any(p.kind not in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD) for p in signature.parameters.values()):
+            raise TypeError(f"memoize needs a fixed positional signature: {func.__qualname__}{signature}")
+        n_args = len(signature.parameters) - 1
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if kwargs or len(args) != n_args:
+                # Keyword and defaulted arguments share the positional call's key
+                bound = signature.bind(self, *args, **kwargs)
+                bound.apply_defaults()
+                args = bound.args[1:]
+            return cache.get_or_compute(self, args, lambda exact: func(self, *exact))
+        wrapper.cache = cache
+        return wrapper
+    return decorate
+
+
+def enable(flag=True):
+    """Switch result caching on/off at runtime (off: every call computes)."""
+    global _enabled
+    _enabled = flag
+
+
+def get(name):
+    return _caches[name]
+
+
+def stats():
+    """{cache name: {size, hits, misses, hit_ratio}}"""
+    return {name: cache.stats() for name, cache in sorted(_caches.items())}
+
+
+def clear():
+    for cache in _caches.values():
+        cache.clear()
+
+
+def warm(limit=WARM_LIMIT):
+    """
+    Pre-populate the caches of the registry's recommenders with the most
+    common inputs: the page defaults and the values the region pickers fill
+    in. Uses the batch methods, so this is a few vectorized calls.
+    """
+    import numpy as np
+    from modules import region_index
+    regions = registry.get_region_index()
+
+    crop = registry.get_crop_recommender()
+    cache = crop.get_recommendation.cache
+    names = regions.keys()[:limit]
+    rows = regions.values[:len(names)]
+    queries = _unique([CROP_DEFAULTS] + list(region_index.crop_inputs(rows, crop.npk_levels)), cache, limit)
+    if len(crop.features):
+        for query, result in zip(queries, crop.get_batch_recommendation(np.array(queries, dtype=np.float64))):
+            cache.put(crop, query, result)
+
+    fert = registry.get_fertilizer_recommender()
+    cache = fert.get_data_driven_recommendation.cache
+    queries = _unique([SOIL_DEFAULTS] + list(region_index.soil_inputs(rows)), cache, limit)
+    if len(fert.soil_matrix):
+        for query, result in zip(queries, fert.get_data_driven_recommendation_batch(np.array(queries, dtype=np.float64))):
+            cache.put(fert, query, result)
+
+    for crop_name in fert.get_crop_list()[:limit]:
+        fert.calculate_needs(crop_name, *NEEDS_DEFAULTS)
+
+    dashboard = registry.get_smart_dashboard()
+    if dashboard.cube is not None:
+        for province, district, commodity in names:
+            dashboard.calculate_roi(province, district, commodity, ROI_DEFAULT_AREA)
+
+
+def _unique(queries, cache, limit):
+    """The first of `queries` per cache key, exact like a caller's miss would be computed."""
+    first = {}
+    for query in queries:
+        first.setdefault(cache.quantize(query), tuple(query))
+    return list(first.values())[:limit]
@@ -0,0 +1,120 @@
+import json
+import numpy as np
+from modules import data_cache
+
+# Matrices longer than this are fitted from running statistics over row chunks
+# (one pass, no float64 copy of the whole matrix), e.g. memory-mapped histories
+FIT_CHUNK_ROWS = 250_000
+
+
+class FeatureScaler:
+    """
+    Per-column affine scaling with optional per-feature weights:
+    (x - offset) / scale * weight
+
+    Stats are fitted once on the dataset matrix and persisted in the data
+    cache; weights are configuration and are applied on every transform.
+    """
+
+    METHODS = ("standard", "minmax")
+
+    def __init__(self, offset, scale, weights=None, method="standard"):
+        self.method = method
+        self.offset = np.asarray(offset, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.weights = np.ones_like(self.offset) if weights is None else np.asarray(weights, dtype=np.float64)
+        if self.weights.shape != self.offset.shape:
+            raise ValueError(f"Expected {len(self.offset)} feature weights, got {len(self.weights)}")
+        # Folded into one multiplier so transform is a single subtract and multiply
+        self.factor = self.weights / self.scale
+
+    @classmethod
+    def fit(cls, matrix, method="standard", weights=None, chunk_rows=FIT_CHUNK_ROWS):
+        """Fit offset/scale per column of `matrix`, chunk by chunk when it is long."""
+        if method not in cls.METHODS:
+            raise ValueError(f"Unknown scaling method: {method}")
+        if len(matrix) > chunk_rows:
+            offset, scale = _chunked_stats(matrix, method, chunk_rows)
+        elif method == "standard":
+            matrix = np.asarray(matrix, dtype=np.float64)
+            offset = np.nanmean(matrix, axis=0)
+            scale = np.nanstd(matrix, axis=0)
+        else:
+            matrix = np.asarray(matrix, dtype=np.float64)
+            offset = np.nanmin(matrix, axis=0)
+            scale = np.nanmax(matrix, axis=0) - offset
+        # Constant columns carry no information; leave them unscaled
+        scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1.0)
+        return cls(offset, scale, weights, method)
+
+    def transform(self, values, dtype=np.float32):
+        """Scale a vector or (m, d) matrix in one vectorized pass."""
+        values = np.asarray(values, dtype=np.float64)
+        return np.ascontiguousarray(((values - self.offset) * self.factor).astype(dtype))
+
+    def cache_key(self):
+        """Identifies the exact transform, for naming artifacts built on scaled data."""
+        return repr((self.method, self.offset.tolist(), self.scale.tolist(), self.weights.tolist()))
+
+    def to_dict(self):
+        return {"method": self.method, "offset": self.offset.tolist(), "scale": self.scale.tolist()}
+
+
+def _chunked_stats(matrix, method, chunk_rows):
+    """
+    NaN-skipping per-column (offset, scale) of `matrix` from one pass over row
+    chunks: min/range, or mean/population std merged chunk by chunk (Chan et al.).
+    """
+    width = np.shape(matrix)[1]
+    count = np.zeros(width)
+    mean = np.zeros(width)
+    m2 = np.zeros(width)
+    lo = np.full(width, np.inf)
+    hi = np.full(width, -np.inf)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for start in range(0, len(matrix), chunk_rows):
+            chunk = np.asarray(matrix[start:start + chunk_rows], dtype=np.float64)
+            valid = ~np.isnan(chunk)
+            if method == "minmax":
+                lo = np.minimum(lo, np.where(valid, chunk, np.inf).min(axis=0))
+                hi = np.maximum(hi, np.where(valid, chunk, -np.inf).max(axis=0))
+                continue
+            n_chunk = valid.sum(axis=0)
+            mean_chunk = np.where(valid, chunk, 0).sum(axis=0) / n_chunk
+            m2_chunk = (np.where(valid, chunk - mean_chunk, 0) ** 2).sum(axis=0)
+            total = count + n_chunk
+            delta = mean_chunk - mean
+            seen = n_chunk > 0
+            mean = np.where(seen, mean + delta * n_chunk / total, mean)
+            m2 = np.where(seen, m2 + m2_chunk + delta ** 2 * count * n_chunk / total, m2)
+            count = total
+        # All-NaN columns come out NaN, as np.nanmean/np.nanmin give them
+        if method == "minmax":
+            offset = np.where(np.isfinite(lo), lo, np.nan)
+            return offset, hi - offset
+        return np.where(count > 0, mean, np.nan), np.sqrt(m2 / count)
+
+
+def load_or_fit(source_path, matrix, columns, method="standard", weights=None):
+    """
+    Return a FeatureScaler for `matrix`, reusing the stats persisted in the data
+    cache when they were fitted on the same version of `source_path`.
+    """
+    cached = data_cache.artifact_path(source_path, "scaler.json", key=repr((list(columns), method)))
+
+    if data_cache.is_fresh(source_path, cached):
+        try:
+            with open(cached, "r", encoding="utf-8") as f:
+                stats = json.load(f)
+            return FeatureScaler(stats["offset"], stats["scale"], weights, stats["method"])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error reading scaler {cached}: {e}")
+
+    scaler = FeatureScaler.fit(matrix, method, weights)
+    try:
+        payload = json.dumps(dict(scaler.to_dict(), columns=list(columns))).encode("utf-8")
+        data_cache.atomic_write(cached, lambda f: f.write(payload))
+        data_cache.mark_fresh(source_path, cached)
+    except OSError as e:
+        print(f"Could not persist scaler {cached}: {e}")
+    return scaler
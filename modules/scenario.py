@@ -0,0 +1,167 @@
+import numpy as np
+
+# Input prices and the matching per-hectare doses used for the input-cost term
+INPUT_PRICE_COLUMNS = ['InputPrice_Urea_RpKg', 'InputPrice_SP36_RpKg', 'InputPrice_KCl_RpKg']
+INPUT_DOSE_COLUMNS = ['Pupuk_Urea_kgHa', 'Pupuk_SP36_kgHa', 'Pupuk_KCl_kgHa']
+BASE_COST_COLUMNS = ['Init_Capital_RpHa', 'Maintenance_Cost_RpHa']
+
+PERCENTILES = (5, 25, 50, 75, 95)
+DEFAULT_DRAWS = 100_000
+# Relative volatility (coefficient of variation) of the commodity selling price
+PRICE_VOLATILITY = 0.2
+# Upper bound on region x draw elements materialized per chunk
+SIM_CHUNK_ELEMENTS = 4_000_000
+
+
+class ScenarioParams:
+    """
+    Per-region distribution parameters for the ROI simulation, one row per region.
+    Means/stds are per hectare; missing measures count as 0.
+    """
+
+    def __init__(self, yield_mean, yield_std, cost_mean, cost_std,
+                 input_price_mean, input_price_std, input_dose, price, price_volatility=PRICE_VOLATILITY):
+        self.yield_mean = _column(yield_mean)
+        self.yield_std = _column(yield_std)
+        self.cost_mean = _column(cost_mean)
+        self.cost_std = _column(cost_std)
+        self.input_price_mean = _matrix(input_price_mean, len(self.yield_mean))
+        self.input_price_std = _matrix(input_price_std, len(self.yield_mean))
+        self.input_dose = _matrix(input_dose, len(self.yield_mean))
+        self.price = np.broadcast_to(_column(price), self.yield_mean.shape)
+        self.price_volatility = float(price_volatility)
+
+    def __len__(self):
+        return len(self.yield_mean)
+
+    @classmethod
+    def from_stats(cls, stats_list, price, price_volatility=PRICE_VOLATILITY):
+        """
+        Build from cube location stats ({measure: (mean, std, count)} per region).
+        :param price: Selling price per kg, scalar or one per region
+        """
+        def mean_std(stats, measure):
+            mean, std, _ = stats.get(measure, (0.0, 0.0, 0))
+            return mean, std
+
+        yield_ms = np.array([mean_std(s, 'Production_KgHa') for s in stats_list], dtype=np.float64).reshape(-1, 2)
+        base = np.array([[mean_std(s, m) for m in BASE_COST_COLUMNS] for s in stats_list], dtype=np.float64).reshape(-1, len(BASE_COST_COLUMNS), 2)
+        inputs = np.array([[mean_std(s, m) for m in INPUT_PRICE_COLUMNS] for s in stats_list], dtype=np.float64).reshape(-1, len(INPUT_PRICE_COLUMNS), 2)
+        doses = np.array([[mean_std(s, m)[0] for m in INPUT_DOSE_COLUMNS] for s in stats_list], dtype=np.float64).reshape(-1, len(INPUT_DOSE_COLUMNS))
+
+        # Base cost components are treated as independent: variances add
+        cost_mean = base[:, :, 0].sum(axis=1) if len(stats_list) else np.zeros(0)
+        cost_std = np.sqrt((base[:, :, 1] ** 2).sum(axis=1)) if len(stats_list) else np.zeros(0)
+        return cls(yield_ms[:, 0], yield_ms[:, 1], cost_mean, cost_std,
+                   inputs[:, :, 0], inputs[:, :, 1], doses, price, price_volatility)
+
+
+def _column(values):
+    return np.nan_to_num(np.atleast_1d(np.asarray(values, dtype=np.float64)))
+
+
+def _matrix(values, rows):
+    values = np.nan_to_num(np.asarray(values, dtype=np.float64))
+    return values.reshape(rows, -1)
+
+
+def _lognormal(rng, mean, std, n_draws):
+    """
+    (rows, n_draws) float32 draws with the given per-row mean and std.
+    Log-normal keeps yields and prices positive; rows with mean <= 0 draw 0.
+    """
+    mean = np.asarray(mean, dtype=np.float64)
+    positive = mean > 0
+    safe_mean = np.where(positive, mean, 1.0)
+    cv = np.where(positive, np.asarray(std, dtype=np.float64) / safe_mean, 0.0)
+    sigma = np.sqrt(np.log1p(cv * cv))
+    mu = np.log(safe_mean) - 0.5 * sigma * sigma
+
+    draws = rng.standard_normal((len(mean), n_draws), dtype=np.float32)
+    draws *= sigma[:, None].astype(np.float32)
+    draws += mu[:, None].astype(np.float32)
+    np.exp(draws, out=draws)
+    draws *= positive[:, None]
+    return draws
+
+
+def _simulate_chunk(rng, params, rows, n_draws):
+    """(profit per ha, ROI %) draws for params rows `rows`, each (len(rows), n_draws)."""
+    revenue = _lognormal(rng, params.yield_mean[rows], params.yield_std[rows], n_draws)
+    revenue *= _lognormal(rng, params.price[rows], params.price[rows] * params.price_volatility, n_draws)
+
+    cost = _lognormal(rng, params.cost_mean[rows], params.cost_std[rows], n_draws)
+    # Base costs already reflect historical input prices; only the deviation from them is added
+    for j in range(params.input_dose.shape[1]):
+        dose = params.input_dose[rows, j]
+        if not dose.any():
+            continue
+        input_price = _lognormal(rng, params.input_price_mean[rows, j], params.input_price_std[rows, j], n_draws)
+        input_price -= params.input_price_mean[rows, j][:, None].astype(np.float32)
+        input_price *= dose[:, None].astype(np.float32)
+        cost += input_price
+
+    profit = revenue - cost
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roi = np.where(cost > 0, profit / cost * 100, 0).astype(np.float32)
+    return profit, roi
+
+
+def simulate(params, areas=(1.0,), n_draws=DEFAULT_DRAWS, seed=None, percentiles=PERCENTILES):
+    """
+    Monte Carlo ROI simulation for every region in `params` and every land area.
+
+    Yield, selling price, base cost and input prices are drawn per hectare; the
+    model is linear in area, so ROI and loss probability do not depend on it and
+    profit percentiles for each area are the per-hectare ones scaled, with no
+    extra draws.
+
+    :param params: ScenarioParams, one row per region
+    :param areas: Land areas in ha to sweep
+    :return: dict of arrays: roi (regions, percentiles), profit (regions, areas,
+             percentiles), expected_profit (regions, areas), prob_loss (regions,)
+    """
+    rng = np.random.default_rng(seed)
+    areas = np.atleast_1d(np.asarray(areas, dtype=np.float64))
+    n_regions = len(params)
+    q = np.asarray(percentiles, dtype=np.float64)
+
+    roi_q = np.empty((n_regions, len(q)))
+    profit_q = np.empty((n_regions, len(q)))
+    profit_mean = np.empty(n_regions)
+    prob_loss = np.empty(n_regions)
+
+    chunk = max(1, SIM_CHUNK_ELEMENTS // max(n_draws, 1))
+    for start in range(0, n_regions, chunk):
+        rows = np.arange(start, min(start + chunk, n_regions))
+        profit, roi = _simulate_chunk(rng, params, rows, n_draws)
+        roi_q[rows] = np.percentile(roi, q, axis=1).T
+        profit_q[rows] = np.percentile(profit, q, axis=1).T
+        profit_mean[rows] = profit.mean(axis=1, dtype=np.float64)
+        prob_loss[rows] = (profit < 0).mean(axis=1)
+
+    return {
+        "percentiles": q,
+        "areas": areas,
+        "roi": roi_q,
+        "profit": profit_q[:, None, :] * areas[None, :, None],
+        "expected_profit": profit_mean[:, None] * areas[None, :],
+        "prob_loss": prob_loss,
+    }
+
+
+def to_frame(result, labels):
+    """
+    Long table of a simulate() result, one row per (region, area).
+    :param labels: DataFrame with one row of identifying columns per region
+    """
+    n_regions, n_areas = result["expected_profit"].shape
+    frame = labels.loc[labels.index.repeat(n_areas)].reset_index(drop=True)
+    frame['Area_Ha'] = np.tile(result["areas"], n_regions)
+    for i, p in enumerate(result["percentiles"]):
+        frame[f"ROI_P{p:g}"] = np.repeat(result["roi"][:, i], n_areas)
+    for i, p in enumerate(result["percentiles"]):
+        frame[f"Profit_P{p:g}"] = result["profit"][:, :, i].ravel()
+    frame['Expected_Profit'] = result["expected_profit"].ravel()
+    frame['Prob_Loss'] = np.repeat(result["prob_loss"], n_areas)
+    return frame
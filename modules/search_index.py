@@ -0,0 +1,127 @@
+import bisect
+import math
+import re
+import unicodedata
+import numpy as np
+
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text):
+    """
+    Fold text for matching: Unicode compatibility forms, accents stripped,
+    lowercased, and every run of punctuation/whitespace collapsed to one space.
+    Indonesian uses the plain Latin alphabet, so this keeps "Pestisida" and
+    "pestisida," equal and turns "2,4-D" into the tokens "2 4 d".
+    """
+    if not isinstance(text, str):
+        text = "" if text is None or (isinstance(text, float) and math.isnan(text)) else str(text)
+    folded = unicodedata.normalize("NFKD", text)
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch))
+    return _NON_WORD.sub(" ", folded.lower()).strip()
+
+
+def tokenize(text):
+    return normalize(text).split()
+
+
+class InvertedIndex:
+    """
+    Token -> document postings with per-field weights and tf-idf ranking.
+
+    The vocabulary is sorted and postings are stored back to back in one
+    array, so every prefix of a token maps to a single contiguous slice.
+    """
+
+    # Matches that only share a prefix rank below whole-token matches
+    PREFIX_PENALTY = 0.5
+    # Shorter query tokens ("d" in "2,4-D") only match whole tokens
+    MIN_PREFIX_LEN = 3
+
+    def __init__(self, documents, field_weights):
+        """
+        :param documents: Iterable of dicts mapping field name -> text
+        :param field_weights: Dict of field name -> weight; other fields are ignored
+        """
+        term_docs = {}
+        n_docs = 0
+        for doc_id, doc in enumerate(documents):
+            n_docs += 1
+            for field, weight in field_weights.items():
+                for token in tokenize(doc.get(field)):
+                    per_doc = term_docs.setdefault(token, {})
+                    per_doc[doc_id] = per_doc.get(doc_id, 0.0) + weight
+
+        self.n_docs = n_docs
+        self.vocab = sorted(term_docs)
+        offsets = [0]
+        doc_ids, scores = [], []
+        for term in self.vocab:
+            postings = term_docs[term]
+            idf = math.log(1.0 + n_docs / len(postings))
+            for doc_id in sorted(postings):
+                doc_ids.append(doc_id)
+                scores.append(postings[doc_id] * idf)
+            offsets.append(len(doc_ids))
+
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.doc_ids = np.array(doc_ids, dtype=np.int32)
+        self.scores = np.array(scores, dtype=np.float32)
+
+    def __len__(self):
+        return self.n_docs
+
+    def _term_range(self, token, prefix):
+        lo = bisect.bisect_left(self.vocab, token)
+        if not prefix:
+            hi = lo + 1 if lo < len(self.vocab) and self.vocab[lo] == token else lo
+        else:
+            hi = bisect.bisect_left(self.vocab, token + "\uffff", lo)
+        return lo, hi
+
+    def _match(self, token, prefix):
+        """(doc_ids, scores) of documents matching one query token, doc_ids sorted."""
+        lo, hi = self._term_range(token, prefix)
+        if lo == hi:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+        start, end = self.offsets[lo], self.offsets[hi]
+        docs = self.doc_ids[start:end]
+        scores = self.scores[start:end].copy()
+        if prefix:
+            # Postings of the exact token (if present) sit at the start of the slice
+            exact_end = self.offsets[lo + 1] - start if self.vocab[lo] == token else 0
+            scores[exact_end:] *= self.PREFIX_PENALTY
+        if hi - lo == 1:
+            return docs, scores
+
+        # Several vocabulary terms share the prefix: merge their postings per document
+        unique_docs, inverse = np.unique(docs, return_inverse=True)
+        return unique_docs.astype(np.int32), np.bincount(inverse, weights=scores).astype(np.float32)
+
+    def search(self, query, prefix=True, limit=None):
+        """
+        Document ids matching every token of `query` (AND), best first.
+        With prefix=True each query token of MIN_PREFIX_LEN or more characters
+        also matches longer tokens it starts.
+        An empty query matches every document in original order.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            ids = np.arange(self.n_docs, dtype=np.int32)
+            return ids if limit is None else ids[:limit]
+
+        docs = scores = None
+        for token in dict.fromkeys(tokens):
+            tok_docs, tok_scores = self._match(token, prefix and len(token) >= self.MIN_PREFIX_LEN)
+            if docs is None:
+                docs, scores = tok_docs, tok_scores
+            else:
+                docs, left, right = np.intersect1d(docs, tok_docs, assume_unique=True, return_indices=True)
+                scores = scores[left] + tok_scores[right]
+            if len(docs) == 0:
+                break
+
+        # Highest score first, original document order among equal scores
+        ranked = docs[np.lexsort((docs, -scores))]
+        return ranked if limit is None else ranked[:limit]
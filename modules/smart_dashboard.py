@@ -1,77 +1,184 @@
 import streamlit as st
 import pandas as pd
 import os
+import threading
+from modules import aggregates, data_cache, frames, metrics, result_cache, scenario, streaming
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+PRED_DATA_PATH = os.path.join(DATA_DIR, 'dataset_untuk_prediksi.csv')
+REC_DATA_PATH = os.path.join(DATA_DIR, 'dataset_untuk_rekomendasi_pupuk.csv')
+
+LOCATION_LEVELS = ['Province', 'District', 'Commodity']
+# Columns coerced to numbers when the prediction history is loaded
+NUMERIC_COLUMNS = ['Production_KgHa', 'InputPrice_Urea_RpKg', 'InputPrice_SP36_RpKg', 
+                   'InputPrice_KCl_RpKg', 'Init_Capital_RpHa', 'Maintenance_Cost_RpHa',
+                   'Prev_Yield_KgHa', 'Rain_mm', 'Temp_C']
+
+# PROVISIONAL: the dataset has no selling price column, so use a standard price map for demo
+COMMODITY_PRICES = {
+    'Padi': 6000,
+    'Jagung': 4500,
+    'Kedelai': 8000,
+    'Bawang Merah': 25000,
+    'Cabai': 30000
+}
+DEFAULT_PRICE = 5000 # Default fallback (Rp/Kg)
+# Rounding of (province, district, commodity, area) for the calculate_roi result cache
+ROI_CACHE_DECIMALS = (None, None, None, 2)
+
+# Marks a lazily loaded attribute that has not been loaded yet (None is a valid value)
+_UNLOADED = object()
 
 class SmartDashboard:
     def __init__(self):
-        self.data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
-        self.pred_file = os.path.join(self.data_dir, 'dataset_untuk_prediksi.csv')
-        self.rec_file = os.path.join(self.data_dir, 'dataset_untuk_rekomendasi_pupuk.csv')
-        self.df_pred = self.load_prediction_data()
-        self.df_rec = self.load_recommendation_data()
+        self.data_dir = DATA_DIR
+        self.pred_file = PRED_DATA_PATH
+        self.rec_file = REC_DATA_PATH
+        # Histories too large for memory are streamed straight into the aggregate cube
+        self.streaming = streaming.should_stream(self.pred_file)
+        
+        # Datasets, cube and dropdown hierarchy load on first use, so opening
+        # one tab never pays for data only another tab needs
+        self._loaded = {}
+        self._lock = threading.RLock()
+
+    def _lazy(self, name, load):
+        value = self._loaded.get(name, _UNLOADED)
+        if value is _UNLOADED:
+            with self._lock:
+                value = self._loaded.get(name, _UNLOADED)
+                if value is _UNLOADED:
+                    value = load()
+                    self._loaded[name] = value
+        return value
 
-    @st.cache_data
+    @property
+    def df_pred(self):
+        return self._lazy("df_pred", lambda: pd.DataFrame() if self.streaming else self.load_prediction_data())
+
+    @property
+    def df_rec(self):
+        return self._lazy("df_rec", self.load_recommendation_data)
+
+    @property
+    def cube(self):
+        """Pre-aggregated (Province, District, Commodity, Year) statistics for ranking and ROI."""
+        return self._lazy("cube", self._load_cube)
+
+    @metrics.timed()
+    def _load_cube(self):
+        measures = self._prediction_measures()
+        # Rows appended to the CSV since the last build are folded into the cached cube
+        if self.streaming:
+            return aggregates.load_or_build_streaming(
+                self.pred_file, self._prediction_chunks, measures, appended_chunks=self._appended_chunks)
+        # df_pred is only read when the cached cube is stale and cannot be updated
+        return aggregates.load_or_build(self.pred_file, lambda: self.df_pred, measures, appended_chunks=self._appended_chunks)
+
+    def _build_hierarchy(self, frame):
+        """
+        One pass over the history (or the cube cells, which hold the same
+        locations): Province/District/Commodity as categorical codes and the
+        Province -> District dropdown map built from them.
+        """
+        self._categories = {level: [] for level in LOCATION_LEVELS}
+        self._location_options = ({}, [])
+        
+        if frame.empty or any(c not in frame.columns for c in LOCATION_LEVELS):
+            return
+        
+        codes = {}
+        for level in LOCATION_LEVELS:
+            # Categories come out sorted and NaN becomes code -1
+            cat = pd.Categorical(frame[level].astype(object))
+            codes[level] = cat.codes
+            self._categories[level] = cat.categories.tolist()
+        code_frame = pd.DataFrame(codes)
+        
+        # Province -> sorted districts, from the distinct (province, district) pairs
+        pairs = code_frame[['Province', 'District']].drop_duplicates()
+        pairs = pairs[pairs['District'] >= 0].sort_values(['Province', 'District'])
+        provinces = self._categories['Province']
+        districts = self._categories['District']
+        prov_dist_map = {prov: [] for prov in provinces}
+        for prov_code, dist_code in zip(pairs['Province'], pairs['District']):
+            if prov_code >= 0:
+                prov_dist_map[provinces[prov_code]].append(districts[dist_code])
+        self._location_options = (prov_dist_map, list(self._categories['Commodity']))
+
+
+    # The dashboard is built once per process (registry), so the loaders need no
+    # st.cache_data: its pickled copy per call would double the resident frames
+    @metrics.timed()
     def load_prediction_data(_self):
         try:
-            df = pd.read_csv(_self.pred_file)
-            # Ensure numeric columns are actually numeric
-            numeric_cols = ['Production_KgHa', 'InputPrice_Urea_RpKg', 'InputPrice_SP36_RpKg', 
-                           'InputPrice_KCl_RpKg', 'Init_Capital_RpHa', 'Maintenance_Cost_RpHa',
-                           'Prev_Yield_KgHa', 'Rain_mm', 'Temp_C']
-            for col in numeric_cols:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-            return df
+            df = data_cache.read_csv(_self.pred_file, dtype=streaming.dtypes_for(_self.pred_file))
+            metrics.rows("modules.smart_dashboard.SmartDashboard.load_prediction_data", len(df))
+            # Locations as shared codes, measurements as float32
+            return frames.compact(_coerce_numeric(df))
         except Exception as e:
             st.error(f"Error loading prediction data: {e}")
             return pd.DataFrame()
 
-    @st.cache_data
-    def load_recommendation_data(_self):
+    def _prediction_chunks(self):
+        """The prediction history as compactly typed chunks (streaming mode)."""
+        for chunk in streaming.iter_chunks(self.pred_file):
+            yield _coerce_numeric(chunk)
+
+    def _appended_chunks(self, offset):
+        """Rows of the prediction history from byte `offset` on, typed like _prediction_chunks."""
+        for chunk in streaming.iter_appended(self.pred_file, offset):
+            yield _coerce_numeric(chunk)
+
+    def _prediction_measures(self):
+        """Aggregated columns, decided from a small sample so streaming builds agree with in-memory ones."""
+        if not os.path.exists(self.pred_file):
+            return []
         try:
-            return pd.read_csv(_self.rec_file)
+            sample = pd.read_csv(self.pred_file, dtype=streaming.dtypes_for(self.pred_file), nrows=1000)
+            return aggregates.measures_of(_coerce_numeric(sample))
         except Exception as e:
+            print(f"Error reading prediction data: {e}")
+            return []
+
+    def load_recommendation_data(_self):
+        try:
+            if streaming.should_stream(_self.rec_file):
+                # Not used by the dashboard views; too large to keep in memory
+                return pd.DataFrame()
+            # Same shared frame the FertilizerRecommender uses for this file
+            from modules.recommender import HISTORY_FLOAT64_COLUMNS
+            return frames.load_table(_self.rec_file, keep=HISTORY_FLOAT64_COLUMNS)
+        except Exception:
             # Silent fallback if file missing
             return pd.DataFrame()
 
+    @metrics.timed()
     def get_productivity_stats(self, commodity):
         """
         Get productivity statistics for a specific commodity grouped by district.
         Returns: DataFrame sorted by Production_KgHa descending.
         """
-        if self.df_pred.empty:
+        if self.cube is None:
             return pd.DataFrame()
         
-        df_filtered = self.df_pred[self.df_pred['Commodity'] == commodity].copy()
-        
-        if df_filtered.empty:
-            return pd.DataFrame()
-            
-        # Group by Province & District
-        stats = df_filtered.groupby(['Province', 'District'])['Production_KgHa'].mean().reset_index()
-        stats = stats.sort_values('Production_KgHa', ascending=False)
-        return stats.head(20) # Return top 20 districts
+        # Districts ranked by mean production, precomputed in the aggregate cube
+        return self.cube.ranking(commodity, top=20) # Return top 20 districts
 
+    @result_cache.memoize("roi", lambda: [PRED_DATA_PATH], ROI_CACHE_DECIMALS)
+    @metrics.timed()
     def calculate_roi(self, province, district, commodity, land_area_ha):
         """
         Calculate potential ROI based on historical data for the region.
         """
-        if self.df_pred.empty:
+        if self.cube is None:
             return None
             
-        # Filter data
-        mask = (
-            (self.df_pred['Province'] == province) & 
-            (self.df_pred['District'] == district) & 
-            (self.df_pred['Commodity'] == commodity)
-        )
-        data = self.df_pred[mask]
-        
-        if data.empty:
+        # Use average of historical data for the region (cube lookup, no scan)
+        stats = self.cube.location_stats(province, district, commodity)
+        if stats is None:
             return None
-            
-        # Use average of historical data for the region
-        avg_data = data.mean(numeric_only=True)
+        avg_data = {measure: mean for measure, (mean, _, _) in stats.items()}
         
         yield_per_ha = avg_data.get('Production_KgHa', 0)
         
@@ -91,23 +198,21 @@ class SmartDashboard:
         # Did not see Commodity Price in the checked columns. 
         # We will estimate Revenue based on a lookup or user input if price is missing.
         # PROVISIONAL: Use a dummy price dict or prompt user. 
-        # For now, let's assume a standard price map for demo.
-        price_map = {
-            'Padi': 6000,
-            'Jagung': 4500,
-            'Kedelai': 8000,
-            'Bawang Merah': 25000,
-            'Cabai': 30000
-        }
-        price_per_kg = price_map.get(commodity, 5000) # Default fallback
+        # For now, let's assume a standard price map for demo (COMMODITY_PRICES).
+        price_per_kg = COMMODITY_PRICES.get(commodity, DEFAULT_PRICE)
         
         total_revenue = yield_per_ha * price_per_kg * land_area_ha
         total_cost = cost_per_ha * land_area_ha
         profit = total_revenue - total_cost
         roi = (profit / total_cost * 100) if total_cost > 0 else 0
         
+        # Spread of historical yields from the cube's percentile sketch
+        yield_p10, yield_p90 = self.cube.location_quantile([0.1, 0.9], province, district, commodity)
+        
         return {
             "yield_ha": yield_per_ha,
+            "yield_p10": yield_p10,
+            "yield_p90": yield_p90,
             "total_production": yield_per_ha * land_area_ha,
             "price_per_kg": price_per_kg,
             "total_revenue": total_revenue,
@@ -116,18 +221,48 @@ class SmartDashboard:
             "roi": roi
         }
 
-    def get_location_options(self):
-        """Get unique Provinces and Districts for dropdowns"""
-        if self.df_pred.empty:
-            return {}, []
+    @metrics.timed()
+    def simulate_roi(self, regions, commodity, areas, n_draws=scenario.DEFAULT_DRAWS,
+                     price_volatility=scenario.PRICE_VOLATILITY, seed=None):
+        """
+        Monte Carlo ROI distribution for several regions and land areas in one batch.
+        Yield, costs and input prices vary with each region's historical spread;
+        the selling price varies around COMMODITY_PRICES by price_volatility.
+        :param regions: List of (province, district)
+        :param areas: List of land areas (Ha)
+        :return: DataFrame with one row per (region, area): ROI/profit percentiles,
+                 expected profit and probability of loss. Regions without history are skipped.
+        """
+        if self.cube is None:
+            return pd.DataFrame()
         
-        provinces = sorted(self.df_pred['Province'].dropna().unique().tolist())
-        commodities = sorted(self.df_pred['Commodity'].dropna().unique().tolist())
+        found, stats_list = [], []
+        for province, district in regions:
+            stats = self.cube.location_stats(province, district, commodity)
+            if stats is not None:
+                found.append((province, district))
+                stats_list.append(stats)
+        if not found:
+            return pd.DataFrame()
         
-        # Map province to districts
-        prov_dist_map = {}
-        for prov in provinces:
-            dists = self.df_pred[self.df_pred['Province'] == prov]['District'].dropna().unique().tolist()
-            prov_dist_map[prov] = sorted(dists)
-            
-        return prov_dist_map, commodities
+        price = COMMODITY_PRICES.get(commodity, DEFAULT_PRICE)
+        params = scenario.ScenarioParams.from_stats(stats_list, price, price_volatility)
+        result = scenario.simulate(params, areas, n_draws=n_draws, seed=seed)
+        labels = pd.DataFrame(found, columns=['Province', 'District'])
+        labels['Commodity'] = commodity
+        return scenario.to_frame(result, labels)
+
+    @metrics.timed()
+    def get_location_options(self):
+        """Get unique Provinces and Districts for dropdowns"""
+        # The cube cells hold exactly the history's locations, so the raw rows are not needed
+        self._lazy("hierarchy", lambda: self._build_hierarchy(self.cube.cells if self.cube is not None else pd.DataFrame()))
+        return self._location_options
+
+
+def _coerce_numeric(df):
+    """Ensure numeric columns are actually numeric."""
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
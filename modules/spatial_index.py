@@ -0,0 +1,286 @@
+import heapq
+import logging
+import os
+import numpy as np
+from modules import data_cache
+
+logger = logging.getLogger(__name__)
+
+# Bump when the on-disk layout changes so stale index files are rebuilt
+INDEX_VERSION = 1
+# Rows per slice when bounds and reordered points are computed, so a large
+# (memory-mapped) input is never copied whole
+CHUNK_ROWS = 262_144
+# Arrays of a memory-mapped tree kept in their own .npy files (see load_or_build)
+MMAP_FIELDS = ('order', 'points')
+# Up to this many rows one vectorized scan of every point beats walking the
+# tree node by node in Python (about 15x faster on the 2.2k-row crop table)
+BRUTE_FORCE_ROWS = 65_536
+
+
+def _tree_dtype(data):
+    """float32 input stays float32 so the tree can share the caller's precision."""
+    return np.float32 if np.asarray(data).dtype == np.float32 else np.float64
+
+
+def _bounds(data, rows, width):
+    """Per-column (min, max) of data[rows], gathered CHUNK_ROWS rows at a time."""
+    if len(rows) == 0:
+        return np.zeros(width), np.zeros(width)
+    lo = np.full(width, np.inf)
+    hi = np.full(width, -np.inf)
+    for start in range(0, len(rows), CHUNK_ROWS):
+        block = data[rows[start:start + CHUNK_ROWS]]
+        lo = np.minimum(lo, block.min(axis=0))
+        hi = np.maximum(hi, block.max(axis=0))
+    return lo.astype(data.dtype), hi.astype(data.dtype)
+
+
+class KDTree:
+    """
+    Static KD-tree over a float matrix for k-nearest-neighbour lookups.
+
+    Nodes are stored as flat arrays and the points are reordered so every
+    leaf is a contiguous slice, which keeps leaf scans vectorized and makes
+    the whole tree trivially serializable with np.savez.
+    """
+
+    def __init__(self, data, leaf_size=32, points=None):
+        """
+        :param data: (n, d) matrix, may be memory-mapped
+        :param points: Optional writable (n, d) array (e.g. a memmap) that receives
+                       the reordered rows instead of a new in-memory copy
+        """
+        data = np.asarray(data).astype(_tree_dtype(data), copy=False)
+        if data.ndim != 2:
+            raise ValueError("KDTree expects a 2-D array")
+
+        n = data.shape[0]
+        order = np.arange(n)
+        starts, ends, lefts, rights, los, his = [], [], [], [], [], []
+
+        def new_node(start, end):
+            lo, hi = _bounds(data, order[start:end], data.shape[1])
+            starts.append(start)
+            ends.append(end)
+            lefts.append(-1)
+            rights.append(-1)
+            los.append(lo)
+            his.append(hi)
+            return len(starts) - 1
+
+        stack = [new_node(0, n)]
+        while stack:
+            node = stack.pop()
+            start, end = starts[node], ends[node]
+            if end - start <= leaf_size:
+                continue
+
+            # Split on the widest dimension at the median
+            dim = int(np.argmax(his[node] - los[node]))
+            mid = (start + end) // 2
+            sub = order[start:end]
+            part = np.argpartition(data[sub, dim], mid - start)
+            order[start:end] = sub[part]
+
+            lefts[node] = new_node(start, mid)
+            rights[node] = new_node(mid, end)
+            stack.append(lefts[node])
+            stack.append(rights[node])
+
+        self.order = order
+        self.points = np.empty(data.shape, dtype=data.dtype) if points is None else points
+        for start in range(0, n, CHUNK_ROWS):
+            self.points[start:start + CHUNK_ROWS] = data[order[start:start + CHUNK_ROWS]]
+        self.node_start = np.array(starts, dtype=np.int64)
+        self.node_end = np.array(ends, dtype=np.int64)
+        self.node_left = np.array(lefts, dtype=np.int64)
+        self.node_right = np.array(rights, dtype=np.int64)
+        self.node_lo = np.array(los).reshape(len(starts), data.shape[1])
+        self.node_hi = np.array(his).reshape(len(starts), data.shape[1])
+
+    def __len__(self):
+        return len(self.order)
+
+    def _box_dist(self, node, point):
+        """Squared distance from point to a node's bounding box."""
+        gap = np.maximum(self.node_lo[node] - point, 0) + np.maximum(point - self.node_hi[node], 0)
+        return float(gap @ gap)
+
+    def query(self, point, k=1):
+        """
+        Return (distances, row_indices) of the k nearest rows, closest first.
+        Row indices refer to the original data passed to the constructor.
+        """
+        point = np.asarray(point, dtype=self.points.dtype)
+        k = min(k, len(self))
+        if k <= 0:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        if len(self) <= BRUTE_FORCE_ROWS:
+            return self._scan(point, k)
+
+        best_d = np.empty(0, dtype=self.points.dtype)
+        best_i = np.empty(0, dtype=np.int64)
+        worst = np.inf
+        heap = [(self._box_dist(0, point), 0)]
+
+        while heap:
+            bound, node = heapq.heappop(heap)
+            # Small slack so rounding in the box bound cannot prune an exact tie
+            if bound > worst * (1 + 1e-9):
+                break
+
+            left = self.node_left[node]
+            if left >= 0:
+                right = self.node_right[node]
+                for child in (left, right):
+                    d = self._box_dist(child, point)
+                    if d <= worst * (1 + 1e-9):
+                        heapq.heappush(heap, (d, child))
+                continue
+
+            start, end = self.node_start[node], self.node_end[node]
+            diff = self.points[start:end] - point
+            leaf_d = np.einsum('ij,ij->i', diff, diff)
+            cand_d = np.concatenate([best_d, leaf_d])
+            cand_i = np.concatenate([best_i, np.arange(start, end)])
+            if len(cand_d) > k:
+                # Ties at the k-th place go to the lowest original row, like a stable full sort
+                keep = np.lexsort((self.order[cand_i], cand_d))[:k]
+                cand_d, cand_i = cand_d[keep], cand_i[keep]
+            best_d, best_i = cand_d, cand_i
+            if len(best_d) == k:
+                worst = best_d.max()
+
+        # Sort on (distance, original row) keeps tie order deterministic
+        rows = self.order[best_i]
+        ranked = np.lexsort((rows, best_d))
+        return np.sqrt(best_d[ranked]), rows[ranked]
+
+    def _scan(self, point, k):
+        """query() by one pass over every point, with the same tie order."""
+        diff = self.points - point
+        dist = np.einsum('ij,ij->i', diff, diff)
+        if k < len(dist):
+            # Everything tied with the k-th distance stays in, so ties are broken by row below
+            kth = np.partition(dist, k - 1)[k - 1]
+            cand = np.flatnonzero(dist <= kth)
+        else:
+            cand = np.arange(len(dist))
+        rows = self.order[cand]
+        ranked = np.lexsort((rows, dist[cand]))[:k]
+        return np.sqrt(dist[cand[ranked]]), rows[ranked]
+
+    def save(self, path, fingerprint=(), external=None):
+        """
+        Atomically write the tree to an .npz file.
+        :param external: Optional dict of array name -> .npy path; those arrays are
+                         written there instead of into the .npz, so load() can
+                         memory-map them. The .npz is written last and marks the set complete.
+        """
+        external = external or {}
+        for name, target in external.items():
+            array = getattr(self, name)
+            on_disk = isinstance(array, np.memmap) and array.filename is not None
+            if on_disk and os.path.abspath(array.filename) == os.path.abspath(target):
+                continue
+            if on_disk:
+                # Built in place in a temp .npy: publish the file as is
+                array.flush()
+                os.replace(array.filename, target)
+            else:
+                tmp_target = f"{target}.{os.getpid()}.tmp.npy"
+                np.save(tmp_target, array)
+                os.replace(tmp_target, target)
+
+        # Per-process temp names, so concurrent builders never write the same file
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        arrays = {name: getattr(self, name) for name in MMAP_FIELDS if name not in external}
+        np.savez(
+            tmp_path,
+            version=np.array([INDEX_VERSION]),
+            fingerprint=np.asarray(fingerprint, dtype=np.int64),
+            **arrays,
+            node_start=self.node_start,
+            node_end=self.node_end,
+            node_left=self.node_left,
+            node_right=self.node_right,
+            node_lo=self.node_lo,
+            node_hi=self.node_hi,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, fingerprint=(), external=None):
+        """
+        Load a tree saved with save(); return None if missing or stale.
+        Arrays listed in `external` are memory-mapped read-only from their .npy files.
+        """
+        external = external or {}
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as saved:
+                if int(saved['version'][0]) != INDEX_VERSION:
+                    return None
+                if saved['fingerprint'].tolist() != list(fingerprint):
+                    return None
+                tree = cls.__new__(cls)
+                for name in ('order', 'points', 'node_start', 'node_end',
+                             'node_left', 'node_right', 'node_lo', 'node_hi'):
+                    if name in external:
+                        setattr(tree, name, np.load(external[name], mmap_mode='r'))
+                    else:
+                        setattr(tree, name, saved[name])
+                return tree
+        except Exception as e:
+            logger.warning("Error loading spatial index %s: %s", path, e)
+            return None
+
+
+def file_fingerprint(path):
+    """(mtime_ns, size) of a file, used to detect when derived artifacts are stale."""
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def load_or_build(source_path, data, name="kdtree", leaf_size=32, key="", mmap=False):
+    """
+    Return a KDTree for `data`, reusing the copy persisted in the data cache
+    when it was built from the same version of `source_path`.
+    `key` identifies how `data` was derived (e.g. the scaler used).
+    With `mmap`, the reordered points and row order live in .npy files next to
+    the index and are memory-mapped, for data too large to copy into memory.
+    """
+    # Mapped and in-memory layouts get separate names so neither reads the other's file
+    index_path = data_cache.artifact_path(source_path, f"{name}.mmap.npz" if mmap else f"{name}.npz", key=key)
+    fingerprint = file_fingerprint(source_path) + (len(data), leaf_size)
+    external = {
+        field: data_cache.artifact_path(source_path, f"{name}.{field}.npy", key=key) for field in MMAP_FIELDS
+    } if mmap else None
+
+    tree = KDTree.load(index_path, fingerprint, external)
+    if tree is not None and tree.points.shape == np.shape(data) and tree.points.dtype == np.asarray(data).dtype:
+        return tree
+
+    points = None
+    if mmap:
+        try:
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+            points = np.lib.format.open_memmap(
+                f"{external['points']}.{os.getpid()}.tmp", mode='w+', dtype=_tree_dtype(data), shape=np.shape(data)
+            )
+        except OSError as e:
+            logger.warning("Could not map spatial index points %s: %s", external['points'], e)
+            external = None
+    tree = KDTree(data, leaf_size=leaf_size, points=points)
+    try:
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        tree.save(index_path, fingerprint, external)
+        if external:
+            # Serve from the published files so the build copies can be released
+            tree = KDTree.load(index_path, fingerprint, external) or tree
+    except OSError as e:
+        # Read-only deployments still work, they just rebuild on start
+        logger.warning("Could not persist spatial index %s: %s", index_path, e)
+    return tree
@@ -0,0 +1,149 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from modules import data_cache
+
+# Compact dtypes for the yield/fertilizer history CSVs. Columns not listed keep
+# pandas' defaults (money and production figures stay float64).
+HISTORY_DTYPES = {
+    'Province': 'category',
+    'District': 'category',
+    'Commodity': 'category',
+    'Year': 'Int16',
+    # Nullable integer types, so missing readings survive the read
+    'Soil_N_index': 'Int8',
+    'Soil_P_index': 'Int8',
+    'Soil_K_index': 'Int8',
+    'Area_Ha': 'float32',
+    'Target_Yield_KgHa': 'float32',
+    'Pupuk_Urea_kgHa': 'float32',
+    'Pupuk_SP36_kgHa': 'float32',
+    'Pupuk_KCl_kgHa': 'float32',
+}
+
+STREAM_CHUNK_ROWS = 250_000
+# Histories larger than this are streamed in chunks instead of loaded whole
+STREAM_THRESHOLD_BYTES = 256 * 1024 * 1024
+
+
+def should_stream(path):
+    """True when `path` is too large to load as one DataFrame."""
+    try:
+        return os.path.getsize(path) > STREAM_THRESHOLD_BYTES
+    except OSError:
+        return False
+
+
+def dtypes_for(path):
+    """HISTORY_DTYPES restricted to the columns present in the CSV header."""
+    header = pd.read_csv(path, nrows=0).columns
+    return {c: HISTORY_DTYPES[c] for c in header if c in HISTORY_DTYPES}
+
+
+def iter_chunks(path, usecols=None, chunksize=STREAM_CHUNK_ROWS):
+    """Compactly typed DataFrame chunks of a CSV, never more than `chunksize` rows in memory."""
+    dtypes = dtypes_for(path)
+    if usecols is not None:
+        dtypes = {c: t for c, t in dtypes.items() if c in usecols}
+    yield from pd.read_csv(path, dtype=dtypes, usecols=usecols, chunksize=chunksize)
+
+
+def iter_appended(path, offset, chunksize=STREAM_CHUNK_ROWS):
+    """
+    iter_chunks for only the rows starting at byte `offset` (see
+    data_cache.appended_offset); column names come from the header.
+    """
+    if offset >= os.path.getsize(path):
+        return
+    header = pd.read_csv(path, nrows=0).columns.tolist()
+    with open(path, "rb") as f:
+        f.seek(offset)
+        yield from pd.read_csv(f, header=None, names=header, dtype=dtypes_for(path), chunksize=chunksize)
+
+
+class MatrixSink:
+    """
+    Rows appended chunk by chunk to a raw row-major file in data/.cache, so a
+    matrix is built without ever holding the whole source in memory.
+    close() publishes the file and returns it memory-mapped read-only.
+    """
+
+    def __init__(self, source_path, name, n_cols, dtype=np.float64, key=""):
+        self.source_path = source_path
+        self.path = data_cache.artifact_path(source_path, f"{name}.bin", key=key)
+        self.n_cols = n_cols
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        self._file = open(self._tmp_path, "wb")
+
+    def append(self, rows):
+        rows = np.ascontiguousarray(rows, dtype=self.dtype).reshape(-1, self.n_cols)
+        self._file.write(rows.tobytes())
+        self.rows += len(rows)
+
+    def close(self):
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        shape = {"rows": self.rows, "cols": self.n_cols, "dtype": self.dtype.str}
+        data_cache.atomic_write(f"{self.path}.shape", lambda f: f.write(json.dumps(shape).encode("utf-8")))
+        data_cache.mark_fresh(self.source_path, self.path)
+        return open_matrix(self.source_path, self.path)
+
+
+def open_matrix(source_path, path):
+    """Read-only memmap of a MatrixSink artifact, or None when missing or stale."""
+    if not data_cache.is_fresh(source_path, path):
+        return None
+    try:
+        with open(f"{path}.shape", "r", encoding="utf-8") as f:
+            shape = json.load(f)
+        if shape["rows"] == 0:
+            return np.empty((0, shape["cols"]), dtype=shape["dtype"])
+        return np.memmap(path, dtype=shape["dtype"], mode="r", shape=(shape["rows"], shape["cols"]))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error reading cache {path}: {e}")
+        return None
+
+
+def stream_matrices(source_path, groups, dropna=(), chunksize=STREAM_CHUNK_ROWS, key=""):
+    """
+    One streaming pass over a CSV into on-disk matrices, reused while the CSV
+    is unchanged.
+    :param groups: Dict of name -> (columns, dtype)
+    :param dropna: Columns whose missing values drop the row from every matrix
+    :return: Dict of name -> read-only memory-mapped matrix
+    """
+    key = repr((key, sorted((n, list(c), np.dtype(t).str) for n, (c, t) in groups.items()), list(dropna)))
+    paths = {name: data_cache.artifact_path(source_path, f"{name}.bin", key=key) for name in groups}
+    cached = {name: open_matrix(source_path, path) for name, path in paths.items()}
+    if all(m is not None for m in cached.values()):
+        return cached
+
+    usecols = list(dict.fromkeys(c for columns, _ in groups.values() for c in columns))
+    sinks = {name: MatrixSink(source_path, name, len(columns), dtype, key=key) for name, (columns, dtype) in groups.items()}
+    for chunk in iter_chunks(source_path, usecols=usecols, chunksize=chunksize):
+        if dropna:
+            chunk = chunk.dropna(subset=list(dropna))
+        for name, (columns, dtype) in groups.items():
+            sinks[name].append(chunk[list(columns)].to_numpy(dtype=np.float64, na_value=np.nan).astype(dtype))
+    return {name: sink.close() for name, sink in sinks.items()}
+
+
+def transform_matrix(source_path, name, matrix, func, n_cols, dtype=np.float64, key="", chunksize=STREAM_CHUNK_ROWS):
+    """
+    `func` applied to `matrix` chunk by chunk into an on-disk matrix, reused while
+    the CSV and `key` are unchanged. Neither input nor output is held whole in memory.
+    :return: Read-only memory-mapped (rows, n_cols) matrix
+    """
+    path = data_cache.artifact_path(source_path, f"{name}.bin", key=key)
+    cached = open_matrix(source_path, path)
+    if cached is not None and len(cached) == len(matrix):
+        return cached
+
+    sink = MatrixSink(source_path, name, n_cols, dtype, key=key)
+    for start in range(0, len(matrix), chunksize):
+        sink.append(func(np.asarray(matrix[start:start + chunksize])))
+    return sink.close()
@@ -1,5 +1,25 @@
 import streamlit as st
 
+# Only one page of cards / table rows is built per rerun
+CARDS_PER_PAGE = 10
+TABLE_ROWS_PER_PAGE = 50
+
+def paginate(total, per_page, key):
+    """
+    Page selector for `total` items; returns the (start, stop) slice of the
+    page to render. Give `key` a part that changes with the query, so a new
+    search starts again at page 1.
+    """
+    pages = max(1, -(-total // per_page))
+    if pages == 1:
+        return 0, total
+    c1, c2 = st.columns([1, 3])
+    page = c1.number_input("Halaman", 1, pages, 1, key=key)
+    start = (page - 1) * per_page
+    stop = min(start + per_page, total)
+    c2.caption(f"Halaman {page} dari {pages} · entri {start + 1}-{stop} dari {total}")
+    return start, stop
+
 def render_fertilizer_card(item):
     """Render a card for fertilizer details."""
     with st.container():
@@ -0,0 +1,292 @@
+# Structured extraction of the Kementan 'cara pemakaian' (usage) text.
+# One entry packs several registrations into free text, e.g.
+#   "Padi sawah : gulma berdaun lebar Ludwigia octovalvis (Penyemprotan volume tinggi : 0,5 - 1 l/ha) Cabai : ..."
+# parse_usage() turns each into (crop, target, method, dose) records and UsageTable
+# adds hash indexes on crop and target. `python -m modules.usage_parser` rebuilds the cache.
+import os
+import re
+from collections import Counter
+import numpy as np
+import pandas as pd
+from modules import data_cache
+from modules.search_index import normalize
+
+# Bump when parsing changes so cached records are rebuilt
+PARSER_VERSION = 2
+RECORD_COLUMNS = ['product_id', 'product', 'crop', 'target', 'target_group',
+                  'method', 'dose_min', 'dose_max', 'unit']
+CATEGORY_COLUMNS = ['product', 'crop', 'target', 'target_group', 'method', 'unit']
+
+_SPACE = re.compile(r"\s+")
+_PAREN = re.compile(r"\(([^()]*)\)(\s*:)?")
+# Indonesian application methods are pe-...-an nouns (Penyemprotan, Penaburan,
+# Pengumpanan, Perlakuan ...); a few registrations use loanwords instead
+_METHOD_WORD = re.compile(r"^\s*(pe[a-z]{4,}|fumiga[a-z]*|injeksi|infus|proses|kelambu|thermal|aplikasi)\b", re.I)
+_NUMBER = r"\d+(?:[.,]\d+)?"
+# Anything shaped like "<number> <word>"; only used to tell method groups from other parentheses
+_QUANTITY = re.compile(rf"({_NUMBER})\s*(?:[-–]\s*({_NUMBER}))?\s*(%|[A-Za-z]+(?:\s*/\s*[A-Za-z0-9 ]*?[A-Za-z0-9]+)?)")
+# Spellings of the amount and per-quantity units -> normalized unit. Words that are
+# not listed (minggu, HST, hari, dan, x ...) are never read as a dose unit.
+AMOUNT_UNITS = {
+    "%": "%", "ppm": "ppm",
+    "ml": "ml", "cc": "ml", "l": "l", "lt": "l", "ltr": "l", "liter": "l",
+    "mg": "mg", "g": "g", "gr": "g", "gram": "g", "kg": "kg",
+    "tablet": "tablet", "perangkap": "perangkap", "kemasan": "kemasan", "kantong": "kantong", "batang": "batang",
+}
+PER_UNITS = {
+    "ha": "ha", "hektar": "ha", "l": "l", "lt": "l", "ltr": "l", "liter": "l", "ml": "ml",
+    "kg": "kg", "ton": "ton", "m2": "m2", "m3": "m3", "cm2": "cm2",
+    "pohon": "pohon", "tanaman": "tanaman", "bibit": "bibit",
+}
+
+
+def _alternatives(words):
+    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+
+# "<min> [- <max>] <unit>[/[<volume>] <per unit>]", e.g. "0,5 - 1 l/ha" or "5 ml/10 l air".
+# A '/' that is not followed by a known per unit ('l/hal') rejects the match.
+_DOSE = re.compile(
+    rf"({_NUMBER})\s*(?:[-–]\s*({_NUMBER}))?\s*({_alternatives(AMOUNT_UNITS)})(?![a-z])"
+    rf"(?:\s*/\s*(?:({_NUMBER})\s*)?({_alternatives(PER_UNITS)})(?![a-z0-9])|(?!\s*/))",
+    re.I
+)
+_BINOMIAL = re.compile(r"\b([A-Z][a-z]{2,})\s+(spp?\b\.?|[a-z]{3,})")
+_CROP_PREFIX = re.compile(r"^(budidaya|tanaman)\s+", re.I)
+
+
+def _to_float(text):
+    # Decimal comma; a dot followed by exactly three digits is a thousands separator
+    text = re.sub(r"\.(?=\d{3}(?!\d))", "", text)
+    return float(text.replace(",", "."))
+
+
+def parse_dose(text):
+    """
+    (dose_min, dose_max, unit) from a method group like 'Penyemprotan : 0,5 - 1 l/ha'.
+    Units are normalized: 'ml/Ha' -> 'ml/ha', 'ml/10 liter air' -> 'ml/10 l',
+    '10 ml/1 l' -> 'ml/l'. Without a recognised dose all three are empty.
+    """
+    match = _DOSE.search(text)
+    if not match:
+        return np.nan, np.nan, None
+    low = _to_float(match.group(1))
+    high = _to_float(match.group(2)) if match.group(2) else low
+    unit = AMOUNT_UNITS[match.group(3).lower()]
+    if match.group(5):
+        volume = _to_float(match.group(4)) if match.group(4) else 1.0
+        per = PER_UNITS[match.group(5).lower()]
+        unit = f"{unit}/{per}" if volume == 1 else f"{unit}/{volume:g} {per}"
+    return low, high, unit
+
+
+def _method_name(text):
+    name = re.split(r"[:\d]", text, maxsplit=1)[0].strip(" ,;")
+    return name[:1].upper() + name[1:].lower() if name else None
+
+
+def _split_segments(text):
+    """
+    Yield (crop_and_target_text, method_group_text or None) per registration.
+    Parentheses directly followed by ':' belong to the crop, e.g. '(TBM) :'.
+    """
+    start = 0
+    for match in _PAREN.finditer(text):
+        inner = match.group(1)
+        if match.group(2) or not (_METHOD_WORD.match(inner) or _QUANTITY.search(inner)):
+            continue
+        yield text[start:match.start()], inner
+        start = match.end()
+    if text[start:].strip(" -,;."):
+        yield text[start:], None
+
+
+def _split_crop(segment, known_crops):
+    """(crop, target_text) of one segment; falls back to the longest known crop prefix."""
+    depth = 0
+    for i, ch in enumerate(segment):
+        depth += ch == "("
+        depth -= ch == ")"
+        if ch == ":" and depth == 0:
+            return segment[:i].strip(" ,;"), segment[i + 1:].strip(" ,;")
+
+    words = segment.split()
+    for n in range(min(len(words), 5), 0, -1):
+        if crop_key(" ".join(words[:n])) in known_crops:
+            return " ".join(words[:n]), " ".join(words[n:])
+    return None, segment.strip(" ,;")
+
+
+def crop_key(crop):
+    """Normalized crop name used for indexing: 'Budidaya kelapa sawit (TBM)' -> 'kelapa sawit'."""
+    crop = re.sub(r"\([^)]*\)", " ", crop or "")
+    return normalize(_CROP_PREFIX.sub("", crop.strip()))
+
+
+def _split_targets(text, common_words):
+    """
+    (target, target_group) pairs: one per scientific name, each tagged with the
+    common-name phrase in front of it ('ulat grayak Spodoptera litura'). A phrase
+    carries over to following names until a new one appears.
+    """
+    pairs = []
+    group = None
+    pos = 0
+    for match in _BINOMIAL.finditer(text):
+        if match.group(1).lower() in common_words:
+            continue
+        between = normalize(text[pos:match.start()])
+        if between:
+            group = between
+        epithet = match.group(2).rstrip(".")
+        pairs.append((f"{match.group(1)} {epithet}", group))
+        pos = match.end()
+    if not pairs:
+        cleaned = normalize(text)
+        return [(cleaned, cleaned)] if cleaned else []
+    return pairs
+
+
+def _common_words(texts):
+    """
+    Words written lowercase more often than capitalized are Indonesian common
+    words ('Ulat grayak'), not genus names; the odd lowercase 'spodoptera' typo
+    does not outvote the many 'Spodoptera'.
+    """
+    lower, capital = Counter(), Counter()
+    for text in texts:
+        for word in re.findall(r"(?<![A-Za-z])([A-Za-z][a-z]{2,})", text):
+            if word[0].isupper():
+                capital[word.lower()] += 1
+            else:
+                lower[word] += 1
+    return {word for word, count in lower.items() if count >= capital[word]}
+
+
+def parse_usage(products):
+    """
+    Extract usage records from a pesticide table.
+    :param products: DataFrame with 'Name' and 'Usage' columns (load_pesticide_csv('umum'))
+    :return: DataFrame with RECORD_COLUMNS, categorical text columns, float32 doses
+    """
+    if products.empty or 'Usage' not in products.columns:
+        return _empty_records()
+
+    texts = [_SPACE.sub(" ", u) if isinstance(u, str) else "" for u in products['Usage']]
+    common_words = _common_words(texts)
+
+    # First pass: crops named before a ':' let us recognise them in entries without one
+    segments = [list(_split_segments(text)) for text in texts]
+    known_crops = set()
+    for per_product in segments:
+        for segment, _ in per_product:
+            if ":" in segment:
+                known_crops.add(crop_key(segment.split(":", 1)[0]))
+    known_crops.discard("")
+
+    rows = []
+    names = products['Name'].tolist()
+    for product_id, per_product in enumerate(segments):
+        for segment, method_text in per_product:
+            crop, target_text = _split_crop(segment, known_crops)
+            if method_text is not None:
+                method = _method_name(method_text)
+                dose_min, dose_max, unit = parse_dose(method_text)
+            else:
+                method, dose_min, dose_max, unit = None, np.nan, np.nan, None
+            for target, group in _split_targets(target_text, common_words):
+                rows.append((product_id, names[product_id], crop, target, group,
+                             method, dose_min, dose_max, unit))
+
+    if not rows:
+        return _empty_records()
+    records = pd.DataFrame(rows, columns=RECORD_COLUMNS)
+    return _compact(records)
+
+
+def _empty_records():
+    return _compact(pd.DataFrame({c: [] for c in RECORD_COLUMNS}))
+
+
+def _compact(records):
+    records['product_id'] = records['product_id'].astype(np.int32)
+    for col in ('dose_min', 'dose_max'):
+        records[col] = records[col].astype(np.float32)
+    for col in CATEGORY_COLUMNS:
+        records[col] = records[col].astype('category')
+    return records
+
+
+def _phrase_prefixes(text):
+    """'padi sawah tanam pindah' -> padi, padi sawah, padi sawah tanam, ..."""
+    words = text.split()
+    return [" ".join(words[:n]) for n in range(1, len(words) + 1)]
+
+
+class UsageTable:
+    """Usage records with hash indexes: normalized crop / target key -> record ids."""
+
+    def __init__(self, records):
+        self.records = records
+        self.crop_index = self._build_index(records['crop'], lambda c: _phrase_prefixes(crop_key(c)))
+        self.target_index = self._build_index(records['target'], self._target_keys)
+        group_index = self._build_index(records['target_group'], lambda g: _phrase_prefixes(normalize(g)))
+        for key, ids in group_index.items():
+            existing = self.target_index.get(key)
+            self.target_index[key] = ids if existing is None else np.union1d(existing, ids).astype(np.int32)
+
+    @staticmethod
+    def _target_keys(target):
+        key = normalize(target)
+        words = key.split()
+        return [key, words[0]] if len(words) > 1 else [key]
+
+    @staticmethod
+    def _build_index(column, keys_for):
+        """Index over a categorical column: keys are computed once per category, not per row."""
+        codes = column.cat.codes.to_numpy()
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(column.cat.categories) + 1))
+        index = {}
+        for code, value in enumerate(column.cat.categories):
+            ids = order[bounds[code]:bounds[code + 1]]
+            for key in keys_for(value):
+                if key:
+                    index.setdefault(key, []).append(ids)
+        return {k: np.unique(np.concatenate(v)).astype(np.int32) for k, v in index.items()}
+
+    def lookup(self, crop=None, target=None):
+        """Records registered for `crop` and/or `target` (e.g. crop='cabai', target='spodoptera')."""
+        ids = None
+        for index, query in ((self.crop_index, crop), (self.target_index, target)):
+            if not query:
+                continue
+            hits = index.get(normalize(query), np.empty(0, dtype=np.int32))
+            ids = hits if ids is None else np.intersect1d(ids, hits, assume_unique=True)
+        if ids is None:
+            return self.records
+        return self.records.iloc[ids]
+
+    def products_for(self, crop=None, target=None):
+        """Sorted unique product names registered for the crop/target."""
+        return sorted(self.lookup(crop, target)['product'].astype(str).unique().tolist())
+
+
+def build_usage_table(source_path, products, rebuild=False):
+    """UsageTable for the products loaded from `source_path`, records cached in data/.cache."""
+    records = data_cache.cached_frame(
+        source_path, lambda: parse_usage(products), name="usage", key=f"parser-v{PARSER_VERSION}", rebuild=rebuild
+    )
+    if not isinstance(records['crop'].dtype, pd.CategoricalDtype):
+        records = _compact(records)
+    return UsageTable(records)
+
+
+if __name__ == "__main__":
+    from modules import data_loader
+    path = os.path.join(data_loader.DATA_DIR, data_loader.PESTICIDE_FILES["umum"])
+    table = build_usage_table(path, data_loader.load_pesticide_csv("umum"), rebuild=True)
+    records = table.records
+    print(f"{len(records)} usage records from {records['product_id'].nunique()} products")
+    print(f"{len(table.crop_index)} crop keys, {len(table.target_index)} target keys")
+    print(f"{records['dose_min'].notna().mean():.0%} of records have a parsed dose")
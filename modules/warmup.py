@@ -0,0 +1,94 @@
+import importlib
+import threading
+import time
+from modules import registry
+
+# Imported by app.py before anything heavy, so this approximates process start
+PROCESS_START = time.perf_counter()
+
+# Registry loaders preloaded in the background after the first page is shown,
+# as (module, function). Each page lists the loads its visitors most likely
+# need next; everything in DEFAULT_ORDER follows.
+DEFAULT_ORDER = [
+    ("modules.data_loader", "warm_catalogues"),
+    ("modules.registry", "get_smart_dashboard"),
+    ("modules.registry", "get_fertilizer_recommender"),
+    ("modules.registry", "get_crop_recommender"),
+    ("modules.registry", "get_dose_optimizer"),
+    ("modules.registry", "get_region_index"),
+    ("modules.result_cache", "warm"),
+    ("modules.data_loader", "warm_pesticide_tables"),
+]
+NEXT_BY_PAGE = {
+    "Beranda": [("modules.data_loader", "warm_catalogues")],
+    "Dashboard": [("modules.registry", "get_smart_dashboard"), ("modules.registry", "get_fertilizer_recommender")],
+    "Pupuk": [("modules.data_loader", "warm_catalogues")],
+    "Pestisida": [("modules.data_loader", "warm_catalogues"), ("modules.data_loader", "warm_pesticide_tables")],
+    "Rekomendasi": [("modules.registry", "get_region_index"), ("modules.registry", "get_fertilizer_recommender"),
+                    ("modules.registry", "get_crop_recommender")],
+}
+
+_first_paint = None
+_thread = None
+_guard = threading.Lock()
+# (step, seconds, thread name) of startup milestones and warm-up tasks
+_events = []
+
+
+def record(step, seconds):
+    _events.append((step, seconds, threading.current_thread().name))
+
+
+def mark_first_paint():
+    """Call once the first page has been rendered; later calls are ignored."""
+    global _first_paint
+    with _guard:
+        if _first_paint is None:
+            _first_paint = time.perf_counter()
+            record("first paint", _first_paint - PROCESS_START)
+
+
+def start(page):
+    """
+    Start the background warm-up once per process, loads for `page` first.
+    Safe to call on every rerun: the registry's per-entry locks make a
+    request that needs an entry the thread is loading wait for that load
+    instead of repeating it.
+    """
+    global _thread
+    with _guard:
+        if _thread is not None:
+            return
+        plan = []
+        for key, tasks in NEXT_BY_PAGE.items():
+            if key in page:
+                plan.extend(tasks)
+        plan.extend(DEFAULT_ORDER)
+        _thread = threading.Thread(target=_run, args=(list(dict.fromkeys(plan)),), name="warmup", daemon=True)
+        _thread.start()
+
+
+def _run(plan):
+    for module_name, func_name in plan:
+        started = time.perf_counter()
+        try:
+            getattr(importlib.import_module(module_name), func_name)()
+        except Exception as e:
+            # Warm-up is best effort; the page that needs it will load it again
+            print(f"Error warming up {module_name}.{func_name}: {e}")
+        record(f"warm-up {func_name}", time.perf_counter() - started)
+    record("warm-up finished", time.perf_counter() - PROCESS_START)
+
+
+def report():
+    """
+    Startup timeline: milestones and warm-up tasks (step, seconds, thread)
+    in the order they happened, plus the registry's per-entry load times.
+    """
+    return {
+        "uptime": time.perf_counter() - PROCESS_START,
+        "first_paint": None if _first_paint is None else _first_paint - PROCESS_START,
+        "warmup_running": _thread is not None and _thread.is_alive(),
+        "events": list(_events),
+        "loads": registry.load_times(),
+    }
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from modules import aggregates, data_cache, streaming
+
+MEASURES = ['Area_Ha', 'Production_KgHa']
+QUANTILES = [0.1, 0.5, 0.9]
+
+
+def history(rng, n, provinces=('Jawa Barat', 'Jawa Timur')):
+    return pd.DataFrame({
+        'Province': rng.choice(provinces, n),
+        'District': rng.choice(['Kab. A', 'Kab. B', 'Kab. C'], n),
+        'Commodity': rng.choice(['Padi', 'Jagung'], n),
+        'Year': rng.integers(2018, 2024, n),
+        'Area_Ha': rng.uniform(0.5, 10, n).round(2),
+        'Production_KgHa': rng.uniform(2000, 8000, n).round(1),
+    })
+
+
+class CubeFoldTest(unittest.TestCase):
+    """A cached cube brought up to date from an edited history must equal one built from scratch."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache_dir = data_cache.CACHE_DIR
+        data_cache.CACHE_DIR = os.path.join(self.tmp, ".cache")
+        self.path = os.path.join(self.tmp, "history.csv")
+        self.rng = np.random.default_rng(7)
+        history(self.rng, 400).to_csv(self.path, index=False)
+        self.builds = 0
+
+    def tearDown(self):
+        data_cache.CACHE_DIR = self.cache_dir
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def read(self):
+        self.builds += 1
+        return pd.read_csv(self.path, dtype=streaming.dtypes_for(self.path))
+
+    def chunks(self):
+        self.builds += 1
+        yield from streaming.iter_chunks(self.path, chunksize=97)
+
+    def load(self, streamed):
+        appended = lambda offset: streaming.iter_appended(self.path, offset, chunksize=97)
+        if streamed:
+            return aggregates.load_or_build_streaming(self.path, self.chunks, MEASURES, appended_chunks=appended)
+        return aggregates.load_or_build(self.path, self.read, MEASURES, appended_chunks=appended)
+
+    def append(self, rows):
+        with open(self.path, "a", encoding="utf-8", newline="") as f:
+            rows.to_csv(f, index=False, header=False)
+
+    def assert_same_cube(self, cube):
+        scratch = aggregates.AggregateCube.build(pd.read_csv(self.path, dtype=streaming.dtypes_for(self.path)), MEASURES)
+        self.assertEqual(set(cube._locations), set(scratch._locations))
+        for key, expected in scratch._locations.items():
+            actual = cube.location_stats(*key)
+            for m in MEASURES:
+                np.testing.assert_allclose(actual[m][:2], expected[m][:2], rtol=1e-9, err_msg=str(key))
+                self.assertEqual(actual[m][2], expected[m][2], key)
+            np.testing.assert_array_equal(cube.location_quantile(QUANTILES, *key), scratch.location_quantile(QUANTILES, *key))
+        for commodity in ('Padi', 'Jagung'):
+            pd.testing.assert_frame_equal(
+                cube.ranking(commodity), scratch.ranking(commodity), check_dtype=False, check_categorical=False)
+        np.testing.assert_array_equal(cube.quantile(QUANTILES), scratch.quantile(QUANTILES))
+
+    def test_append_is_folded(self):
+        for streamed in (False, True):
+            with self.subTest(streamed=streamed):
+                self.assert_same_cube(self.load(streamed))
+                builds = self.builds
+                # Existing locations plus one the cube has not seen yet
+                self.append(history(self.rng, 150, provinces=('Jawa Barat', 'Bali')))
+                cube = self.load(streamed)
+                self.assertEqual(self.builds, builds, "appended rows should be folded, not rebuilt")
+                self.assert_same_cube(cube)
+                # The folded cube is cached for the next load
+                self.assert_same_cube(self.load(streamed))
+                self.assertEqual(self.builds, builds)
+
+    def test_rewrite_is_rebuilt(self):
+        for streamed in (False, True):
+            with self.subTest(streamed=streamed):
+                self.load(streamed)
+                builds = self.builds
+                # An earlier row edited while the file grows still changes the prefix
+                df = pd.read_csv(self.path)
+                df.loc[10, 'Production_KgHa'] += 1000
+                pd.concat([df, history(self.rng, 20)]).to_csv(self.path, index=False)
+                cube = self.load(streamed)
+                self.assertEqual(self.builds, builds + 1)
+                self.assert_same_cube(cube)
+
+    def test_same_size_rewrite_is_rebuilt(self):
+        self.load(False)
+        builds = self.builds
+        with open(self.path, "rb") as f:
+            data = bytearray(f.read())
+        last = data.rindex(b"\n", 0, len(data) - 1)
+        data[last - 1:last] = b"9" if data[last - 1:last] != b"9" else b"8"
+        with open(self.path, "wb") as f:
+            f.write(data)
+        st = os.stat(self.path)
+        os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+        cube = self.load(False)
+        self.assertEqual(self.builds, builds + 1)
+        self.assert_same_cube(cube)
+
+    def test_state_not_saved_after_concurrent_write(self):
+        state = data_cache.content_state(self.path)
+        state_path = os.path.join(data_cache.CACHE_DIR, "history.cube.state.json")
+        self.append(history(self.rng, 5))
+        self.assertFalse(aggregates._save_state(self.path, state_path, state))
+        self.assertFalse(os.path.exists(state_path))
+        self.assertTrue(aggregates._save_state(self.path, state_path, data_cache.content_state(self.path)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+import asyncio
+import contextlib
+import http.client
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from modules import (api_server, data_cache, data_loader, hot_reload, recommender, region_index, registry,
+                     smart_dashboard)
+
+
+def use_data_dir(stack, data_dir):
+    """Point every module at a copy of the data in `data_dir`, artifacts in its .cache (cf. benchmarks/run.py)."""
+    paths = {
+        data_cache: {"DATA_DIR": data_dir, "CACHE_DIR": os.path.join(data_dir, ".cache")},
+        data_loader: {"DATA_DIR": data_dir},
+        hot_reload: {"DATA_DIR": data_dir},
+        recommender: {
+            "DATA_DIR": data_dir,
+            "CROP_DATA_PATH": os.path.join(data_dir, "crop_recommendation.csv"),
+            "FERT_DATA_PATH": os.path.join(data_dir, "fertilizer_recommendation.csv"),
+            "REAL_FERT_DATA_PATH": os.path.join(data_dir, "dataset_untuk_rekomendasi_pupuk.csv"),
+        },
+        region_index: {"LOOKUP_PATH": os.path.join(data_dir, "lookup_tabel.csv")},
+        smart_dashboard: {
+            "DATA_DIR": data_dir,
+            "PRED_DATA_PATH": os.path.join(data_dir, "dataset_untuk_prediksi.csv"),
+            "REC_DATA_PATH": os.path.join(data_dir, "dataset_untuk_rekomendasi_pupuk.csv"),
+        },
+    }
+    for module, values in paths.items():
+        stack.enter_context(mock.patch.multiple(module, **values))
+
+
+class ApiServerTest(unittest.TestCase):
+    """Every endpoint of a real server on an ephemeral local port (in-process scoring)."""
+
+    @classmethod
+    def setUpClass(cls):
+        # Scoring reads a temp copy of data/ and writes its caches there, never into the repo
+        cls.tmp = tempfile.mkdtemp()
+        data_dir = os.path.join(cls.tmp, "data")
+        shutil.copytree(data_loader.DATA_DIR, data_dir, ignore=shutil.ignore_patterns(".*"))
+        cls.stack = contextlib.ExitStack()
+        use_data_dir(cls.stack, data_dir)
+        cls.stack.callback(shutil.rmtree, cls.tmp, ignore_errors=True)
+        # Entries loaded from the real files by earlier tests must not be served
+        registry.invalidate()
+        cls.stack.callback(registry.invalidate)
+
+        cls.loop = asyncio.new_event_loop()
+        cls.executor = api_server.make_executor(0)
+        api = api_server.ApiServer(cls.executor)
+        cls.server = cls.loop.run_until_complete(
+            asyncio.start_server(api.handle_connection, "127.0.0.1", 0, limit=api_server.MAX_HEADER_BYTES))
+        cls.port = cls.server.sockets[0].getsockname()[1]
+        cls.thread = threading.Thread(target=cls.loop.run_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.call_soon_threadsafe(cls.server.close)
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join(timeout=10)
+        cls.executor.shutdown(wait=True)
+        cls.stack.close()
+
+    def request(self, method, path, body=None, raw=None):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+        try:
+            data = raw if raw is not None else (None if body is None else json.dumps(body))
+            conn.request(method, path, body=data, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            payload = response.read().decode("utf-8")
+            if response.getheader("Content-Type", "").startswith("application/json"):
+                payload = json.loads(payload)
+            return response.status, payload
+        finally:
+            conn.close()
+
+    def assert_bad_request(self, method, path, body=None, raw=None):
+        status, payload = self.request(method, path, body, raw)
+        self.assertEqual(status, 400, payload)
+        self.assertIn("error", payload)
+
+    def test_health_and_metrics(self):
+        status, payload = self.request("GET", "/health")
+        self.assertEqual(status, 200)
+        self.assertEqual(payload["status"], "ok")
+        status, payload = self.request("GET", "/metrics.json")
+        self.assertEqual(status, 200)
+        self.assertIsInstance(payload, dict)
+        status, payload = self.request("GET", "/metrics")
+        self.assertEqual(status, 200)
+        self.assertIsInstance(payload, str)
+
+    def test_crop(self):
+        query = {"n": 90, "p": 42, "k": 43, "temperature": 20.8, "humidity": 82, "ph": 6.5, "rainfall": 202}
+        status, single = self.request("POST", "/v1/crop", query)
+        self.assertEqual(status, 200)
+        self.assertTrue(single["recommendations"])
+        status, batch = self.request("POST", "/v1/crop", {"samples": [query, query]})
+        self.assertEqual(status, 200)
+        self.assertEqual(batch["recommendations"], [single["recommendations"]] * 2)
+
+    def test_crop_rejects_bad_input(self):
+        self.assert_bad_request("POST", "/v1/crop", {"samples": [1]})
+        self.assert_bad_request("POST", "/v1/crop", {"samples": {"n": 1}})
+        self.assert_bad_request("POST", "/v1/crop", {"samples": [{"n": 1}]})
+        self.assert_bad_request("POST", "/v1/crop", {"n": True})
+        self.assert_bad_request("POST", "/v1/crop", raw="[1, 2]")
+        self.assert_bad_request("POST", "/v1/crop", raw="{not json")
+
+    def test_fertilizer_needs(self):
+        status, payload = self.request("POST", "/v1/fertilizer/needs", {"crop": "jagung", "n": 10, "p": 10, "k": 10, "ph": 5.0})
+        self.assertEqual(status, 200)
+        self.assertIn("deficit", payload)
+        status, payload = self.request(
+            "POST", "/v1/fertilizer/needs", {"crop": "jagung", "n": [10, 200], "p": [10, 200], "k": [10, 200], "ph": [5.0, 6.5]})
+        self.assertEqual(status, 200)
+        self.assertEqual(len(payload["advice"]), 2)
+        status, _ = self.request("POST", "/v1/fertilizer/needs", {"crop": "bukan-tanaman", "n": 1, "p": 1, "k": 1, "ph": 6})
+        self.assertEqual(status, 404)
+        self.assert_bad_request("POST", "/v1/fertilizer/needs", {"crop": "jagung", "n": [1, 2], "p": 1, "k": 1, "ph": 6})
+        self.assert_bad_request("POST", "/v1/fertilizer/needs", {"crop": "jagung", "n": [True], "p": [1], "k": [1], "ph": [6]})
+
+    def test_fertilizer_doses(self):
+        status, payload = self.request("POST", "/v1/fertilizer/doses", {"n": 2, "p": 2, "k": 2, "ph": 6.1})
+        self.assertEqual(status, 200)
+        self.assertEqual(set(payload), {"Urea", "SP-36", "KCl", "match_count"})
+        self.assert_bad_request("POST", "/v1/fertilizer/doses", {"n": "2", "p": 2, "k": 2, "ph": 6.1})
+
+    def test_roi(self):
+        status, payload = self.request(
+            "POST", "/v1/roi", {"province": "Tidak Ada", "district": "Tidak Ada", "commodity": "Padi", "area": 1})
+        self.assertEqual(status, 404, payload)
+        self.assert_bad_request("POST", "/v1/roi", {"province": "A", "district": "B", "commodity": "Padi", "area": False})
+
+    def test_roi_simulate(self):
+        body = {"regions": [["Tidak Ada", "Tidak Ada"]], "commodity": "Padi", "areas": [1, 2.5], "draws": 100}
+        status, payload = self.request("POST", "/v1/roi/simulate", body)
+        self.assertEqual(status, 200, payload)
+        self.assertIsInstance(payload["scenarios"], list)
+        for bad in ({"draws": [1]}, {"draws": {"n": 1}}, {"draws": "100"}, {"draws": True}, {"draws": 0},
+                    {"areas": [True]}, {"areas": 1}, {"regions": [["A"]]}, {"regions": [[1, 2]]}):
+            self.assert_bad_request("POST", "/v1/roi/simulate", dict(body, **bad))
+
+    def test_pesticides(self):
+        status, payload = self.request("GET", "/v1/pesticides?type=umum&limit=5")
+        self.assertEqual(status, 200)
+        self.assertLessEqual(len(payload["items"]), 5)
+        self.assertGreaterEqual(payload["total"], len(payload["items"]))
+        self.assert_bad_request("GET", "/v1/pesticides?type=tidak-ada")
+        self.assert_bad_request("GET", "/v1/pesticides?limit=lima")
+
+    def test_unknown_routes(self):
+        status, _ = self.request("GET", "/v1/tidak-ada")
+        self.assertEqual(status, 404)
+        status, _ = self.request("GET", "/v1/crop")
+        self.assertEqual(status, 405)
+
+
+if __name__ == "__main__":
+    unittest.main()
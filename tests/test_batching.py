@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+import unittest
+from modules.batching import AsyncMicroBatcher, MicroBatcher
+
+
+class Recorder:
+    """run_batch stand-in: doubles each query and records who ran which batch."""
+
+    def __init__(self, error=None, short=False):
+        self.batches = []
+        self.error = error
+        self.short = short
+
+    def __call__(self, queries):
+        self.batches.append((threading.current_thread().name, list(queries)))
+        if self.error is not None:
+            raise self.error
+        results = [q * 2 for q in queries]
+        return results[:-1] if self.short else results
+
+
+def wait_pending(batcher, n, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while len(batcher._pending) < n:
+        if time.monotonic() > deadline:
+            raise AssertionError(f"{n} queries never queued")
+        time.sleep(0.001)
+
+
+class MicroBatcherTest(unittest.TestCase):
+
+    def submit_all(self, batcher, queries, **names):
+        """Submit each query on its own thread, in order, once the previous one is queued."""
+        results, errors, threads = {}, {}, []
+
+        def call(q):
+            try:
+                results[q] = batcher.submit(q)
+            except Exception as e:
+                errors[q] = e
+
+        for i, q in enumerate(queries):
+            thread = threading.Thread(target=call, args=(q,), name=names.get(str(i), f"caller-{i}"))
+            threads.append(thread)
+            thread.start()
+            if i < len(queries) - 1:
+                wait_pending(batcher, i + 1)
+        for thread in threads:
+            thread.join(timeout=10)
+        return results, errors
+
+    def test_filler_runs_full_batch_without_waiting(self):
+        run = Recorder()
+        batcher = MicroBatcher(run, max_batch=4, max_wait_ms=10_000)
+        started = time.monotonic()
+        results, errors = self.submit_all(batcher, [1, 2, 3, 4], **{"3": "filler"})
+        self.assertLess(time.monotonic() - started, 5.0, "the leader should not wait out max_wait")
+        self.assertEqual(errors, {})
+        self.assertEqual(results, {1: 2, 2: 4, 3: 6, 4: 8})
+        self.assertEqual(run.batches, [("filler", [1, 2, 3, 4])])
+        self.assertEqual((batcher.batches, batcher.queries), (1, 4))
+
+    def test_leader_runs_batch_after_max_wait(self):
+        run = Recorder()
+        batcher = MicroBatcher(run, max_batch=100, max_wait_ms=200)
+        results, errors = self.submit_all(batcher, [5, 6], **{"0": "leader"})
+        self.assertEqual(results, {5: 10, 6: 12})
+        self.assertEqual(run.batches, [("leader", [5, 6])])
+        # The next query starts a new batch with its own leader
+        self.assertEqual(batcher.submit(7), 14)
+        self.assertEqual(len(run.batches), 2)
+
+    def test_exception_reaches_every_caller(self):
+        error = ValueError("model failed")
+        batcher = MicroBatcher(Recorder(error=error), max_batch=3, max_wait_ms=10_000)
+        results, errors = self.submit_all(batcher, [1, 2, 3])
+        self.assertEqual(results, {})
+        self.assertEqual(set(errors), {1, 2, 3})
+        self.assertTrue(all(e is error for e in errors.values()))
+
+    def test_short_result_list_fails_the_batch(self):
+        batcher = MicroBatcher(Recorder(short=True), max_batch=2, max_wait_ms=10_000)
+        results, errors = self.submit_all(batcher, [1, 2])
+        self.assertEqual(results, {})
+        self.assertTrue(all(isinstance(e, RuntimeError) for e in errors.values()))
+        self.assertEqual(len(errors), 2)
+
+
+class AsyncMicroBatcherTest(unittest.TestCase):
+
+    def run_async(self, batcher, queries):
+        async def main():
+            return await asyncio.gather(*(batcher.submit(q) for q in queries), return_exceptions=True)
+        return asyncio.run(main())
+
+    @staticmethod
+    def async_run(recorder):
+        async def run_batch(queries):
+            return recorder(queries)
+        return run_batch
+
+    def test_full_batches_then_timer_flush(self):
+        run = Recorder()
+        batcher = AsyncMicroBatcher(self.async_run(run), max_batch=2, max_wait_ms=20)
+        self.assertEqual(self.run_async(batcher, [1, 2, 3, 4, 5]), [2, 4, 6, 8, 10])
+        self.assertEqual([queries for _, queries in run.batches], [[1, 2], [3, 4], [5]])
+        self.assertEqual((batcher.batches, batcher.queries), (3, 5))
+
+    def test_exception_reaches_every_waiter(self):
+        error = ValueError("model failed")
+        batcher = AsyncMicroBatcher(self.async_run(Recorder(error=error)), max_batch=8, max_wait_ms=5)
+        results = self.run_async(batcher, [1, 2, 3])
+        self.assertTrue(all(r is error for r in results))
+
+    def test_short_result_list_fails_the_batch(self):
+        batcher = AsyncMicroBatcher(self.async_run(Recorder(short=True)), max_batch=2, max_wait_ms=5)
+        results = self.run_async(batcher, [1, 2])
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import numpy as np
+from modules import registry
+from modules.dose_optimizer import DoseOptimizer
+
+CATALOGUE = [
+    {"id": "urea", "name": "Urea", "nutrient_content": {"N": "46%"}},
+    {"id": "sp36", "name": "SP-36", "nutrient_content": {"P2O5": "36%"}},
+    {"id": "kcl", "name": "KCl", "nutrient_content": {"K2O": "60%"}},
+    {"id": "npk", "name": "NPK 15-15-15", "nutrient_content": {"N": "15%", "P2O5": "15%", "K2O": "15%"}},
+]
+# Elemental content per kg of product, as the optimizer converts the oxide labels
+UREA_N = 0.46
+SP36_P = 0.36 * 0.4364
+KCL_K = 0.60 * 0.8301
+NPK = (0.15, 0.15 * 0.4364, 0.15 * 0.8301)
+
+
+class DoseOptimizerTest(unittest.TestCase):
+    """Least-cost mixes checked against optima worked out by hand."""
+
+    def assert_mix(self, mix, expected):
+        self.assertEqual(set(mix), set(expected))
+        for name, dose in expected.items():
+            self.assertAlmostEqual(mix[name], dose, places=6, msg=name)
+
+    def test_least_mass_single_nutrient(self):
+        # 46 kg N is exactly 100 kg urea; anything else carries less N per kg
+        self.assert_mix(DoseOptimizer(CATALOGUE).solve_one(46, 0, 0), {"Urea": 100})
+
+    def test_straight_fertilizers_when_compound_is_dear(self):
+        optimizer = DoseOptimizer(CATALOGUE, {"urea": 10, "sp36": 10, "kcl": 10, "npk": 100})
+        need = [46, 100 * SP36_P, 100 * KCL_K]
+        self.assert_mix(optimizer.solve_one(*need), {"Urea": 100, "SP-36": 100, "KCl": 100})
+        self.assertAlmostEqual(optimizer.solve([need])["cost"][0], 3000)
+
+    def test_compound_covers_balanced_need(self):
+        optimizer = DoseOptimizer(CATALOGUE, {"urea": 10, "sp36": 10, "kcl": 10, "npk": 1})
+        self.assert_mix(optimizer.solve_one(*(100 * c for c in NPK)), {"NPK 15-15-15": 100})
+
+    def test_oversupply_beats_topping_up(self):
+        # Double N: 100 kg NPK + 32.6 kg urea costs 426; 200 kg NPK costs 200 and over-supplies P and K
+        optimizer = DoseOptimizer(CATALOGUE, {"urea": 10, "sp36": 10, "kcl": 10, "npk": 1})
+        result = optimizer.solve([[200 * NPK[0], 100 * NPK[1], 100 * NPK[2]]])
+        self.assertAlmostEqual(result["cost"][0], 200)
+        self.assert_mix(optimizer.solve_one(200 * NPK[0], 100 * NPK[1], 100 * NPK[2]), {"NPK 15-15-15": 200})
+
+    def test_unpriced_products_are_left_out(self):
+        optimizer = DoseOptimizer(CATALOGUE, {"urea": 10, "sp36": 10, "kcl": 10})
+        self.assertNotIn("NPK 15-15-15", optimizer.names)
+        self.assert_mix(optimizer.solve_one(*(100 * c for c in NPK)),
+                        {"Urea": 100 * NPK[0] / UREA_N, "SP-36": 100 * NPK[1] / SP36_P, "KCl": 100 * NPK[2] / KCL_K})
+
+    def test_infeasible_and_empty_needs(self):
+        optimizer = DoseOptimizer(CATALOGUE[:2])
+        result = optimizer.solve([[10, 10, 5], [10, 10, 0], [0, 0, 0], [np.nan, 1, 1]])
+        np.testing.assert_array_equal(result["feasible"], [False, True, True, False])
+        self.assertTrue(np.isnan(result["doses"][0]).all())
+        self.assertTrue(np.isnan(result["cost"][[0, 3]]).all())
+        self.assertEqual(result["cost"][2], 0)
+        self.assertIsNone(optimizer.solve_one(10, 10, 5))
+        self.assertEqual(optimizer.solve_one(0, 0, 0), {})
+
+    def test_batch_matches_single_solves(self):
+        optimizer = DoseOptimizer(CATALOGUE, {"urea": 6, "sp36": 3, "kcl": 8, "npk": 4})
+        needs = np.random.default_rng(5).uniform(0, 200, (300, 3))
+        batch = optimizer.solve(needs)
+        for i in range(0, len(needs), 37):
+            single = DoseOptimizer(CATALOGUE, {"urea": 6, "sp36": 3, "kcl": 8, "npk": 4}).solve(needs[i])
+            self.assertAlmostEqual(batch["cost"][i], single["cost"][0])
+        # Every plan covers its need
+        supplied = batch["doses"] @ optimizer.content
+        self.assertTrue((supplied >= needs - 1e-6).all())
+
+    def test_plan_totals(self):
+        plan = DoseOptimizer(CATALOGUE).plan([[46, 0, 0], [92, 0, 0], [0, 0, 0]], areas=[1, 0.5, 2])
+        self.assertAlmostEqual(plan["totals"]["Urea"], 200)
+        self.assertEqual(plan["infeasible"], 0)
+
+    def test_priced_optimizers_are_cached(self):
+        prices = {"urea": 5000, "kcl": 9000}
+        first = registry.get_dose_optimizer(prices)
+        self.assertIs(registry.get_dose_optimizer(dict(prices)), first)
+        self.assertIsNot(registry.get_dose_optimizer({"urea": 5000}), first)
+        self.assertIs(registry.get_dose_optimizer(), registry.get_dose_optimizer(None))
+
+
+if __name__ == "__main__":
+    unittest.main()
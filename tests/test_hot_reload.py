@@ -0,0 +1,144 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from modules import hot_reload, registry
+
+
+def touch(path):
+    """Bump the mtime of `path`, as an edited source file would."""
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+class RegistryRebuildTest(unittest.TestCase):
+    """Changed entries are rebuilt off to the side and swapped in at once."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "source.csv")
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("a,b\n1,2\n")
+        self.loads = []
+        registry.serve_stale(True)
+
+    def tearDown(self):
+        registry.serve_stale(False)
+        for name in ("test:outer", "test:inner"):
+            registry.invalidate(name)
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def loader(self, name, wait=None):
+        def load():
+            if wait is not None:
+                wait.wait(timeout=10)
+            value = {"name": name, "version": len(self.loads)}
+            self.loads.append(name)
+            return value
+        return load
+
+    def test_stale_and_swap(self):
+        release = threading.Event()
+        release.set()
+        old = registry.get_or_load("test:outer", self.loader("outer", release), [self.path])
+        release.clear()
+        self.assertEqual(registry.stale(), [])
+
+        touch(self.path)
+        self.assertIn("test:outer", registry.stale())
+        # While serving stale, readers keep the old object instead of reloading inline
+        self.assertIs(registry.get_or_load("test:outer", self.loader("outer"), [self.path]), old)
+        self.assertEqual(self.loads, ["outer"])
+
+        rebuilt = []
+        worker = threading.Thread(target=lambda: rebuilt.extend(registry.rebuild(registry.stale())))
+        worker.start()
+        # The new object is being built (blocked in its loader): readers still get the old one
+        self.assertIs(registry.get_or_load("test:outer", self.loader("outer"), [self.path]), old)
+        release.set()
+        worker.join(timeout=10)
+
+        self.assertEqual(rebuilt, ["test:outer"])
+        new = registry.get_or_load("test:outer", self.loader("outer"), [self.path])
+        self.assertIsNot(new, old)
+        self.assertEqual(new["version"], 1)
+        self.assertEqual(old["version"], 0)
+        self.assertEqual(registry.stale(), [])
+
+    def test_nested_entries_swap_together(self):
+        inner_path = os.path.join(self.tmp, "inner.csv")
+        with open(inner_path, "w", encoding="utf-8") as f:
+            f.write("x\n1\n")
+        inner_loader = self.loader("inner")
+
+        def outer():
+            return {"inner": registry.get_or_load("test:inner", inner_loader, [inner_path])}
+
+        # Entries list every file they are built from, including those read through other entries
+        first = registry.get_or_load("test:outer", outer, [self.path, inner_path])
+        touch(inner_path)
+        self.assertEqual(set(registry.stale()), {"test:outer", "test:inner"})
+        # The outer loader gets the staged inner object, not the one being replaced
+        self.assertEqual(set(registry.rebuild(["test:outer"])), {"test:outer", "test:inner"})
+        second = registry.get_or_load("test:outer", outer, [self.path, inner_path])
+        self.assertIsNot(second["inner"], first["inner"])
+        self.assertIs(registry.get_or_load("test:inner", inner_loader, [inner_path]), second["inner"])
+
+    def test_failed_rebuild_keeps_old_object(self):
+        old = registry.get_or_load("test:outer", self.loader("outer"), [self.path])
+        touch(self.path)
+
+        def broken():
+            raise ValueError("half-written file")
+
+        registry._sources["test:outer"] = (broken, (self.path,))
+        with self.assertRaises(ValueError):
+            registry.rebuild(["test:outer"])
+        self.assertIs(registry.get_or_load("test:outer", broken, [self.path]), old)
+
+
+class HotReloadCheckTest(unittest.TestCase):
+    """check() acts on a change once it has settled, and swaps in the rebuilt entries."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "source.csv")
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("a\n1\n")
+        self.saved = (hot_reload.DATA_DIR, hot_reload._active, hot_reload._seen, hot_reload._failed, hot_reload._version)
+        hot_reload.DATA_DIR = self.tmp
+        self.versions = iter(range(100))
+        self.value = registry.get_or_load("test:outer", lambda: next(self.versions), [self.path])
+        registry.serve_stale(True)
+        hot_reload._activate(hot_reload.snapshot())
+
+    def tearDown(self):
+        (hot_reload.DATA_DIR, hot_reload._active, hot_reload._seen, hot_reload._failed, hot_reload._version) = self.saved
+        registry.serve_stale(False)
+        registry.invalidate("test:outer")
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_check_waits_for_settle_then_swaps(self):
+        self.assertEqual(hot_reload.check(), [])
+        touch(self.path)
+        # First poll after the change only records it
+        self.assertEqual(hot_reload.check(), [])
+        self.assertTrue(hot_reload.report()["pending"])
+        self.assertEqual(registry.get_or_load("test:outer", lambda: -1, [self.path]), self.value)
+
+        self.assertEqual(hot_reload.check(), ["test:outer"])
+        self.assertEqual(registry.get_or_load("test:outer", lambda: -1, [self.path]), self.value + 1)
+        self.assertEqual(hot_reload.report()["rebuilt"], ["test:outer"])
+        self.assertFalse(hot_reload.report()["pending"])
+
+    def test_new_file_in_data_dir_starts_a_version(self):
+        number = hot_reload.report()["number"]
+        with open(os.path.join(self.tmp, "new.csv"), "w", encoding="utf-8") as f:
+            f.write("b\n2\n")
+        self.assertEqual(hot_reload.check(settle=False), [])
+        self.assertEqual(hot_reload.report()["number"], number + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
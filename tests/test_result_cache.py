@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from modules import registry, result_cache
+
+
+class Model:
+    """Owner of memoized methods; records the inputs each miss was computed on."""
+
+    def __init__(self, path, offset=0):
+        self.path = path
+        self.offset = offset
+        self.calls = []
+
+    def score(self, x, y=1.0):
+        self.calls.append((x, y))
+        return x * y + self.offset
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "source.csv")
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("a\n1\n")
+        self.names = []
+
+    def tearDown(self):
+        for name in self.names:
+            result_cache._caches.pop(name, None)
+        result_cache.enable(True)
+        registry.serve_stale(False)
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def model_class(self, maxsize=result_cache.CACHE_SIZE, ttl=result_cache.CACHE_TTL):
+        """A Model subclass whose score() is memoized in a fresh cache."""
+        name = f"test:{self.id()}:{len(self.names)}"
+        self.names.append(name)
+        path = self.path
+
+        class Memoized(Model):
+            score = result_cache.memoize(name, lambda: [path], (1, 1), maxsize=maxsize, ttl=ttl)(Model.score)
+        return Memoized
+
+    def test_miss_computes_exact_inputs(self):
+        model = self.model_class()(self.path)
+        self.assertEqual(model.score(1.04, 2.0), 2.08)
+        # Same rounded key: the first caller's answer, no new computation
+        self.assertEqual(model.score(1.01, 2.0), 2.08)
+        self.assertEqual(model.calls, [(1.04, 2.0)])
+        model.score(1.2, 2.0)
+        self.assertEqual(model.calls, [(1.04, 2.0), (1.2, 2.0)])
+
+    def test_keyword_and_default_arguments_share_keys(self):
+        model = self.model_class()(self.path)
+        model.score(3.0)
+        model.score(3.0, 1.0)
+        model.score(x=3.0, y=1.0)
+        self.assertEqual(model.calls, [(3.0, 1.0)])
+
+    def test_lru_eviction(self):
+        model = self.model_class(maxsize=2)(self.path)
+        model.score(1.0)
+        model.score(2.0)
+        model.score(1.0)  # Most recent now, so 2.0 goes first
+        model.score(3.0)
+        self.assertEqual(model.score.cache.stats()["size"], 2)
+        model.score(1.0)
+        self.assertEqual(len(model.calls), 3)
+        model.score(2.0)
+        self.assertEqual(len(model.calls), 4)
+
+    def test_ttl_expiry(self):
+        model = self.model_class(ttl=10.0)(self.path)
+        with mock.patch.object(result_cache.time, "monotonic", return_value=100.0):
+            model.score(1.0)
+        with mock.patch.object(result_cache.time, "monotonic", return_value=109.0):
+            model.score(1.0)
+        self.assertEqual(len(model.calls), 1)
+        with mock.patch.object(result_cache.time, "monotonic", return_value=111.0):
+            model.score(1.0)
+        self.assertEqual(len(model.calls), 2)
+
+    def test_source_change_drops_entries(self):
+        model = self.model_class()(self.path)
+        model.score(1.0)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("2\n")
+        model.score(1.0)
+        self.assertEqual(len(model.calls), 2)
+
+    def test_hot_reload_fingerprint_is_reused(self):
+        model = self.model_class()(self.path)
+        registry.serve_stale(True)
+        model.score(1.0)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("2\n")
+        # No stat() per call while hot reload polls: the change shows after the next poll
+        with mock.patch.object(registry.os, "stat", side_effect=AssertionError("stat per call")):
+            model.score(1.0)
+        self.assertEqual(len(model.calls), 1)
+        registry.fingerprint([self.path])
+        model.score(1.0)
+        self.assertEqual(len(model.calls), 2)
+
+    def test_entries_are_per_owner(self):
+        cls = self.model_class()
+        first, second = cls(self.path), cls(self.path, offset=100)
+        self.assertEqual(first.score(1.0), 1.0)
+        self.assertEqual(second.score(1.0), 101.0)
+        # A later object reusing the id() of a dropped one starts empty
+        token = result_cache._token(first)
+        del first
+        third = cls(self.path, offset=200)
+        self.assertNotEqual(result_cache._token(third), token)
+        self.assertEqual(third.score(1.0), 201.0)
+
+    def test_disabled_always_computes(self):
+        model = self.model_class()(self.path)
+        result_cache.enable(False)
+        model.score(1.0)
+        model.score(1.0)
+        self.assertEqual(len(model.calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
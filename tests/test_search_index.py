@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from modules import data_cache, data_loader, registry
+from modules.search_index import InvertedIndex, normalize, tokenize
+
+DOCUMENTS = [
+    {"name": "Pupuk Urea", "description": "nitrogen tinggi"},
+    {"name": "Urea Tablet", "description": "pupuk urea lambat"},
+    {"name": "NPK Mutiara", "description": "pupuk majemuk nitrogen fosfat kalium"},
+    {"name": "Kalium Klorida", "description": "KCl"},
+    {"name": "Ureaform", "description": ""},
+    {"name": "2,4-D Amina", "description": "herbisida"},
+    {"name": "Dicamba", "description": "herbisida"},
+]
+WEIGHTS = {"name": 3.0, "description": 1.0}
+
+
+class InvertedIndexTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.index = InvertedIndex(DOCUMENTS, WEIGHTS)
+
+    def search(self, query, **kwargs):
+        return self.index.search(query, **kwargs).tolist()
+
+    def test_normalize(self):
+        self.assertEqual(normalize("Pestisída,"), "pestisida")
+        self.assertEqual(tokenize("2,4-D  Amina"), ["2", "4", "d", "amina"])
+        self.assertEqual(normalize(float("nan")), "")
+        self.assertEqual(normalize(None), "")
+
+    def test_tf_idf_ordering(self):
+        # Name (weight 3) plus description (1) beats name alone; exact beats prefix-only 'ureaform'
+        self.assertEqual(self.search("urea"), [1, 0, 4])
+        self.assertEqual(self.search("urea", prefix=False), [1, 0])
+        # Equal scores keep document order
+        self.assertEqual(self.search("pupuk"), [0, 1, 2])
+        self.assertEqual(self.search("herbisida"), [5, 6])
+
+    def test_every_token_must_match(self):
+        self.assertEqual(self.search("pupuk nitrogen"), [0, 2])
+        self.assertEqual(self.search("pupuk klorida"), [])
+
+    def test_prefix_matching(self):
+        self.assertEqual(self.search("kal"), [3, 2])
+        self.assertEqual(self.search("kal", prefix=False), [])
+        self.assertEqual(self.search("nitro"), [0, 2])
+        # Tokens shorter than MIN_PREFIX_LEN match whole tokens only ('d' is not 'dicamba')
+        self.assertEqual(self.search("2,4-D"), [5])
+        self.assertEqual(self.search("di"), [])
+
+    def test_empty_query_and_limit(self):
+        self.assertEqual(self.search(""), list(range(len(DOCUMENTS))))
+        self.assertEqual(self.search("", limit=2), [0, 1])
+        self.assertEqual(self.search("pupuk", limit=2), [0, 1])
+
+
+PESTICIDES = pd.DataFrame({
+    "No": [1, 2, 3, 4, 5, 6],
+    "Merek Dagang": ["zeta 10 EC", "Alfa 25 WP", "beta Super", "Gamma 5 GR", None, "Alfa Plus"],
+    "Bahan Aktif": ["abamektin", "mankozeb", "abamektin", "karbofuran", "glifosat", "abamektin"],
+    "Deskripsi": ["insektisida", "fungisida", "insektisida", "insektisida", "herbisida", "insektisida"],
+    "Pembuat": ["PT A", "PT B", "PT C", "PT A", "PT D", "PT B"],
+})
+
+
+class PesticidePageTest(unittest.TestCase):
+    """Paging, sorting and searching the Kementan table without copying it."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.saved = (data_loader.DATA_DIR, data_cache.CACHE_DIR)
+        data_loader.DATA_DIR = self.tmp
+        data_cache.CACHE_DIR = os.path.join(self.tmp, ".cache")
+        PESTICIDES.to_csv(os.path.join(self.tmp, data_loader.PESTICIDE_FILES["teknis"]), index=False)
+        self.forget()
+
+    def tearDown(self):
+        data_loader.DATA_DIR, data_cache.CACHE_DIR = self.saved
+        self.forget()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    @staticmethod
+    def forget():
+        filename = data_loader.PESTICIDE_FILES["teknis"]
+        for kind in ("csv", "search", "sort"):
+            registry.invalidate(f"{kind}:{filename}")
+
+    def page(self, **kwargs):
+        frame, total = data_loader.pesticide_page("teknis", **kwargs)
+        return frame['Name'].tolist(), total
+
+    def test_pages_in_file_order(self):
+        self.assertEqual(self.page(limit=4), (["zeta 10 EC", "Alfa 25 WP", "beta Super", "Gamma 5 GR"], 6))
+        names, total = self.page(offset=4, limit=4)
+        self.assertEqual(names[1:], ["Alfa Plus"])
+        self.assertEqual(total, 6)
+        self.assertEqual(self.page(offset=10), ([], 6))
+
+    def test_sort_is_case_insensitive_with_empty_last(self):
+        names, _ = self.page(sort_by="Name")
+        self.assertEqual(names[:5], ["Alfa 25 WP", "Alfa Plus", "beta Super", "Gamma 5 GR", "zeta 10 EC"])
+        self.assertTrue(pd.isna(names[5]))
+        names, _ = self.page(sort_by="Name", descending=True)
+        self.assertEqual(names[:5], ["zeta 10 EC", "Gamma 5 GR", "beta Super", "Alfa Plus", "Alfa 25 WP"])
+        self.assertTrue(pd.isna(names[5]))
+        # Equal values keep file order in both directions
+        self.assertEqual(self.page(sort_by="Manufacturer", limit=2)[0], ["zeta 10 EC", "Gamma 5 GR"])
+        self.assertEqual(self.page(sort_by="Manufacturer", descending=True, limit=3)[0][1:], ["beta Super", "Alfa 25 WP"])
+
+    def test_search_pages(self):
+        self.assertEqual(self.page(query="alfa"), (["Alfa 25 WP", "Alfa Plus"], 2))
+        self.assertEqual(self.page(query="abamektin", limit=2), (["zeta 10 EC", "beta Super"], 3))
+        self.assertEqual(self.page(query="abamektin", sort_by="Name"), (["Alfa Plus", "beta Super", "zeta 10 EC"], 3))
+        self.assertEqual(self.page(query="abamektin", sort_by="Name", descending=True, offset=1),
+                         (["beta Super", "Alfa Plus"], 3))
+        self.assertEqual(self.page(query="tidak ada"), ([], 0))
+
+    def test_rows_are_positions(self):
+        rows = data_loader.sorted_pesticide_rows("teknis", sort_by="Name")
+        self.assertEqual(rows.dtype, np.int32)
+        self.assertEqual(sorted(rows.tolist()), list(range(len(PESTICIDES))))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from modules import spatial_index
+from modules.spatial_index import KDTree
+
+
+def brute_force(data, point, k):
+    dist = np.sqrt(((data - point) ** 2).sum(axis=1))
+    order = np.lexsort((np.arange(len(data)), dist))[:k]
+    return dist[order], order
+
+
+class KDTreeTest(unittest.TestCase):
+    """Tree walk and full scan both return the exact k nearest rows, ties by lowest row."""
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        # Integer-valued columns give plenty of exact distance ties
+        self.data = rng.integers(0, 6, (3000, 4)).astype(np.float64)
+        self.queries = np.vstack([rng.uniform(0, 6, (40, 4)), self.data[:10]])
+
+    def check(self, tree):
+        for point in self.queries:
+            for k in (1, 5, 32):
+                dist, rows = tree.query(point, k)
+                expected_dist, expected_rows = brute_force(self.data, point, k)
+                np.testing.assert_allclose(dist, expected_dist)
+                np.testing.assert_array_equal(rows, expected_rows)
+
+    def test_scan(self):
+        self.check(KDTree(self.data, leaf_size=16))
+
+    def test_tree_walk(self):
+        with mock.patch.object(spatial_index, "BRUTE_FORCE_ROWS", 0):
+            self.check(KDTree(self.data, leaf_size=16))
+
+    def test_k_larger_than_rows(self):
+        dist, rows = KDTree(self.data[:3]).query(self.data[0], k=10)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0], 0)
+
+    def test_save_and_load(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, "tree.npz")
+            tree = KDTree(self.data)
+            tree.save(path, fingerprint=(1, 2))
+            self.assertIsNone(KDTree.load(path, fingerprint=(1, 3)))
+            loaded = KDTree.load(path, fingerprint=(1, 2))
+            np.testing.assert_array_equal(loaded.order, tree.order)
+            with mock.patch.object(spatial_index, "BRUTE_FORCE_ROWS", 0):
+                self.check(loaded)
+            # Temp files are renamed into place, none are left behind
+            self.assertEqual(os.listdir(tmp), ["tree.npz"])
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import math
+import unittest
+import pandas as pd
+from modules import usage_parser
+
+# Method group text -> (dose_min, dose_max, unit), None meaning no dose is read
+DOSE_CASES = [
+    ("Penyemprotan : 0,5 - 1 l/ha", (0.5, 1.0, "l/ha")),
+    ("Penyemprotan volume tinggi : 100 - 200 ml/Ha", (100, 200, "ml/ha")),
+    ("5 ml/10 l air 30 HST", (5, 5, "ml/10 l")),
+    ("7,5 ml/10 lt untuk", (7.5, 7.5, "ml/10 l")),
+    ("15 ml/10l", (15, 15, "ml/10 l")),
+    ("1 ml/ 50 L air", (1, 1, "ml/50 l")),
+    ("s/d 8 minggu : 10 - 20 ml/l", (10, 20, "ml/l")),
+    ("100 ml/liter/pohon", (100, 100, "ml/l")),
+    ("3 gr/l", (3, 3, "g/l")),
+    ("1.000 ml/ha", (1000, 1000, "ml/ha")),
+    ("0,025%", (0.025, 0.025, "%")),
+    ("12 - 24 perangkap/0,25 ha", (12, 24, "perangkap/0.25 ha")),
+    ("1 - 2 tablet/1 ton beras", (1, 2, "tablet/ton")),
+    ("150 ml/200m3", (150, 150, "ml/200 m3")),
+    ("800 ml/100 kg benih", (800, 800, "ml/100 kg")),
+    # Time and count words are not units
+    ("Penyemprotan 30 HST dan 40 HST", None),
+    ("20 x pencucian", None),
+    # An unknown per unit rejects the whole dose rather than cutting it short
+    ("1,5 - 2 l/hal", None),
+    ("1 gl/l", None),
+]
+
+USAGE = [
+    "Padi sawah : gulma berdaun lebar Ludwigia octovalvis (Penyemprotan volume tinggi : 0,5 - 1 l/ha) "
+    "Cabai : ulat grayak Spodoptera litura (Penyemprotan : 1 - 2 ml/l)",
+    "Cabai : antraknosa Colletotrichum capsici, layu Fusarium oxysporum (Penyemprotan : 2 g/l air) "
+    "Padi : wereng batang coklat Nilaparvata lugens (Penyemprotan 30 HST dan 40 HST)",
+]
+
+
+class ParseDoseTest(unittest.TestCase):
+
+    def test_cases(self):
+        for text, expected in DOSE_CASES:
+            with self.subTest(text=text):
+                low, high, unit = usage_parser.parse_dose(text)
+                if expected is None:
+                    self.assertTrue(math.isnan(low) and math.isnan(high), (low, high))
+                    self.assertIsNone(unit)
+                else:
+                    self.assertEqual((low, high, unit), expected)
+
+
+class ParseUsageTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        products = pd.DataFrame({"Name": ["Alpha 25 EC", "Beta 80 WP"], "Usage": USAGE})
+        cls.records = usage_parser.parse_usage(products)
+        cls.table = usage_parser.UsageTable(cls.records)
+
+    def test_records(self):
+        rows = self.records[['product', 'crop', 'target', 'target_group', 'method', 'unit']].astype(object)
+        expected = [
+            ("Alpha 25 EC", "Padi sawah", "Ludwigia octovalvis", "gulma berdaun lebar", "Penyemprotan volume tinggi", "l/ha"),
+            ("Alpha 25 EC", "Cabai", "Spodoptera litura", "ulat grayak", "Penyemprotan", "ml/l"),
+            ("Beta 80 WP", "Cabai", "Colletotrichum capsici", "antraknosa", "Penyemprotan", "g/l"),
+            ("Beta 80 WP", "Cabai", "Fusarium oxysporum", "layu", "Penyemprotan", "g/l"),
+        ]
+        self.assertEqual([tuple(r) for r in rows.head(4).itertuples(index=False)], expected)
+        # The time-only method group keeps its record but has no dose
+        last = self.records.iloc[4]
+        self.assertEqual((last['crop'], last['target']), ("Padi", "Nilaparvata lugens"))
+        self.assertTrue(math.isnan(last['dose_min']))
+        self.assertEqual(self.records['dose_min'].tolist()[:4], [0.5, 1.0, 2.0, 2.0])
+
+    def test_lookup(self):
+        self.assertEqual(self.table.products_for(crop="cabai"), ["Alpha 25 EC", "Beta 80 WP"])
+        # Crop keys match on phrase prefixes: 'padi' also finds 'Padi sawah'
+        self.assertEqual(self.table.products_for(crop="padi"), ["Alpha 25 EC", "Beta 80 WP"])
+        self.assertEqual(self.table.products_for(crop="padi sawah"), ["Alpha 25 EC"])
+        self.assertEqual(self.table.products_for(target="spodoptera"), ["Alpha 25 EC"])
+        self.assertEqual(self.table.products_for(target="gulma"), ["Alpha 25 EC"])
+        self.assertEqual(self.table.products_for(crop="padi", target="wereng"), ["Beta 80 WP"])
+        self.assertEqual(self.table.products_for(crop="jagung"), [])
+
+    def test_empty_input(self):
+        records = usage_parser.parse_usage(pd.DataFrame({"Name": [], "Usage": []}))
+        self.assertEqual(list(records.columns), usage_parser.RECORD_COLUMNS)
+        self.assertTrue(records.empty)
+
+
+if __name__ == "__main__":
+    unittest.main()